@@ -1,70 +1,84 @@
+const BACKEND_URL = 'http://localhost:8000';
+const STATUS_POLL_INTERVAL = 2000;  // Matches the backend's progress snapshots closely enough
+
 let crawls = [];
 
 chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
     if (message.action === 'startCrawl') {
         const { crawlName, crawlUrl, crawlDepth, maxLinks, followExternal, concurrency } = message;
 
-        const crawlId = Date.now();
         const crawl = {
-            id: crawlId,
+            id: null,  // crawl_id assigned by the backend
             name: crawlName,
             url: crawlUrl,  // Add the crawl URL here
             depth: crawlDepth,
             maxLinks,
             followExternal,
             concurrency,
-            status: 'Running',
+            status: 'Starting',
             completedPages: 0,
+            pagesPerSecond: 0,
+            eta: null,
             startTime: new Date().toISOString(),
         };
 
         // Add crawl to the list
         crawls.push(crawl);
 
-        // Simulate crawl process (just for demo)
-        startCrawlSimulation(crawlId);
+        startCrawl(crawl);
     }
 
     sendResponse({ success: true });
 });
 
 
-function startCrawlSimulation(crawlId) {
-    const crawl = crawls.find(c => c.id === crawlId);
-
-    if (!crawl) return;
-
-    // Simulate crawl process by updating the crawl status every second
-    const intervalId = setInterval(() => {
-        crawl.completedPages += 10;  // Simulating 10 pages crawled per second
-
-        // Stop simulation after reaching the max number of links
-        if (crawl.completedPages >= crawl.maxLinks) {
-            crawl.status = 'Completed';
-            clearInterval(intervalId);
-
-            // Mock sending crawl data to backend
-            sendCrawlDataToBackend(crawl);
-        }
-    }, 1000);
-}
-
-function sendCrawlDataToBackend(crawl) {
-    console.log('Sending crawl data to backend:', crawl);
-
-    // Simulate a backend call (FastAPI) with a POST request
-    fetch('https://mock-fastapi-backend.com/crawl', {
+function startCrawl(crawl) {
+    fetch(`${BACKEND_URL}/crawl-url/`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify(crawl),
+        body: JSON.stringify({
+            start_urls: [crawl.url],
+            max_links: crawl.maxLinks,
+            depth_limit: crawl.depth,
+            follow_external: crawl.followExternal,
+            concurrent_requests: crawl.concurrency,
+        }),
     })
     .then(response => response.json())
     .then(data => {
-        console.log('Backend response:', data);
+        crawl.id = data.crawl_id;
+        crawl.status = 'Running';
+        pollCrawlStatus(crawl);
     })
     .catch(error => {
-        console.error('Error sending data to backend:', error);
+        crawl.status = 'Failed';
+        console.error('Error starting crawl:', error);
     });
 }
+
+function pollCrawlStatus(crawl) {
+    // Progress comes from the backend's /crawl-status/ snapshots
+    const intervalId = setInterval(() => {
+        fetch(`${BACKEND_URL}/crawl-status/${crawl.id}`)
+        .then(response => response.json())
+        .then(data => {
+            crawl.completedPages = data.link_count;
+            if (data.stats) {
+                crawl.completedPages = data.stats.progress.done;
+                crawl.pagesPerSecond = data.stats.pages_per_second;
+                crawl.eta = data.stats.eta_seconds;
+            }
+
+            // A pausing crawl is still finishing its in-flight requests
+            if (data.status !== 'running' && data.status !== 'pausing') {
+                crawl.status = data.status === 'completed' ? 'Completed' : data.status;
+                clearInterval(intervalId);
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching crawl status:', error);
+        });
+    }, STATUS_POLL_INTERVAL);
+}
@@ -0,0 +1,139 @@
+import json
+from datetime import datetime
+from sqlalchemy import insert, select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import content_store, search_index
+from app.models import CrawlSession, CrawlJob, WebsiteData
+from app.schemas import CrawlSessionCreate, CrawlSessionUpdate
+from app.cruds import (ACTIVE_JOB_STATUSES, RESULT_FIELD_COLUMNS, content_crawl_targets_insert,
+                        pending_content_crawl_targets_insert, crawl_results_query,
+                        frontier_counts_statement, frontier_counts)
+
+# Async counterparts of the cruds used by the API. They only add/flush; the endpoint
+# commits, so everything a request changes goes into a single transaction.
+
+async def get_crawl_session(db: AsyncSession, crawl_id: str):
+    result = await db.execute(select(CrawlSession).where(CrawlSession.crawl_id == crawl_id))
+    return result.scalars().first()
+
+async def get_frontier_counts(db: AsyncSession, crawl_id: str):
+    return frontier_counts((await db.execute(frontier_counts_statement(crawl_id))).all())
+
+async def get_running_crawl_sessions(db: AsyncSession):
+    # Pausing crawls are still draining their in-flight requests
+    result = await db.execute(select(CrawlSession).where(CrawlSession.status.in_(('running', 'pausing'))))
+    return result.scalars().all()
+
+def create_crawl_session(db: AsyncSession, crawl_session: CrawlSessionCreate, status: str = 'running'):
+    db_crawl_session = CrawlSession(
+        crawl_id=crawl_session.crawl_id,
+        spider_name=crawl_session.spider_name,
+        crawl_type=crawl_session.crawl_type,
+        start_urls=json.dumps(crawl_session.start_urls),
+        max_links=crawl_session.max_links,
+        options=json.dumps(crawl_session.options) if crawl_session.options else None,
+        status=status,
+        link_count=0,
+    )
+    db.add(db_crawl_session)
+    return db_crawl_session
+
+async def update_crawl_session(db: AsyncSession, crawl_id: str, crawl_session_update: CrawlSessionUpdate):
+    update_data = crawl_session_update.dict(exclude_unset=True)
+    await db.execute(update(CrawlSession).where(CrawlSession.crawl_id == crawl_id).values(**update_data))
+
+async def add_content_crawl_targets(db: AsyncSession, crawl_id: str, website_data_ids: list):
+    dialect = db.get_bind().dialect.name
+    for i in range(0, len(website_data_ids), 500):
+        await db.execute(content_crawl_targets_insert(dialect, crawl_id, website_data_ids[i:i + 500]))
+
+# Ids of the WebsiteData rows of these URLs, creating (status=False) rows for URLs not stored yet
+async def get_or_create_website_data_ids(db: AsyncSession, urls: list, crawl_id: str = None):
+    urls = list(dict.fromkeys(urls))
+    ids = dict((await db.execute(
+        select(WebsiteData.website_url, WebsiteData.id).where(WebsiteData.website_url.in_(urls))
+    )).all())
+    new_urls = [url for url in urls if url not in ids]
+    if new_urls:
+        now = datetime.now()
+        result = await db.execute(
+            insert(WebsiteData).returning(WebsiteData.website_url, WebsiteData.id),
+            [{'website_url': url, 'status': False, 'crawl_id': crawl_id, 'created_at': now} for url in new_urls],
+        )
+        ids.update(result.all())
+    return ids
+
+# Snapshot the WebsiteData rows with status=False as the targets of a content crawl; returns how many
+async def add_pending_content_crawl_targets(db: AsyncSession, crawl_id: str):
+    result = await db.execute(pending_content_crawl_targets_insert(db.get_bind().dialect.name, crawl_id))
+    return result.rowcount
+
+# Stream one keyset page of a crawl's rows (ids after `after_id`) with only the columns of `fields`.
+# A URL crawl's pages are the rows it inserted, a content crawl's the rows it targets.
+async def stream_crawl_results(db: AsyncSession, crawl_id: str, content_crawl: bool, fields: list, after_id: int, limit: int):
+    return await db.stream(crawl_results_query(crawl_id, content_crawl, fields, after_id).limit(limit))
+
+# One page of full-text search results, best first, as dicts with id, website_url, title,
+# crawl_id, score and snippet
+async def search_website_data(db: AsyncSession, query: str, crawl_id: str = None, content_crawl: bool = False,
+                              limit: int = 20, offset: int = 0):
+    dialect = db.get_bind().dialect.name
+    rows = (await db.execute(
+        search_index.search_statement(dialect, query, crawl_id, content_crawl, limit, offset)
+    )).mappings().all()
+    if not rows:
+        return []
+    # The indexes don't keep the text; the snippets come from the stored text of this page
+    contents = await db.run_sync(content_store.load_contents, [row['text_blob_id'] for row in rows])
+    texts = {row['id']: contents[row['text_blob_id']] if row['text_blob_id'] is not None else row['text'] or ''
+             for row in rows}
+    if dialect == 'postgresql':
+        snippets = dict((await db.execute(search_index.headlines_statement(query, texts))).all())
+    else:
+        snippets = {id: search_index.text_snippet(query, text) for id, text in texts.items()}
+    return [
+        {key: row[key] for key in ('id', 'website_url', 'title', 'crawl_id', 'score')} | {'snippet': snippets[row['id']]}
+        for row in rows
+    ]
+
+def enqueue_crawl_job(db: AsyncSession, crawl_id: str, request_data: dict, priority: int = 0, tenant: str = None, domain: str = None):
+    db_crawl_job = CrawlJob(
+        crawl_id=crawl_id,
+        status='queued',
+        priority=priority,
+        tenant=tenant,
+        domain=domain,
+        request_data=json.dumps(request_data),
+        attempts=0,
+        enqueued_at=datetime.now(),
+    )
+    db.add(db_crawl_job)
+    return db_crawl_job
+
+async def get_latest_crawl_job(db: AsyncSession, crawl_id: str):
+    result = await db.execute(
+        select(CrawlJob).where(CrawlJob.crawl_id == crawl_id).order_by(CrawlJob.id.desc()).limit(1)
+    )
+    return result.scalars().first()
+
+async def cancel_queued_crawl_job(db: AsyncSession, crawl_id: str):
+    # Returns True if a queued job of the crawl was cancelled
+    result = await db.execute(
+        update(CrawlJob)
+        .where(CrawlJob.crawl_id == crawl_id, CrawlJob.status == 'queued')
+        .values(status='cancelled', finished_at=datetime.now())
+    )
+    return result.rowcount > 0
+
+async def get_crawl_queue_stats(db: AsyncSession, since: datetime):
+    counts = dict((await db.execute(
+        select(CrawlJob.status, func.count(CrawlJob.id)).group_by(CrawlJob.status)
+    )).all())
+    oldest_queued = (await db.execute(
+        select(func.min(CrawlJob.enqueued_at)).where(CrawlJob.status == 'queued')
+    )).scalar()
+    waits = (await db.execute(
+        select(CrawlJob.enqueued_at, CrawlJob.started_at)
+        .where(CrawlJob.started_at.isnot(None), CrawlJob.started_at >= since)
+    )).all()
+    return counts, oldest_queued, [(started - enqueued).total_seconds() for enqueued, started in waits]
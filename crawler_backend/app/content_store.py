@@ -0,0 +1,233 @@
+import gzip
+import hashlib
+import os
+import uuid
+from collections import Counter
+from sqlalchemy import insert, select, update, delete, func, event, bindparam
+from sqlalchemy.orm import Session
+from app.models import ContentBlob, WebsiteData
+
+try:
+    import zstandard
+except ImportError:  # Falls back to gzip
+    zstandard = None
+
+# Codec for new blobs; blobs keep the codec they were written with, so it can be changed any time
+CONTENT_STORE_CODEC = os.getenv("CONTENT_STORE_CODEC", "zstd" if zstandard else "gzip")
+CONTENT_STORE_LEVEL = int(os.getenv("CONTENT_STORE_LEVEL", "0"))  # 0 uses the codec's default level
+# Blobs larger than this (compressed) are written to files instead of the database; 0 keeps them all in the database
+CONTENT_STORE_OFFLOAD_BYTES = int(os.getenv("CONTENT_STORE_OFFLOAD_BYTES", "0"))
+CONTENT_STORE_DIR = os.getenv(
+    "CONTENT_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "content_store"),
+)
+
+# Hashes looked up per IN (...) query
+LOOKUP_CHUNK_SIZE = 500
+
+
+def compress(raw: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=CONTENT_STORE_LEVEL or 3).compress(raw)
+    if codec == 'gzip':
+        return gzip.compress(raw, compresslevel=CONTENT_STORE_LEVEL or 6, mtime=0)
+    return raw
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed content")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    return data
+
+def write_blob_file(content_hash: str, codec: str, data: bytes) -> str:
+    # Named after the content hash plus a token of its own, so a file of a deleted blob can be
+    # removed even while the same content is being stored again
+    path = os.path.join(content_hash[:2], f"{content_hash}-{uuid.uuid4().hex[:12]}.{codec}")
+    full_path = os.path.join(CONTENT_STORE_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    tmp_path = f"{full_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, full_path)
+    return path
+
+def read_blob_file(path: str) -> bytes:
+    with open(os.path.join(CONTENT_STORE_DIR, path), 'rb') as f:
+        return f.read()
+
+def remove_blob_files(paths: list):
+    for path in paths:
+        try:
+            os.remove(os.path.join(CONTENT_STORE_DIR, path))
+        except FileNotFoundError:
+            pass
+
+def blob_files(db: Session) -> dict:
+    # Offloaded files of the session's transaction: the ones it wrote are removed if it rolls
+    # back, the ones of the blobs it deleted once it commits
+    files = db.info.get('blob_files')
+    if files is None:
+        files = db.info['blob_files'] = {'written': [], 'released': []}
+        event.listen(db, 'after_commit', blob_files_committed)
+        event.listen(db, 'after_rollback', blob_files_rolled_back)
+    return files
+
+def blob_files_committed(session):
+    files = session.info['blob_files']
+    remove_blob_files(files['released'])
+    files['written'].clear()
+    files['released'].clear()
+
+def blob_files_rolled_back(session):
+    files = session.info['blob_files']
+    remove_blob_files(files['written'])
+    files['written'].clear()
+    files['released'].clear()
+
+def get_blob_ids(db: Session, hashes: list) -> dict:
+    ids = {}
+    for i in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+        chunk = hashes[i:i + LOOKUP_CHUNK_SIZE]
+        ids.update(db.execute(
+            select(ContentBlob.content_hash, ContentBlob.id).where(ContentBlob.content_hash.in_(chunk))
+        ).all())
+    return ids
+
+def insert_blobs(db: Session, rows: list):
+    # Another crawler may store the same content concurrently; the unique hash makes one insert
+    # win, and the other one's references are added to it
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        db.execute(insert(ContentBlob), rows)
+        return
+    statement = dialect_insert(ContentBlob)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=['content_hash'], set_={'refs': ContentBlob.refs + statement.excluded.refs}
+    ), rows)
+
+def add_references(db: Session, refs: Counter) -> set:
+    # refs: content hash -> new references; blobs that don't exist (yet) are left alone.
+    # Returns the hashes of the blobs referenced, one UPDATE per chunk of hashes with the
+    # same count (mostly 1).
+    table = ContentBlob.__table__
+    by_count = {}
+    for content_hash, count in refs.items():
+        by_count.setdefault(count, []).append(content_hash)
+    referenced = set()
+    for count, hashes in by_count.items():
+        for i in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+            referenced.update(db.execute(
+                update(table).where(table.c.content_hash.in_(hashes[i:i + LOOKUP_CHUNK_SIZE]))
+                .values(refs=table.c.refs + count).returning(table.c.content_hash)
+            ).scalars())
+    return referenced
+
+# Store page contents, each distinct body once, and count the references to their blobs;
+# returns the blob id of each content (None for None). The caller commits.
+def store_contents(db: Session, contents: list) -> list:
+    hashes = []
+    raw_by_hash = {}
+    refs = Counter()
+    for content in contents:
+        if content is None:
+            hashes.append(None)
+            continue
+        raw = content.encode('utf-8', errors='surrogatepass')
+        content_hash = hashlib.sha256(raw).hexdigest()
+        hashes.append(content_hash)
+        raw_by_hash[content_hash] = raw
+        refs[content_hash] += 1
+
+    # Reference the existing blobs before looking them up: a blob with references is never
+    # deleted, so none can go away between the lookup and the commit. Blobs that don't
+    # exist yet are inserted with their references, or, if another writer inserted one in
+    # the meantime, the insert adds them to it.
+    referenced = add_references(db, refs)
+    ids = get_blob_ids(db, list(referenced))
+    missing = [h for h in raw_by_hash if h not in referenced]
+    if missing:
+        rows = []
+        for content_hash in missing:
+            raw = raw_by_hash[content_hash]
+            codec = CONTENT_STORE_CODEC
+            data = compress(raw, codec)
+            if len(data) >= len(raw):
+                codec, data = 'none', raw  # Short bodies don't compress
+            row = {
+                'content_hash': content_hash,
+                'codec': codec,
+                'size': len(raw),
+                'stored_size': len(data),
+                'data': data,
+                'path': None,
+                'refs': refs[content_hash],
+            }
+            if CONTENT_STORE_OFFLOAD_BYTES and len(data) > CONTENT_STORE_OFFLOAD_BYTES:
+                row['path'] = write_blob_file(content_hash, codec, data)
+                row['data'] = None
+            rows.append(row)
+        insert_blobs(db, rows)
+        ids.update(get_blob_ids(db, missing))
+        written = {row['path'] for row in rows if row['path']}
+        if written:
+            # Files of the blobs another crawler inserted first are not referenced by anything
+            kept = set(db.scalars(select(ContentBlob.path).where(ContentBlob.path.in_(written))))
+            remove_blob_files(written - kept)
+            blob_files(db)['written'].extend(kept)
+    return [ids[h] if h else None for h in hashes]
+
+# Drop references to blobs (ids may repeat, None is skipped). Blobs left without references
+# are deleted in the caller's transaction, and their files once it commits.
+def release_contents(db: Session, blob_ids: list):
+    counts = Counter(blob_id for blob_id in blob_ids if blob_id is not None)
+    if not counts:
+        return
+    table = ContentBlob.__table__
+    db.execute(
+        update(table).where(table.c.id == bindparam('b_id')).values(refs=table.c.refs - bindparam('b_refs')),
+        [{'b_id': blob_id, 'b_refs': count} for blob_id, count in counts.items()],
+    )
+    blob_ids = list(counts)
+    paths = []
+    for i in range(0, len(blob_ids), LOOKUP_CHUNK_SIZE):
+        paths.extend(db.execute(
+            delete(table).where(table.c.id.in_(blob_ids[i:i + LOOKUP_CHUNK_SIZE]), table.c.refs <= 0).returning(table.c.path)
+        ).scalars())
+    blob_files(db)['released'].extend(path for path in paths if path is not None)
+
+# Decompressed contents by blob id
+def load_contents(db: Session, blob_ids) -> dict:
+    blob_ids = list({blob_id for blob_id in blob_ids if blob_id is not None})
+    contents = {}
+    for i in range(0, len(blob_ids), LOOKUP_CHUNK_SIZE):
+        chunk = blob_ids[i:i + LOOKUP_CHUNK_SIZE]
+        for blob in db.execute(
+            select(ContentBlob.id, ContentBlob.codec, ContentBlob.data, ContentBlob.path).where(ContentBlob.id.in_(chunk))
+        ):
+            data = blob.data if blob.path is None else read_blob_file(blob.path)
+            contents[blob.id] = decompress(data, blob.codec).decode('utf-8', errors='surrogatepass')
+    return contents
+
+# Blob and reference counts, raw and stored bytes
+def get_content_store_stats(db: Session) -> dict:
+    blobs, raw_bytes, stored_bytes = db.execute(
+        select(func.count(ContentBlob.id), func.sum(ContentBlob.size), func.sum(ContentBlob.stored_size))
+    ).one()
+    references = db.execute(
+        select(func.count(WebsiteData.html_blob_id) + func.count(WebsiteData.text_blob_id))
+    ).scalar()
+    return {
+        "blobs": blobs,
+        "references": references,
+        "dedup_ratio": (references / blobs) if blobs else None,
+        "raw_bytes": raw_bytes or 0,
+        "stored_bytes": stored_bytes or 0,
+        "compression_ratio": (raw_bytes / stored_bytes) if stored_bytes else None,
+    }
@@ -1,9 +1,14 @@
 import pickle
 import json
+from sqlalchemy import insert, select, update, func, false, literal
 from sqlalchemy.orm import Session
-from datetime import datetime
-from app.models import WebsiteData, CrawlSession
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime, timedelta
+from app.models import (WebsiteData, ContentBlob, CrawlSession, CrawlCheckpoint, CrawlJob, ContentCrawlTarget, PageSignature,
+                        CrawlFrontierUrl)
 from app.schemas import WebsiteDataCreate, CrawlSessionCreate, CrawlSessionUpdate
+from app import content_store, search_index
+from app.web_scraper.frontier import url_fingerprint
 
 # Create a new entry for website data
 def create_website_data(db: Session, website_data: WebsiteDataCreate):
@@ -17,25 +22,227 @@ def create_website_data(db: Session, website_data: WebsiteDataCreate):
     db.refresh(db_website_data)
     return db_website_data
 
+# Fill in html/text of rows whose content lives in the content store (without marking them dirty)
+def load_website_content(db: Session, rows: list):
+    rows = [row for row in rows if row is not None]
+    contents = content_store.load_contents(
+        db, [row.html_blob_id for row in rows] + [row.text_blob_id for row in rows]
+    )
+    for row in rows:
+        if row.html_blob_id is not None:
+            set_committed_value(row, 'html', contents[row.html_blob_id])
+        if row.text_blob_id is not None:
+            set_committed_value(row, 'text', contents[row.text_blob_id])
+    return rows
+
 # Retrieve a specific website data by ID
 def get_website_data(db: Session, website_data_id: int):
-    return db.query(WebsiteData).filter(WebsiteData.id == website_data_id).first()
+    data = db.query(WebsiteData).filter(WebsiteData.id == website_data_id).first()
+    load_website_content(db, [data])
+    return data
 
 def update_website_data(db: Session, id: int, title: str, text: str, html: str, status: bool):
     data = db.query(WebsiteData).filter(WebsiteData.id == id).first()
     if data:
+        # Indexed before the row changes: the entry it replaces is looked up from the row
+        search_index.index_documents(db, [{'id': id, 'title': title, 'text': text}])
+        html_blob_id, text_blob_id = content_store.store_contents(db, [html, text])
+        content_store.release_contents(db, [data.html_blob_id, data.text_blob_id])
         data.title = title
-        data.text = text
-        data.html = html
+        data.text = None
+        data.html = None
+        data.html_blob_id = html_blob_id
+        data.text_blob_id = text_blob_id
         data.status = status
         db.commit()
         db.refresh(data)
+        load_website_content(db, [data])
         return data
     return None
 
+# Insert many website data rows in one executemany round trip (caller commits)
+def bulk_create_website_data(db: Session, rows: list):
+    if rows:
+        db.execute(insert(WebsiteData), rows)
+
+# Fields of a fetch stored on its WebsiteData row
+PAGE_CONTENT_FIELDS = ['title', 'text', 'html', 'status', 'etag', 'last_modified', 'body_hash']
+
+# Update many website data rows by primary key in one executemany round trip (caller commits).
+# html/text go to the content store and the rows reference the stored blobs; the search
+# index is updated in the same transaction.
+def bulk_update_website_data(db: Session, rows: list):
+    if rows:
+        search_index.index_documents(db, rows)
+        replaced_blob_ids = get_website_data_blob_ids(db, [row['id'] for row in rows])
+        blob_ids = content_store.store_contents(
+            db, [row.get('html') for row in rows] + [row.get('text') for row in rows]
+        )
+        rows = [
+            {**row, 'html': None, 'text': None, 'html_blob_id': html_blob_id, 'text_blob_id': text_blob_id}
+            for row, html_blob_id, text_blob_id in zip(rows, blob_ids[:len(rows)], blob_ids[len(rows):])
+        ]
+        db.execute(update(WebsiteData), rows)
+        # The blobs of the previous fetch are deleted once nothing references them
+        content_store.release_contents(db, replaced_blob_ids)
+
+# Blob ids the rows reference, html and text
+def get_website_data_blob_ids(db: Session, ids: list):
+    blob_ids = []
+    for i in range(0, len(ids), 500):
+        for html_blob_id, text_blob_id in db.execute(
+            select(WebsiteData.html_blob_id, WebsiteData.text_blob_id).where(WebsiteData.id.in_(ids[i:i + 500]))
+        ):
+            blob_ids += [html_blob_id, text_blob_id]
+    return blob_ids
+
+# Insert many fetched pages with their content (caller commits): the rows are created as by
+# bulk_create_website_data, then their content is stored as by bulk_update_website_data
+def bulk_create_website_pages(db: Session, rows: list):
+    if rows:
+        ids = db.scalars(
+            insert(WebsiteData).returning(WebsiteData.id, sort_by_parameter_order=True),
+            [{'website_url': row['website_url'], 'status': False, 'crawl_id': row.get('crawl_id'),
+              'created_at': row['created_at']} for row in rows],
+        ).all()
+        bulk_update_website_data(db, [
+            {'id': id, **{key: row.get(key) for key in PAGE_CONTENT_FIELDS}} for id, row in zip(ids, rows)
+        ])
+
 def get_website_data_by_id(db: Session, id: int):
-    # Query to get the WebsiteData entry by its ID
-    return db.query(WebsiteData).filter(WebsiteData.id == id).first()
+    # Query to get the WebsiteData entry by its ID, with its content decompressed
+    data = db.query(WebsiteData).filter(WebsiteData.id == id).first()
+    load_website_content(db, [data])
+    return data
+
+# Validators of the last fetch of each row, with the size of its stored HTML, by row id
+def get_website_data_validators(db: Session, ids: list):
+    validators = {}
+    for i in range(0, len(ids), 500):
+        rows = (
+            db.query(WebsiteData.id, WebsiteData.etag, WebsiteData.last_modified, WebsiteData.body_hash, ContentBlob.size)
+            .outerjoin(ContentBlob, ContentBlob.id == WebsiteData.html_blob_id)
+            .filter(WebsiteData.id.in_(ids[i:i + 500]), WebsiteData.body_hash.isnot(None))
+        )
+        for id, etag, last_modified, body_hash, size in rows:
+            validators[id] = {'etag': etag, 'last_modified': last_modified, 'body_hash': body_hash, 'size': size or 0}
+    return validators
+
+# Insert statement that skips rows conflicting with `index_elements`, where the dialect supports it
+def insert_ignoring_conflicts(dialect: str, model, index_elements: list):
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+
+# Statement adding the existing WebsiteData rows among `website_data_ids` to the targets of a
+# content crawl; rows it already has and unknown ids are skipped
+def content_crawl_targets_insert(dialect: str, crawl_id: str, website_data_ids: list):
+    return insert_ignoring_conflicts(dialect, ContentCrawlTarget, ['crawl_id', 'website_data_id']).from_select(
+        ['crawl_id', 'website_data_id'],
+        select(literal(crawl_id), WebsiteData.id).where(WebsiteData.id.in_(website_data_ids)),
+    )
+
+# Statement adding every WebsiteData row with status=False to the targets of a content crawl
+def pending_content_crawl_targets_insert(dialect: str, crawl_id: str):
+    return insert_ignoring_conflicts(dialect, ContentCrawlTarget, ['crawl_id', 'website_data_id']).from_select(
+        ['crawl_id', 'website_data_id'],
+        select(literal(crawl_id), WebsiteData.id).where(WebsiteData.status == false()),
+    )
+
+# Add WebsiteData rows to the targets of a content crawl (caller commits)
+def add_content_crawl_targets(db: Session, crawl_id: str, website_data_ids: list):
+    dialect = db.get_bind().dialect.name
+    for i in range(0, len(website_data_ids), 500):
+        db.execute(content_crawl_targets_insert(dialect, crawl_id, website_data_ids[i:i + 500]))
+
+# Next chunk of (id, url) rows of a content crawl after `after_id` it hasn't done yet, in id order
+def get_content_crawl_rows(db: Session, crawl_id: str, after_id: int, limit: int):
+    return (
+        db.query(WebsiteData.id, WebsiteData.website_url)
+        .join(ContentCrawlTarget, ContentCrawlTarget.website_data_id == WebsiteData.id)
+        .filter(ContentCrawlTarget.crawl_id == crawl_id, ContentCrawlTarget.website_data_id > after_id,
+                ContentCrawlTarget.done == false())
+        .order_by(ContentCrawlTarget.website_data_id)
+        .limit(limit)
+        .all()
+    )
+
+# Mark rows of a content crawl done (caller commits, with the rows' content)
+def mark_content_crawl_targets_done(db: Session, crawl_id: str, website_data_ids: list):
+    for i in range(0, len(website_data_ids), 500):
+        db.execute(
+            update(ContentCrawlTarget)
+            .where(ContentCrawlTarget.crawl_id == crawl_id,
+                   ContentCrawlTarget.website_data_id.in_(website_data_ids[i:i + 500]))
+            .values(done=True)
+        )
+
+# The ids among `website_data_ids` the content crawl has done
+def get_done_content_crawl_targets(db: Session, crawl_id: str, website_data_ids):
+    website_data_ids = list(website_data_ids)
+    done = set()
+    for i in range(0, len(website_data_ids), 500):
+        done.update(db.scalars(
+            select(ContentCrawlTarget.website_data_id)
+            .where(ContentCrawlTarget.crawl_id == crawl_id,
+                   ContentCrawlTarget.website_data_id.in_(website_data_ids[i:i + 500]),
+                   ContentCrawlTarget.done.is_(True))
+        ))
+    return done
+
+# Number of rows a content crawl fetches, for its progress
+def count_content_crawl_rows(db: Session, crawl_id: str):
+    return db.query(func.count(ContentCrawlTarget.id)).filter(ContentCrawlTarget.crawl_id == crawl_id).scalar()
+
+# Columns read for each field of the crawl results; html and text also need their content store blob
+RESULT_FIELD_COLUMNS = {
+    'id': [WebsiteData.id],
+    'website_url': [WebsiteData.website_url],
+    'title': [WebsiteData.title],
+    'status': [WebsiteData.status],
+    'crawl_id': [WebsiteData.crawl_id],
+    'created_at': [WebsiteData.created_at],
+    'etag': [WebsiteData.etag],
+    'last_modified': [WebsiteData.last_modified],
+    'lastmod': [WebsiteData.lastmod],
+    'text': [WebsiteData.text, WebsiteData.text_blob_id],
+    'html': [WebsiteData.html, WebsiteData.html_blob_id],
+}
+
+# A crawl's rows after `after_id` in id order, with only the columns of `fields`. A URL crawl's
+# pages are the rows it inserted, a content crawl's the rows it targets.
+def crawl_results_query(crawl_id: str, content_crawl: bool, fields: list, after_id: int = 0):
+    columns = list(dict.fromkeys(column for field in ['id', *fields] for column in RESULT_FIELD_COLUMNS[field]))
+    query = select(*columns)
+    if content_crawl:
+        return (
+            query.join(ContentCrawlTarget, ContentCrawlTarget.website_data_id == WebsiteData.id)
+            .where(ContentCrawlTarget.crawl_id == crawl_id, ContentCrawlTarget.website_data_id > after_id)
+            .order_by(ContentCrawlTarget.website_data_id)
+        )
+    return query.where(WebsiteData.crawl_id == crawl_id, WebsiteData.id > after_id).order_by(WebsiteData.id)
+
+# Stream all of a crawl's rows in chunks of dicts from a server-side cursor, with html/text
+# loaded from the content store one chunk at a time
+def iter_crawl_results(db: Session, crawl_id: str, content_crawl: bool, fields: list, chunk_size: int = 500):
+    content_fields = [field for field in ('html', 'text') if field in fields]
+    result = db.execute(crawl_results_query(crawl_id, content_crawl, fields).execution_options(yield_per=chunk_size))
+    for chunk in result.mappings().partitions():
+        contents = content_store.load_contents(
+            db, [row[f"{field}_blob_id"] for row in chunk for field in content_fields]
+        )
+        rows = []
+        for row in chunk:
+            record = {field: row[field] for field in fields}
+            for field in content_fields:
+                if row[f"{field}_blob_id"] is not None:
+                    record[field] = contents[row[f"{field}_blob_id"]]
+            rows.append(record)
+        yield rows
 
 def get_crawl_session(db: Session, crawl_id: str):
     return db.query(CrawlSession).filter(CrawlSession.crawl_id == crawl_id).first()
@@ -47,6 +254,7 @@ def create_crawl_session(db: Session, crawl_session: CrawlSessionCreate):
         crawl_type=crawl_session.crawl_type,
         start_urls=json.dumps(crawl_session.start_urls),  # Ensure start_urls is serialized to JSON
         max_links=crawl_session.max_links,
+        options=json.dumps(crawl_session.options) if crawl_session.options else None,
         status='running',
         visited_links=pickle.dumps([]),  # Initialize as empty
         pending_urls=pickle.dumps(crawl_session.start_urls)
@@ -65,4 +273,212 @@ def update_crawl_session(db: Session, crawl_id: str, crawl_session_update: Crawl
         db.commit()
         db.refresh(db_crawl_session)
         return db_crawl_session
-    return None
\ No newline at end of file
+    return None
+
+# Append the frontier changes since the last checkpoint and store the current link count.
+# pending_urls holds (url, depth) pairs.
+def append_crawl_checkpoint(db: Session, crawl_id: str, pending_urls: list, visited_urls: list, link_count: int):
+    rows = [{'crawl_id': crawl_id, 'url': url, 'visited': False, 'depth': depth} for url, depth in pending_urls]
+    rows += [{'crawl_id': crawl_id, 'url': url, 'visited': True, 'depth': None} for url in visited_urls]
+    if rows:
+        db.execute(insert(CrawlCheckpoint), rows)
+    db.query(CrawlSession).filter(CrawlSession.crawl_id == crawl_id).update({'link_count': link_count})
+    db.commit()
+
+# Stream the checkpoint log of a crawl as (url, visited, depth) entries in the order they were written
+def iter_crawl_checkpoint(db: Session, crawl_id: str):
+    return (
+        db.query(CrawlCheckpoint.url, CrawlCheckpoint.visited, CrawlCheckpoint.depth)
+        .filter(CrawlCheckpoint.crawl_id == crawl_id)
+        .order_by(CrawlCheckpoint.id)
+        .yield_per(10000)
+    )
+
+# Insert many page signatures in one executemany round trip (caller commits)
+def bulk_create_page_signatures(db: Session, rows: list):
+    if rows:
+        db.execute(insert(PageSignature), rows)
+
+# Stream the page signatures of a crawl as (url, signature, duplicate_of) in the order they were written
+def iter_page_signatures(db: Session, crawl_id: str):
+    return (
+        db.query(PageSignature.url, PageSignature.signature, PageSignature.duplicate_of)
+        .filter(PageSignature.crawl_id == crawl_id)
+        .order_by(PageSignature.id)
+        .yield_per(10000)
+    )
+
+def signed_fingerprint(url: str):
+    # url_fingerprint in a signed 64-bit column
+    fingerprint = url_fingerprint(url)
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+# Queue (url, depth) entries in the shared frontier of a distributed crawl, skipping URLs it
+# already has (caller commits)
+def add_frontier_urls(db: Session, crawl_id: str, entries: list):
+    if entries:
+        statement = insert_ignoring_conflicts(db.get_bind().dialect.name, CrawlFrontierUrl, ['crawl_id', 'fingerprint'])
+        db.execute(statement, [
+            {'crawl_id': crawl_id, 'url': url, 'fingerprint': signed_fingerprint(url), 'depth': depth,
+             'status': 'pending', 'attempts': 0}
+            for url, depth in entries
+        ])
+
+# Put the URLs of expired leases back in the queue, or fail them once they have been leased
+# max_attempts times (they keep taking their worker down)
+def reclaim_expired_frontier_leases(db: Session, crawl_id: str, max_attempts: int):
+    expired = (CrawlFrontierUrl.crawl_id == crawl_id, CrawlFrontierUrl.status == 'leased',
+               CrawlFrontierUrl.lease_expires_at < datetime.now())
+    db.query(CrawlFrontierUrl).filter(*expired, CrawlFrontierUrl.attempts >= max_attempts) \
+        .update({'status': 'failed', 'lease_owner': None}, synchronize_session=False)
+    db.query(CrawlFrontierUrl).filter(*expired) \
+        .update({'status': 'pending', 'lease_owner': None}, synchronize_session=False)
+    db.commit()
+
+# Lease up to `limit` pending URLs of a crawl to a worker for lease_seconds, as (id, url, depth).
+# Concurrent workers skip each other's locked rows on Postgres (FOR UPDATE SKIP LOCKED); SQLite
+# has no row locks, but runs the single UPDATE ... RETURNING under its database write lock.
+def lease_frontier_urls(db: Session, crawl_id: str, worker_id: str, limit: int, lease_seconds: float):
+    candidates = (
+        select(CrawlFrontierUrl.id)
+        .where(CrawlFrontierUrl.crawl_id == crawl_id, CrawlFrontierUrl.status == 'pending')
+        .order_by(CrawlFrontierUrl.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(CrawlFrontierUrl)
+        .where(CrawlFrontierUrl.id.in_(candidates))
+        .values(status='leased', lease_owner=worker_id, attempts=CrawlFrontierUrl.attempts + 1,
+                lease_expires_at=datetime.now() + timedelta(seconds=lease_seconds))
+        .returning(CrawlFrontierUrl.id, CrawlFrontierUrl.url, CrawlFrontierUrl.depth)
+    ).all()
+    db.commit()
+    return sorted(rows)
+
+# Report what a worker did with its leased URLs, in one transaction: fetched pages are marked
+# done and stored, failed ones marked failed, and newly discovered links queued. `pages` maps
+# frontier ids to WebsiteData rows (with their content in single-pass crawls). A page is only
+# stored if the worker still held its lease, so a URL re-leased after its lease expired is
+# stored once. Returns the number of pages stored.
+def report_frontier_results(db: Session, crawl_id: str, worker_id: str, pages: dict, failed_ids: list, discovered: list):
+    leased = (CrawlFrontierUrl.crawl_id == crawl_id, CrawlFrontierUrl.status == 'leased',
+              CrawlFrontierUrl.lease_owner == worker_id)
+    done_ids = []
+    ids = list(pages)
+    for i in range(0, len(ids), 500):
+        done_ids += db.scalars(
+            update(CrawlFrontierUrl)
+            .where(*leased, CrawlFrontierUrl.id.in_(ids[i:i + 500]))
+            .values(status='done', lease_expires_at=None)
+            .returning(CrawlFrontierUrl.id)
+        ).all()
+    for i in range(0, len(failed_ids), 500):
+        db.execute(
+            update(CrawlFrontierUrl)
+            .where(*leased, CrawlFrontierUrl.id.in_(failed_ids[i:i + 500]))
+            .values(status='failed', lease_expires_at=None)
+        )
+    add_frontier_urls(db, crawl_id, discovered)
+    rows = [pages[id] for id in sorted(done_ids)]
+    bulk_create_website_data(db, [row for row in rows if 'text' not in row])
+    bulk_create_website_pages(db, [row for row in rows if 'text' in row])
+    db.commit()
+    return len(rows)
+
+# Hand a stopping worker's unused leases back right away instead of when they expire
+def release_frontier_leases(db: Session, crawl_id: str, worker_id: str):
+    db.query(CrawlFrontierUrl).filter(
+        CrawlFrontierUrl.crawl_id == crawl_id, CrawlFrontierUrl.status == 'leased', CrawlFrontierUrl.lease_owner == worker_id
+    ).update({'status': 'pending', 'lease_owner': None, 'lease_expires_at': None,
+              'attempts': CrawlFrontierUrl.attempts - 1}, synchronize_session=False)
+    db.commit()
+
+# Frontier URLs of a crawl by status, plus the number of workers holding live leases
+def frontier_counts_statement(crawl_id: str):
+    return (
+        select(CrawlFrontierUrl.status, func.count(CrawlFrontierUrl.id), func.count(func.distinct(CrawlFrontierUrl.lease_owner)))
+        .where(CrawlFrontierUrl.crawl_id == crawl_id)
+        .group_by(CrawlFrontierUrl.status)
+    )
+
+def frontier_counts(rows):
+    counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0, 'workers': 0}
+    for status, count, owners in rows:
+        counts[status] = count
+        if status == 'leased':
+            counts['workers'] = owners
+    return counts
+
+def get_frontier_counts(db: Session, crawl_id: str):
+    return frontier_counts(db.execute(frontier_counts_statement(crawl_id)).all())
+
+# Status of a distributed crawl across all its workers: completed once its frontier is
+# exhausted or max_links pages are stored, running while any worker holds leases, else paused.
+# `pid` is the stopping worker's; the session only forgets it if it was the one recorded.
+def update_distributed_crawl_status(db: Session, crawl_id: str, max_links: int, pid: int = None):
+    counts = get_frontier_counts(db, crawl_id)
+    if counts['done'] >= max_links or not (counts['pending'] or counts['leased']):
+        status = 'completed'
+    elif counts['leased']:
+        status = 'running'
+    else:
+        status = 'paused'
+    db.query(CrawlSession).filter(CrawlSession.crawl_id == crawl_id).update(
+        {'status': status, 'link_count': counts['done']}, synchronize_session=False
+    )
+    db.query(CrawlSession).filter(CrawlSession.crawl_id == crawl_id, CrawlSession.pid == pid).update(
+        {'pid': None}, synchronize_session=False
+    )
+    db.commit()
+    return status
+
+ACTIVE_JOB_STATUSES = ('dispatched', 'running')
+
+def enqueue_crawl_job(db: Session, crawl_id: str, request_data: dict, priority: int = 0, tenant: str = None, domain: str = None):
+    db_crawl_job = CrawlJob(
+        crawl_id=crawl_id,
+        status='queued',
+        priority=priority,
+        tenant=tenant,
+        domain=domain,
+        request_data=json.dumps(request_data),
+        enqueued_at=datetime.now(),
+    )
+    db.add(db_crawl_job)
+    db.commit()
+    db.refresh(db_crawl_job)
+    return db_crawl_job
+
+def get_queued_crawl_jobs(db: Session, limit: int):
+    return (
+        db.query(CrawlJob)
+        .filter(CrawlJob.status == 'queued')
+        .order_by(CrawlJob.priority.desc(), CrawlJob.enqueued_at)
+        .limit(limit)
+        .all()
+    )
+
+def get_active_crawl_jobs(db: Session):
+    return db.query(CrawlJob).filter(CrawlJob.status.in_(ACTIVE_JOB_STATUSES)).all()
+
+def get_active_crawl_job(db: Session, crawl_id: str):
+    return (
+        db.query(CrawlJob)
+        .filter(CrawlJob.crawl_id == crawl_id, CrawlJob.status.in_(('queued',) + ACTIVE_JOB_STATUSES))
+        .order_by(CrawlJob.id.desc())
+        .first()
+    )
+
+def get_latest_crawl_job(db: Session, crawl_id: str):
+    return db.query(CrawlJob).filter(CrawlJob.crawl_id == crawl_id).order_by(CrawlJob.id.desc()).first()
+
+# Atomically move a job from one status to another; False if another scheduler got there first
+def transition_crawl_job(db: Session, job_id: int, from_statuses: tuple, **values):
+    updated = (
+        db.query(CrawlJob)
+        .filter(CrawlJob.id == job_id, CrawlJob.status.in_(from_statuses))
+        .update(values, synchronize_session=False)
+    )
+    db.commit()
+    return updated == 1
@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 from dotenv import load_dotenv
 
@@ -10,9 +12,45 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 print("DATABASE_URL =", DATABASE_URL)
 
-engine = create_engine(DATABASE_URL)
+# Connection pool sizing, shared by the sync (crawler) and async (API) engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def to_async_url(url: str) -> str:
+    # Same database through an asyncio driver: aiosqlite for SQLite, asyncpg for Postgres
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+def pool_options(url: str, is_async: bool = False) -> dict:
+    # In-memory SQLite uses a single connection, so there is no pool to size
+    if ":memory:" in url:
+        return {}
+    options = {}
+    if is_async and url.startswith("sqlite"):
+        options["poolclass"] = AsyncAdaptedQueuePool  # aiosqlite defaults to no pooling
+    return {
+        **options,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Import your models to ensure they're included in the metadata
@@ -20,6 +58,7 @@ from app import models  # <-- Ensure models are imported here
 
 # Create tables if they don't exist
 def create_tables():
+    from app import search_index  # Registers the full-text index tables, which aren't models
     Base.metadata.create_all(bind=engine)
 
 # Dependency to get DB session
@@ -29,3 +68,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get an async DB session for the API endpoints
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
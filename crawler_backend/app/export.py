@@ -0,0 +1,199 @@
+# crawler_backend/app/export.py
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from app import cruds
+from app.database import SessionLocal
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is unavailable
+    pyarrow = None
+
+# Rows fetched from the database (and decompressed from the content store) at a time
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+# Rows per Parquet row group; the rows of one group are held in memory until it is written
+EXPORT_PARQUET_ROW_GROUP_SIZE = int(os.getenv("EXPORT_PARQUET_ROW_GROUP_SIZE", "10000"))
+
+JSONL_DEFAULT_FIELDS = ['id', 'website_url', 'title', 'status', 'crawl_id', 'created_at', 'etag', 'last_modified', 'lastmod', 'text', 'html']
+PARQUET_FIELDS = ['id', 'website_url', 'title', 'crawl_id', 'created_at', 'text']  # Text only, for analytics
+WARC_FIELDS = ['website_url', 'created_at', 'html']
+
+# format -> (file extension, media type)
+EXPORT_FORMATS = {
+    'jsonl': ('jsonl.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'warc': ('warc.gz', 'application/warc'),
+}
+
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def export_jsonl(chunks, fields):
+    # One JSON object per line, gzipped as a single stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for rows in chunks:
+        lines = "".join(json.dumps({field: json_value(row[field]) for field in fields}) + "\n" for row in rows)
+        yield compressor.compress(lines.encode('utf-8', errors='surrogatepass')), len(rows)
+    yield compressor.flush(), 0
+
+
+class StreamSink:
+    # Write-only file object for ParquetWriter that hands out what was written so far,
+    # so the file is streamed row group by row group instead of built in memory
+
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.buffer = b"".join(self.buffer), []
+        return data
+
+def export_parquet(chunks):
+    if pyarrow is None:
+        raise RuntimeError("pyarrow is required for Parquet export")
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('website_url', pyarrow.string()),
+        ('title', pyarrow.string()),
+        ('crawl_id', pyarrow.string()),
+        ('created_at', pyarrow.timestamp('us')),
+        ('text', pyarrow.string()),
+    ])
+    sink = StreamSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    group = []
+    for rows in chunks:
+        group.extend(rows)
+        if len(group) >= EXPORT_PARQUET_ROW_GROUP_SIZE:
+            writer.write_table(pyarrow.Table.from_pylist(group, schema=schema))
+            yield sink.drain(), len(group)
+            group = []
+    if group:
+        writer.write_table(pyarrow.Table.from_pylist(group, schema=schema))
+    writer.close()
+    yield sink.drain(), len(group)
+
+
+def warc_record(record_type, headers, payload):
+    # One WARC/1.1 record as its own gzip member, so readers can seek record by record
+    head = [
+        "WARC/1.1",
+        f"WARC-Type: {record_type}",
+        f"WARC-Record-ID: <urn:uuid:{uuid4()}>",
+        *headers,
+        f"WARC-Block-Digest: sha1:{base64.b32encode(hashlib.sha1(payload).digest()).decode()}",
+        f"Content-Length: {len(payload)}",
+    ]
+    return gzip.compress(("\r\n".join(head) + "\r\n\r\n").encode('utf-8') + payload + b"\r\n\r\n", mtime=0)
+
+def warc_date(value):
+    # created_at is naive local time
+    return (value or datetime.now()).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def export_warc(chunks, crawl_id):
+    # A warcinfo record, then a resource record with the stored HTML of every fetched page.
+    # Response headers aren't stored, so pages are archived as resources, not responses.
+    info = f"software: chrome-extension-crawler\r\nformat: WARC File Format 1.1\r\ncrawl-id: {crawl_id}\r\n"
+    yield warc_record("warcinfo", [
+        f"WARC-Date: {warc_date(None)}", f"WARC-Filename: {crawl_id}.warc.gz", "Content-Type: application/warc-fields",
+    ], info.encode('utf-8')), 0
+    for rows in chunks:
+        records = [
+            warc_record("resource", [
+                f"WARC-Target-URI: {row['website_url']}",
+                f"WARC-Date: {warc_date(row['created_at'])}",
+                "Content-Type: text/html; charset=utf-8",
+            ], row['html'].encode('utf-8', errors='surrogatepass'))
+            for row in rows if row['html'] is not None
+        ]
+        yield b"".join(records), len(records)
+
+
+def export_crawl(db, crawl_id, content_crawl, format, fields=None, stats=None):
+    # Stream a crawl's results in `format` as chunks of bytes, reading the rows from a
+    # server-side cursor. `stats` (a dict) is kept up to date with the rows and bytes written.
+    if format == 'jsonl':
+        fields = fields or JSONL_DEFAULT_FIELDS
+        chunks = export_jsonl(cruds.iter_crawl_results(db, crawl_id, content_crawl, fields, EXPORT_CHUNK_SIZE), fields)
+    elif format == 'parquet':
+        chunks = export_parquet(cruds.iter_crawl_results(db, crawl_id, content_crawl, PARQUET_FIELDS, EXPORT_CHUNK_SIZE))
+    elif format == 'warc':
+        chunks = export_warc(cruds.iter_crawl_results(db, crawl_id, content_crawl, WARC_FIELDS, EXPORT_CHUNK_SIZE), crawl_id)
+    else:
+        raise ValueError(f"Unknown export format {format!r}")
+    stats = stats if stats is not None else {}
+    stats.setdefault('rows', 0)
+    stats.setdefault('bytes', 0)
+    for data, row_count in chunks:
+        stats['rows'] += row_count
+        stats['bytes'] += len(data)
+        if data:
+            yield data
+
+
+def main():
+    # python -m app.export <crawl_id> [--format jsonl|parquet|warc] [--output FILE] [--fields a,b]
+    parser = argparse.ArgumentParser(description="Export the results of a crawl")
+    parser.add_argument("crawl_id")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="jsonl")
+    parser.add_argument("--output", help="Output file (default: <crawl_id>.<extension>)")
+    parser.add_argument("--fields", help="Comma-separated fields of the JSONL export")
+    args = parser.parse_args()
+
+    fields = [field.strip() for field in args.fields.split(",")] if args.fields else None
+    unknown = [field for field in fields or [] if field not in cruds.RESULT_FIELD_COLUMNS]
+    if unknown:
+        parser.error(f"unknown fields {unknown}")
+    db = SessionLocal()
+    try:
+        crawl_session = cruds.get_crawl_session(db, args.crawl_id)
+        if crawl_session is None:
+            parser.error(f"crawl {args.crawl_id} not found")
+        output = args.output or f"{args.crawl_id}.{EXPORT_FORMATS[args.format][0]}"
+        stats = {}
+        started = time.monotonic()
+        with open(output, "wb") as f:
+            for data in export_crawl(db, args.crawl_id, crawl_session.crawl_type == 'content_crawl',
+                                     args.format, fields, stats):
+                f.write(data)
+    finally:
+        db.close()
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(
+        f"Exported {stats['rows']} rows to {output}: {stats['bytes'] / 1e6:.2f} MB in {elapsed:.2f}s "
+        f"({stats['rows'] / elapsed:.0f} rows/s, {stats['bytes'] / 1e6 / elapsed:.2f} MB/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
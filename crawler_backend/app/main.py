@@ -1,20 +1,93 @@
 # app/main.py
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import subprocess
 import json
-import pickle
 import os
+import re
 import sys
-from typing import List
+from typing import List, Literal, Optional
+from urllib.parse import urlsplit
 from uuid import uuid4
-from app import cruds, database, schemas
+from app import async_cruds, content_store, database, export, metrics, schemas, worker_pool
+from app.scheduler import CrawlScheduler, summarize_queue_stats
+from app.web_scraper.canonical import UrlCanonicalizer
 import signal
 
-app = FastAPI()
-
 crawler_processes = {}
+# Seconds between checks for a new progress snapshot in /crawl-status/{crawl_id}/stream
+CRAWL_STATUS_STREAM_INTERVAL = float(os.getenv("CRAWL_STATUS_STREAM_INTERVAL", "2"))
+# Lines of a /crawl-content/bulk upload written to the database at a time, and the longest line accepted
+CONTENT_BULK_BATCH_SIZE = int(os.getenv("CONTENT_BULK_BATCH_SIZE", "1000"))
+CONTENT_BULK_MAX_LINE_BYTES = 64 * 1024
+# Uploaded URLs are canonicalized as a URL crawl does by default, so they match crawled rows
+content_bulk_canonicalizer = UrlCanonicalizer()
+# /crawl-results/: rows per page by default and at most, and rows read from the database at a time
+CRAWL_RESULTS_DEFAULT_LIMIT = 1000
+CRAWL_RESULTS_MAX_LIMIT = 10000
+CRAWL_RESULTS_CHUNK_SIZE = 200
+CRAWL_RESULTS_DEFAULT_FIELDS = "id,website_url,title,status,created_at"
+SEARCH_MAX_LIMIT = 100
+crawler_pool = None
+crawl_scheduler = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global crawler_pool, crawl_scheduler
+    database.create_tables()
+    if worker_pool.CRAWLER_POOL_WORKERS > 0:
+        crawler_pool = worker_pool.CrawlerWorkerPool()
+        crawler_pool.start()
+        crawl_scheduler = CrawlScheduler(crawler_pool)
+        crawl_scheduler.start()
+    yield
+    if crawl_scheduler is not None:
+        crawl_scheduler.stop()
+        crawl_scheduler = None
+    if crawler_pool is not None:
+        crawler_pool.shutdown()
+        crawler_pool = None
+    await database.async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+async def start_crawler(db: AsyncSession, request_data: dict, priority: int = 0, tenant: Optional[str] = None,
+                        domain: Optional[str] = None):
+    # Queue the crawl for the scheduler in the caller's transaction and commit it.
+    # Without a worker pool, commit first (the spider reads its session on startup),
+    # then start a run_crawler.py process and record its PID.
+    crawl_id = request_data['crawl_id']
+    if crawl_scheduler is not None:
+        urls = request_data.get('start_urls') or [item['url'] for item in request_data.get('urls_and_ids', [])]
+        domain = domain or (urlsplit(urls[0]).hostname if urls else None)
+        async_cruds.enqueue_crawl_job(db, crawl_id, request_data, priority=priority, tenant=tenant, domain=domain)
+        await db.commit()
+        crawl_scheduler.notify()
+        return
+    await db.commit()
+
+    # Path to run_crawler.py
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    script_path = os.path.join(script_dir, 'run_crawler.py')
+
+    # Start the crawler process
+    process = subprocess.Popen([sys.executable, script_path, json.dumps(request_data)], cwd=script_dir)
+
+    # Update the CrawlSession with the PID
+    await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(pid=process.pid))
+    await db.commit()
+
+class UrlCanonicalization(BaseModel):
+    strip_fragments: bool = True
+    sort_query_params: bool = True
+    drop_tracking_params: bool = True  # utm_*, gclid, fbclid, ...
+    strip_trailing_slash: bool = False
 
 class ScrapyRequest(BaseModel):
     start_urls: list
@@ -22,6 +95,16 @@ class ScrapyRequest(BaseModel):
     follow_external: bool = False
     depth_limit: int = 2
     concurrent_requests: int = 16
+    include_patterns: Optional[List[str]] = None  # Only follow links matching one of these regexes
+    exclude_patterns: Optional[List[str]] = None  # Never follow links matching one of these regexes
+    url_canonicalization: UrlCanonicalization = UrlCanonicalization()
+    extract_content: bool = False  # Store each page's title/text/html in the same pass, no content crawl needed
+    near_duplicates: Optional[Literal['mark', 'skip', 'off']] = None  # Overrides NEAR_DUPLICATE_ACTION
+    sitemap_discovery: bool = False  # Take the pages from robots.txt/sitemap.xml instead of crawling links
+    sitemap_fallback: bool = True  # Crawl links when the sitemaps list no page
+    distributed: bool = False  # Share the crawl's frontier with workers joining it from other processes/nodes
+    priority: int = 0  # Higher-priority crawls leave the queue first
+    tenant: Optional[str] = None  # Crawls are spread fairly across tenants
 
 class UrlAndId(BaseModel):
     url: str
@@ -30,103 +113,134 @@ class UrlAndId(BaseModel):
 class CrawlContentRequest(BaseModel):
     urls_and_ids: List[UrlAndId]
     delay: float = 0.0  # Delay in seconds between concurrent runs
+    priority: int = 0
+    tenant: Optional[str] = None
+
+class PendingContentCrawlRequest(BaseModel):
+    delay: float = 0.0
+    priority: int = 0
+    tenant: Optional[str] = None
 
 class CrawlControlRequest(BaseModel):
     crawl_id: str
 
 @app.post("/crawl-url/")
-def crawl_url(scrapy_request: ScrapyRequest):
+async def crawl_url(scrapy_request: ScrapyRequest, db: AsyncSession = Depends(database.get_async_db)):
+    # Reject bad link filter regexes here rather than in the crawler
+    for pattern in (scrapy_request.include_patterns or []) + (scrapy_request.exclude_patterns or []):
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid pattern {pattern!r}: {e}")
+
     # Generate a unique identifier for this crawl session
     crawl_id = str(uuid4())
     
+    # Crawl options are stored with the session so a resumed crawl behaves the same
+    options = {
+        "follow_external": scrapy_request.follow_external,
+        "depth_limit": scrapy_request.depth_limit,
+        "concurrent_requests": scrapy_request.concurrent_requests,
+        "include_patterns": scrapy_request.include_patterns,
+        "exclude_patterns": scrapy_request.exclude_patterns,
+        "url_canonicalization": scrapy_request.url_canonicalization.dict(),
+        "extract_content": scrapy_request.extract_content,
+        "near_duplicates": scrapy_request.near_duplicates,
+        "sitemap_discovery": scrapy_request.sitemap_discovery,
+        "sitemap_fallback": scrapy_request.sitemap_fallback,
+        "distributed": scrapy_request.distributed,
+    }
+
     # Create a crawl session in the database
-    db = next(database.get_db())
     crawl_session = schemas.CrawlSessionCreate(
         crawl_id=crawl_id,
-        spider_name='url_spider',
+        spider_name='distributed_url_spider' if scrapy_request.distributed else 'url_spider',
         crawl_type='url_crawl',  # Add this line
         start_urls=scrapy_request.start_urls,
-        max_links=scrapy_request.max_links
+        max_links=scrapy_request.max_links,
+        options=options
     )
-    cruds.create_crawl_session(db, crawl_session)
-    db.close()
+    async_cruds.create_crawl_session(db, crawl_session)
     
-    # Serialize the request data to a JSON string
-    request_data = json.dumps({
+    request_data = {
         "crawl_id": crawl_id,
         "start_urls": scrapy_request.start_urls,
         "max_links": scrapy_request.max_links,
-        "follow_external": scrapy_request.follow_external,
-        "depth_limit": scrapy_request.depth_limit,
-        "concurrent_requests": scrapy_request.concurrent_requests
-    })
+        **options
+    }
 
-    # Path to run_crawler.py
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    script_path = os.path.join(script_dir, 'run_crawler.py')
-
-    # Start the crawler process
-    process = subprocess.Popen([sys.executable, script_path, request_data], cwd=script_dir)
-    pid = process.pid
-
-    # Update the CrawlSession with the PID
-    db = next(database.get_db())
-    cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(pid=pid))
-    db.close()
+    # Start the crawler; the session and its job are committed together
+    await start_crawler(db, request_data, priority=scrapy_request.priority, tenant=scrapy_request.tenant)
 
     return {"message": "Crawling started", "crawl_id": crawl_id}
 
 @app.post("/pause-crawl/")
-def pause_crawl(request: CrawlControlRequest):
+async def pause_crawl(request: CrawlControlRequest, db: AsyncSession = Depends(database.get_async_db)):
     crawl_id = request.crawl_id
-    db = next(database.get_db())
-    crawl_session = cruds.get_crawl_session(db, crawl_id)
+    crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
+    # A running crawl is stopped gracefully: it stays 'pausing' while its in-flight requests
+    # finish, then the spider persists its queue (JOBDIR) and marks itself 'paused'
+    if crawl_session and crawler_pool is not None:
+        # A queued crawl is just taken off the queue; a running one is stopped in its worker
+        # (the PID belongs to a shared worker, so only this crawl's spider is stopped)
+        if await async_cruds.cancel_queued_crawl_job(db, crawl_id):
+            await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='paused', pid=None))
+            await db.commit()
+            return {"message": f"Crawl {crawl_id} paused"}
+        if crawler_pool.stop_crawl(crawl_id):
+            await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='pausing'))
+            await db.commit()
+            return {"message": f"Crawl {crawl_id} pausing"}
+        raise HTTPException(status_code=404, detail="Crawl not found or not running")
     if crawl_session and crawl_session.pid:
         pid = crawl_session.pid
         try:
-            os.kill(pid, signal.SIGTERM)  # Terminate the process
-            # Update the crawl session status to 'paused' and clear the PID
-            cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='paused', pid=None))
-            db.close()
-            return {"message": f"Crawl {crawl_id} paused"}
+            os.kill(pid, signal.SIGTERM)  # Scrapy shuts down gracefully on the first SIGTERM
+            await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='pausing'))
+            await db.commit()
+            return {"message": f"Crawl {crawl_id} pausing"}
         except Exception as e:
-            db.close()
             raise HTTPException(status_code=500, detail=str(e))
     else:
-        db.close()
         raise HTTPException(status_code=404, detail="Crawl not found or PID not available")
 
 
 @app.post("/resume-crawl/")
-def resume_crawl(request: CrawlControlRequest):
+async def resume_crawl(request: CrawlControlRequest, db: AsyncSession = Depends(database.get_async_db)):
     crawl_id = request.crawl_id
 
     # Retrieve the session from the database
-    db = next(database.get_db())
-    crawl_session = cruds.get_crawl_session(db, crawl_id)
-    db.close()
+    crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
 
+    if crawl_session and crawl_session.status == "pausing":
+        # Resuming before the queue is persisted would fetch the in-flight requests twice
+        raise HTTPException(status_code=409, detail="Crawl is still pausing; retry once it is paused")
     if crawl_session and crawl_session.status == "paused":
-        # Load start_urls as JSON
-        start_urls = json.loads(crawl_session.start_urls)  # Should work if stored as JSON
-        request_data = json.dumps({
-            "crawl_id": crawl_id,
-            "start_urls": start_urls,
-            "max_links": crawl_session.max_links,
-            "visited_links": pickle.loads(crawl_session.visited_links),
-            "pending_urls": pickle.loads(crawl_session.pending_urls)
-        })
-
-        # Start the crawler process
-        script_dir = os.path.dirname(os.path.realpath(__file__))
-        script_path = os.path.join(script_dir, 'run_crawler.py')
-        process = subprocess.Popen([sys.executable, script_path, request_data], cwd=script_dir)
-        
-        # Update the CrawlSession with the new PID
-        pid = process.pid
-        db = next(database.get_db())
-        cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(pid=pid, status="running"))
-        db.close()
+        options = json.loads(crawl_session.options) if crawl_session.options else {}
+        if crawl_session.crawl_type == 'content_crawl':
+            # ContentSpider resumes from the row it had reached
+            request_data = {"crawl_id": crawl_id, "crawl_type": "content_crawl", "resume": True, **options}
+        else:
+            # Load start_urls as JSON
+            start_urls = json.loads(crawl_session.start_urls)  # Should work if stored as JSON
+            request_data = {
+                "crawl_id": crawl_id,
+                "start_urls": start_urls,
+                "max_links": crawl_session.max_links,
+                "resume": True,
+                **options
+            }  # The spider rebuilds visited/pending URLs from the checkpoint log
+        # Either way, the requests queued when it paused come back from its JOBDIR
+
+        # Start the crawler, keeping the priority and tenant of the original job
+        last_job = await async_cruds.get_latest_crawl_job(db, crawl_id)
+        await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status="running"))
+        await start_crawler(
+            db,
+            request_data,
+            priority=last_job.priority if last_job else 0,
+            tenant=last_job.tenant if last_job else None
+        )
 
         return {"message": f"Crawl {crawl_id} resumed"}
     else:
@@ -136,7 +250,7 @@ def resume_crawl(request: CrawlControlRequest):
 # crawler_backend/app/main.py
 
 @app.post("/crawl-content/")
-def crawl_content(crawl_request: CrawlContentRequest):
+async def crawl_content(crawl_request: CrawlContentRequest, db: AsyncSession = Depends(database.get_async_db)):
     # Generate a unique identifier for this crawl session
     crawl_id = str(uuid4())
 
@@ -145,35 +259,288 @@ def crawl_content(crawl_request: CrawlContentRequest):
     urls = [item['url'] for item in urls_and_ids]
 
     # Create a crawl session in the database
-    db = next(database.get_db())
     crawl_session = schemas.CrawlSessionCreate(
         crawl_id=crawl_id,
         spider_name='content_spider',
         crawl_type='content_crawl',
         start_urls=urls,
-        max_links=None
+        max_links=None,
+        options={"delay": crawl_request.delay}
     )
-    cruds.create_crawl_session(db, crawl_session)
-    db.close()
+    async_cruds.create_crawl_session(db, crawl_session)
+    # The spider pages through the rows in the database instead of getting them on its command line
+    await async_cruds.add_content_crawl_targets(db, crawl_id, [item['id'] for item in urls_and_ids])
 
-    # Serialize the request data to a JSON string
-    request_data = json.dumps({
+    request_data = {
         "crawl_id": crawl_id,
-        "urls_and_ids": urls_and_ids,
+        "crawl_type": "content_crawl",
         "delay": crawl_request.delay
-    })
+    }
 
-    # Get the absolute path to run_crawler.py
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    script_path = os.path.join(script_dir, 'run_crawler.py')
+    # Start the crawler; the session and its job are committed together
+    await start_crawler(db, request_data, priority=crawl_request.priority, tenant=crawl_request.tenant,
+                        domain=urlsplit(urls[0]).hostname if urls else None)
 
-    # Start the crawler process
-    process = subprocess.Popen([sys.executable, script_path, request_data], cwd=script_dir)
-    pid = process.pid
+    return {"message": "Content crawling started", "crawl_id": crawl_id}
 
-    # Update the CrawlSession with the PID
-    db = next(database.get_db())
-    cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(pid=pid))
-    db.close()
+async def read_ndjson_lines(request: Request):
+    # Yield the lines of a streamed request body one at a time, without buffering the whole upload
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > CONTENT_BULK_MAX_LINE_BYTES:
+            raise HTTPException(status_code=400, detail="Line too long")
+        for line in lines:
+            yield line
+    yield buffer
 
-    return {"message": "Content crawling started", "crawl_id": crawl_id}
+@app.post("/crawl-content/bulk")
+async def crawl_content_bulk(request: Request, delay: float = 0.0, priority: int = 0, tenant: Optional[str] = None,
+                             db: AsyncSession = Depends(database.get_async_db)):
+    # Content crawl of a large list of rows uploaded as NDJSON, one {"id": ...} (an existing
+    # WebsiteData row) or {"url": ...} (looked up, or added as a new row) per line. The
+    # upload is read and written in batches, each committed on its own so running crawlers
+    # aren't locked out of the database for the whole upload; the session stays 'pending'
+    # until the last batch is in.
+    crawl_id = str(uuid4())
+    async_cruds.create_crawl_session(db, schemas.CrawlSessionCreate(
+        crawl_id=crawl_id,
+        spider_name='content_spider',
+        crawl_type='content_crawl',
+        start_urls=[],
+        max_links=None,
+        options={"delay": delay}
+    ), status='pending')
+    await db.commit()  # Rows created for uploaded URLs reference the session
+
+    ids, urls = [], []
+    line_count = 0
+    domain = None
+
+    async def write_batch():
+        if urls:
+            ids.extend((await async_cruds.get_or_create_website_data_ids(db, urls, crawl_id)).values())
+        await async_cruds.add_content_crawl_targets(db, crawl_id, ids)
+        await db.commit()
+        ids.clear()
+        urls.clear()
+
+    try:
+        async for line in read_ndjson_lines(request):
+            line = line.strip()
+            if not line:
+                continue
+            line_count += 1
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Line {line_count}: invalid JSON")
+            if isinstance(item, dict) and isinstance(item.get('id'), int):
+                ids.append(item['id'])
+            elif isinstance(item, dict) and isinstance(item.get('url'), str):
+                url = content_bulk_canonicalizer.canonicalize(item['url'])
+                urls.append(url)
+                domain = domain or urlsplit(url).hostname
+            else:
+                raise HTTPException(status_code=400, detail=f'Line {line_count}: expected {{"id": ...}} or {{"url": ...}}')
+            if len(ids) + len(urls) >= CONTENT_BULK_BATCH_SIZE:
+                await write_batch()
+        await write_batch()
+        if not line_count:
+            raise HTTPException(status_code=400, detail="Empty upload")
+    except Exception:
+        # The batches already committed stay with a session that never starts
+        await db.rollback()
+        await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='failed'))
+        await db.commit()
+        raise
+
+    request_data = {"crawl_id": crawl_id, "crawl_type": "content_crawl", "delay": delay}
+    await async_cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='running'))
+    await start_crawler(db, request_data, priority=priority, tenant=tenant, domain=domain)
+
+    return {"message": "Content crawling started", "crawl_id": crawl_id, "lines": line_count}
+
+@app.post("/crawl-content/pending")
+async def crawl_content_pending(crawl_request: PendingContentCrawlRequest, db: AsyncSession = Depends(database.get_async_db)):
+    # Content crawl of every WebsiteData row that hasn't been fetched yet (status=False).
+    # The rows are snapshotted as the crawl's targets in one INSERT ... SELECT, so rows added
+    # later are left to the next crawl.
+    crawl_id = str(uuid4())
+    options = {"delay": crawl_request.delay}
+    async_cruds.create_crawl_session(db, schemas.CrawlSessionCreate(
+        crawl_id=crawl_id,
+        spider_name='content_spider',
+        crawl_type='content_crawl',
+        start_urls=[],
+        max_links=None,
+        options=options
+    ))
+    pending_count = await async_cruds.add_pending_content_crawl_targets(db, crawl_id)
+    if not pending_count:
+        raise HTTPException(status_code=404, detail="No pending website data rows")
+
+    request_data = {"crawl_id": crawl_id, "crawl_type": "content_crawl", **options}
+    await start_crawler(db, request_data, priority=crawl_request.priority, tenant=crawl_request.tenant)
+
+    return {"message": "Content crawling started", "crawl_id": crawl_id, "rows": pending_count}
+
+@app.get("/crawl-queue/")
+async def crawl_queue(window_seconds: int = 3600, db: AsyncSession = Depends(database.get_async_db)):
+    # Queue depth and wait-time metrics of the crawl scheduler
+    if crawl_scheduler is None:
+        raise HTTPException(status_code=404, detail="Crawl queue is disabled (CRAWLER_POOL_WORKERS=0)")
+    counts, oldest_queued, waits = await async_cruds.get_crawl_queue_stats(
+        db, datetime.now() - timedelta(seconds=window_seconds))
+    return summarize_queue_stats(counts, oldest_queued, waits, window_seconds, crawl_scheduler.max_concurrent)
+
+async def crawl_status(db: AsyncSession, crawl_session):
+    status = {
+        "crawl_id": crawl_session.crawl_id,
+        "status": crawl_session.status,
+        "spider_name": crawl_session.spider_name,
+        "link_count": crawl_session.link_count,
+        "max_links": crawl_session.max_links,
+        "created_at": crawl_session.created_at.isoformat() if crawl_session.created_at else None,
+        "stats_updated_at": crawl_session.stats_updated_at.isoformat() if crawl_session.stats_updated_at else None,
+        "stats": json.loads(crawl_session.stats) if crawl_session.stats else None,
+    }
+    if crawl_session.options and json.loads(crawl_session.options).get('distributed'):
+        # The shared frontier across all the crawl's workers, live
+        status["frontier"] = await async_cruds.get_frontier_counts(db, crawl_session.crawl_id)
+    return status
+
+@app.get("/crawl-status/{crawl_id}")
+async def get_crawl_status(crawl_id: str, db: AsyncSession = Depends(database.get_async_db)):
+    # Latest progress snapshot saved by the crawler (every CRAWL_PROGRESS_INTERVAL seconds)
+    crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
+    if crawl_session is None:
+        raise HTTPException(status_code=404, detail="Crawl session not found")
+    return await crawl_status(db, crawl_session)
+
+@app.get("/crawl-status/{crawl_id}/stream")
+async def stream_crawl_status(crawl_id: str, request: Request):
+    # Server-sent events: one event per new snapshot, until the crawl stops (or finishes pausing).
+    # Each check takes a pooled session only briefly instead of holding one per client.
+    async def events():
+        last_status = None
+        while not await request.is_disconnected():
+            async with database.AsyncSessionLocal() as db:
+                crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
+                status = await crawl_status(db, crawl_session) if crawl_session is not None else None
+            if crawl_session is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Crawl session not found'})}\n\n"
+                return
+            if status != last_status:
+                yield f"data: {json.dumps(status)}\n\n"
+                last_status = status
+            else:
+                yield ": keep-alive\n\n"
+            if crawl_session.status not in ('running', 'pausing'):
+                return
+            await asyncio.sleep(CRAWL_STATUS_STREAM_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/crawl-results/{crawl_id}")
+async def crawl_results(crawl_id: str, after_id: int = 0, limit: int = CRAWL_RESULTS_DEFAULT_LIMIT,
+                        fields: str = CRAWL_RESULTS_DEFAULT_FIELDS, db: AsyncSession = Depends(database.get_async_db)):
+    # One keyset page of a crawl's rows in id order, streamed as NDJSON. Pass the id of the
+    # last row as after_id for the next page; a page shorter than `limit` is the last one.
+    # Only the requested fields are read, so html/text are neither loaded nor decompressed
+    # unless asked for.
+    field_list = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in field_list if field not in async_cruds.RESULT_FIELD_COLUMNS]
+    if unknown or not field_list:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}; choose from {list(async_cruds.RESULT_FIELD_COLUMNS)}")
+    if not 1 <= limit <= CRAWL_RESULTS_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {CRAWL_RESULTS_MAX_LIMIT}")
+    crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
+    if crawl_session is None:
+        raise HTTPException(status_code=404, detail="Crawl session not found")
+    content_crawl = crawl_session.crawl_type == 'content_crawl'
+    content_fields = [field for field in ('html', 'text') if field in field_list]
+
+    async def rows():
+        # Its own session, since the response is streamed after the endpoint returns
+        async with database.AsyncSessionLocal() as db:
+            result = await async_cruds.stream_crawl_results(db, crawl_id, content_crawl, field_list, after_id, limit)
+            async for chunk in result.mappings().partitions(CRAWL_RESULTS_CHUNK_SIZE):
+                contents = {}
+                if content_fields:
+                    blob_ids = [row[f"{field}_blob_id"] for row in chunk for field in content_fields]
+                    contents = await db.run_sync(content_store.load_contents, blob_ids)
+                lines = []
+                for row in chunk:
+                    record = {}
+                    for field in field_list:
+                        value = row[field]
+                        if field in content_fields and row[f"{field}_blob_id"] is not None:
+                            value = contents[row[f"{field}_blob_id"]]
+                        elif isinstance(value, datetime):
+                            value = value.isoformat()
+                        record[field] = value
+                    lines.append(json.dumps(record) + "\n")
+                yield "".join(lines)
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+@app.get("/crawl-results/{crawl_id}/export")
+async def export_crawl_results(crawl_id: str, format: str = "jsonl", fields: Optional[str] = None,
+                               db: AsyncSession = Depends(database.get_async_db)):
+    # The whole crawl as one download: gzipped JSONL (optionally projected to `fields`),
+    # Parquet (text only) or WARC (HTML). Rows are streamed from a server-side cursor and
+    # written in chunks, so memory doesn't grow with the crawl.
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format; choose from {list(export.EXPORT_FORMATS)}")
+    if format == "parquet" and export.pyarrow is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed")
+    field_list = None
+    if fields:
+        if format != "jsonl":
+            raise HTTPException(status_code=400, detail="fields only applies to the jsonl format")
+        field_list = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in field_list if field not in async_cruds.RESULT_FIELD_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}")
+    crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
+    if crawl_session is None:
+        raise HTTPException(status_code=404, detail="Crawl session not found")
+    content_crawl = crawl_session.crawl_type == 'content_crawl'
+
+    def body():
+        # A plain generator with a sync session: Starlette iterates it in its thread pool
+        export_db = database.SessionLocal()
+        try:
+            yield from export.export_crawl(export_db, crawl_id, content_crawl, format, field_list)
+        finally:
+            export_db.close()
+
+    extension, media_type = export.EXPORT_FORMATS[format]
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{crawl_id}.{extension}"'})
+
+@app.get("/search")
+async def search(q: str, crawl_id: Optional[str] = None, limit: int = 20, offset: int = 0,
+                 db: AsyncSession = Depends(database.get_async_db)):
+    # Full-text search over the title and text of fetched pages, best matches first, with a
+    # snippet of each match. crawl_id limits the results to the pages of one crawl.
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    if not 1 <= limit <= SEARCH_MAX_LIMIT or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_LIMIT}, offset at least 0")
+    content_crawl = False
+    if crawl_id is not None:
+        crawl_session = await async_cruds.get_crawl_session(db, crawl_id)
+        if crawl_session is None:
+            raise HTTPException(status_code=404, detail="Crawl session not found")
+        content_crawl = crawl_session.crawl_type == 'content_crawl'
+    results = await async_cruds.search_website_data(db, q, crawl_id, content_crawl, limit, offset)
+    return {"query": q, "offset": offset, "results": results}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def crawl_metrics(db: AsyncSession = Depends(database.get_async_db)):
+    # Prometheus text format, one series per running crawl
+    crawl_sessions = await async_cruds.get_running_crawl_sessions(db)
+    return PlainTextResponse(metrics.format_prometheus(crawl_sessions), media_type="text/plain; version=0.0.4")
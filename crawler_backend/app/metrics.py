@@ -0,0 +1,55 @@
+import json
+
+# Prometheus text exposition of the progress snapshots of the running crawls
+
+METRICS = [
+    # (metric name, type, help, function of the snapshot)
+    ("crawler_pages_fetched_total", "counter", "Responses received", lambda s: s.get("pages_fetched")),
+    ("crawler_pages_saved_total", "counter", "Pages saved to the database", lambda s: s.get("pages_saved")),
+    ("crawler_response_bytes_total", "counter", "Response bytes received", lambda s: s.get("bytes")),
+    ("crawler_pages_per_second", "gauge", "Responses per second over the last interval", lambda s: s.get("pages_per_second")),
+    ("crawler_bytes_per_second", "gauge", "Response bytes per second over the last interval", lambda s: s.get("bytes_per_second")),
+    ("crawler_queue_depth", "gauge", "Requests waiting to be downloaded", lambda s: s.get("queued")),
+    ("crawler_requests_in_progress", "gauge", "Requests being downloaded", lambda s: s.get("in_progress")),
+    ("crawler_eta_seconds", "gauge", "Estimated seconds until the crawl finishes", lambda s: s.get("eta_seconds")),
+]
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus(crawl_sessions):
+    snapshots = []
+    for crawl_session in crawl_sessions:
+        snapshot = json.loads(crawl_session.stats) if crawl_session.stats else {}
+        labels = f'crawl_id="{escape_label(crawl_session.crawl_id)}",spider="{escape_label(crawl_session.spider_name)}"'
+        snapshots.append((labels, snapshot))
+
+    lines = [
+        "# HELP crawler_active_crawls Crawls currently running",
+        "# TYPE crawler_active_crawls gauge",
+        f"crawler_active_crawls {len(snapshots)}",
+    ]
+    for name, metric_type, help_text, value_of in METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, snapshot in snapshots:
+            value = value_of(snapshot)
+            if value is not None:
+                lines.append(f"{name}{{{labels}}} {value}")
+
+    lines.append("# HELP crawler_errors_total Errors by kind (download, http, spider)")
+    lines.append("# TYPE crawler_errors_total counter")
+    for labels, snapshot in snapshots:
+        for kind, count in snapshot.get("errors", {}).items():
+            lines.append(f'crawler_errors_total{{{labels},kind="{kind}"}} {count}')
+
+    lines.append("# HELP crawler_download_latency_seconds Download latency over the last interval")
+    lines.append("# TYPE crawler_download_latency_seconds gauge")
+    for labels, snapshot in snapshots:
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+            value = snapshot.get("latency", {}).get(key)
+            if value is not None:
+                lines.append(f'crawler_download_latency_seconds{{{labels},quantile="{quantile}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, PickleType
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, PickleType, LargeBinary, ForeignKey, Index
 from datetime import datetime
 from app.database import Base
 
@@ -8,11 +8,38 @@ class WebsiteData(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     website_url = Column(String, index=True)          # Website URL
-    title = Column(String, index=True)                # Title of the website
-    status = Column(Boolean, default=False, index=True)  # Success/Failure status
+    title = Column(String)                            # Title of the website
+    status = Column(Boolean, default=False)           # Success/Failure status
+    crawl_id = Column(String, ForeignKey('crawl_session.crawl_id'), nullable=True)  # Crawl that discovered the page
     created_at = Column(DateTime, default=datetime.now, index=True)  # When the data was crawled
-    html = Column(Text)                               # Full HTML content
-    text = Column(Text)                               # Extracted text content
+    html = Column(Text)                               # Full HTML content (rows written before the content store)
+    text = Column(Text)                               # Extracted text content (rows written before the content store)
+    html_blob_id = Column(Integer, ForeignKey('content_blob.id'), nullable=True)  # Compressed HTML in the content store
+    text_blob_id = Column(Integer, ForeignKey('content_blob.id'), nullable=True)  # Compressed text in the content store
+    etag = Column(String, nullable=True)  # Validators of the last fetch, sent back on re-crawls
+    last_modified = Column(String, nullable=True)
+    body_hash = Column(String(64), nullable=True)  # SHA-256 of the last fetched response body
+    lastmod = Column(DateTime, nullable=True)  # <lastmod> of the page in the sitemap it was discovered from (UTC)
+
+    __table_args__ = (
+        # The pages of a crawl and the pending (status=False) pages, both read in id order (keyset pagination)
+        Index('ix_website_data_crawl_id_id', 'crawl_id', 'id'),
+        Index('ix_website_data_status_id', 'status', 'id'),
+    )
+
+class ContentBlob(Base):
+    __tablename__ = "content_blob"
+
+    # Compressed page bodies, stored once per distinct content hash and shared by every row that has them
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True)  # SHA-256 of the uncompressed UTF-8 content
+    codec = Column(String(8))  # 'zstd', 'gzip' or 'none'
+    size = Column(Integer)  # Uncompressed size in bytes
+    stored_size = Column(Integer)  # Compressed size in bytes
+    data = Column(LargeBinary, nullable=True)  # Compressed content, unless offloaded to the filesystem
+    path = Column(String, nullable=True)  # File under CONTENT_STORE_DIR holding the compressed content
+    refs = Column(Integer, default=0)  # WebsiteData columns pointing here; the blob is deleted at 0
+    created_at = Column(DateTime, default=datetime.now)
 
 class CrawlSession(Base):
     __tablename__ = "crawl_session"
@@ -26,7 +53,94 @@ class CrawlSession(Base):
     crawl_type = Column(String)
     start_urls = Column(Text)  # JSON serialized list
     max_links = Column(Integer, nullable=True)
+    options = Column(Text, nullable=True)  # JSON serialized crawl options, reapplied on resume
     request_queue = Column(PickleType)  # Serialized request queue
     visited_links = Column(PickleType)  # Serialized set of visited URLs
     pending_urls = Column(PickleType)
-    link_count = Column(Integer, default=0)
\ No newline at end of file
+    link_count = Column(Integer, default=0)
+    stats = Column(Text, nullable=True)  # JSON snapshot of the crawl's progress, refreshed while it runs
+    stats_updated_at = Column(DateTime, nullable=True)
+    cursor = Column(Integer, nullable=True)  # Content crawls: WebsiteData id up to which every row has been fetched
+
+class ContentCrawlTarget(Base):
+    __tablename__ = "content_crawl_target"
+
+    # The WebsiteData rows a content crawl fetches; ContentSpider pages through them by row id
+    id = Column(Integer, primary_key=True, index=True)
+    crawl_id = Column(String)
+    website_data_id = Column(Integer, ForeignKey('website_data.id'))
+    done = Column(Boolean, default=False)  # Set in the transaction that writes the row's fetch
+
+    __table_args__ = (
+        # Keyset pagination per crawl; a row listed twice is only fetched once
+        Index('ix_content_crawl_target_crawl_row', 'crawl_id', 'website_data_id', unique=True),
+    )
+
+class PageSignature(Base):
+    __tablename__ = "page_signature"
+
+    # SimHash of every page a crawl fetched; replayed on resume to rebuild its near-duplicate index
+    id = Column(Integer, primary_key=True, index=True)
+    crawl_id = Column(String)
+    url = Column(Text)
+    website_data_id = Column(Integer, ForeignKey('website_data.id'), nullable=True)  # Content crawls only
+    signature = Column(BigInteger)  # 64-bit SimHash, stored signed
+    duplicate_of = Column(Text, nullable=True)  # URL of the earlier page of the crawl this one nearly duplicates
+
+    __table_args__ = (
+        Index('ix_page_signature_crawl_id_id', 'crawl_id', 'id'),
+    )
+
+class CrawlCheckpoint(Base):
+    __tablename__ = "crawl_checkpoint"
+
+    # Append-only log of frontier changes; replayed in order to rebuild the state on resume
+    id = Column(Integer, primary_key=True, index=True)
+    crawl_id = Column(String, index=True)
+    url = Column(Text)
+    visited = Column(Boolean, default=False)  # False when discovered, True once fetched
+    depth = Column(Integer, default=0)  # Link depth from the start URLs, so resumed crawls keep the depth limit
+
+class CrawlFrontierUrl(Base):
+    __tablename__ = "crawl_frontier"
+
+    # Shared frontier of distributed URL crawls: workers on any node lease batches of pending
+    # URLs, and leases that expire (a worker died) are handed out again
+    id = Column(Integer, primary_key=True, index=True)
+    crawl_id = Column(String)
+    url = Column(Text)
+    fingerprint = Column(BigInteger)  # 64-bit URL fingerprint (signed); a URL is queued once per crawl
+    depth = Column(Integer, default=0)
+    status = Column(String, default='pending')  # 'pending', 'leased', 'done', 'failed'
+    lease_owner = Column(String, nullable=True)  # Worker holding the lease
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)  # Leases handed out; URLs that keep outliving theirs end up failed
+
+    __table_args__ = (
+        Index('ix_crawl_frontier_crawl_fingerprint', 'crawl_id', 'fingerprint', unique=True),
+        # Workers lease the oldest pending URLs first
+        Index('ix_crawl_frontier_crawl_status_id', 'crawl_id', 'status', 'id'),
+    )
+
+class CrawlJob(Base):
+    __tablename__ = "crawl_job"
+
+    id = Column(Integer, primary_key=True, index=True)
+    crawl_id = Column(String, index=True)
+    status = Column(String, default='queued')  # 'queued', 'dispatched', 'running', 'finished', 'failed', 'cancelled'
+    priority = Column(Integer, default=0)  # Higher runs first
+    tenant = Column(String, nullable=True)
+    domain = Column(String, nullable=True)
+    request_data = Column(Text)  # JSON serialized run_crawler.py request data
+    attempts = Column(Integer, default=0)
+    worker_pid = Column(Integer, nullable=True)
+    enqueued_at = Column(DateTime, default=datetime.now)
+    dispatched_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)  # Why a failed job failed
+
+    __table_args__ = (
+        # The scheduler scans queued jobs by priority and age
+        Index('ix_crawl_job_status_priority', 'status', 'priority', 'enqueued_at'),
+    )
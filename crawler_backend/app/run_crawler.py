@@ -1,6 +1,8 @@
 import sys
 import os
 import json
+import logging
+import shutil
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings  # <-- Import here
 
@@ -9,50 +11,138 @@ project_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 sys.path.append(project_root)
 
 # Now imports from app should work
-from app.web_scraper.spiders.web_spider import UrlSpider, ContentSpider
+from app.web_scraper.spiders.web_spider import UrlSpider, DistributedUrlSpider, ContentSpider
+from app.database import SessionLocal
+from app import cruds
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("No arguments provided.")
-        sys.exit(1)
+def resolve_request_data(request_data):
+    # A worker joining a distributed crawl only needs its crawl_id; the start URLs, budget
+    # and options come from its session
+    if not request_data.get('distributed') or 'start_urls' in request_data:
+        return request_data
+    db = SessionLocal()
+    try:
+        crawl_session = cruds.get_crawl_session(db, request_data['crawl_id'])
+    finally:
+        db.close()
+    if crawl_session is None:
+        return request_data
+    options = json.loads(crawl_session.options) if crawl_session.options else {}
+    return {
+        **options,
+        "start_urls": json.loads(crawl_session.start_urls),
+        "max_links": crawl_session.max_links,
+        **request_data,
+    }
 
-    # Parse the JSON-encoded request data
-    request_data = json.loads(sys.argv[1])
-    crawl_id = request_data.get('crawl_id')
 
-    # Initialize the crawler process
-    process = CrawlerProcess(get_project_settings())
+def get_spider_args(request_data):
+    # Map the JSON request data to a spider class and its keyword arguments,
+    # shared by the command line entry point and the worker pool
+    crawl_id = request_data.get('crawl_id')
 
-    # Run the spider based on the request data
     if 'start_urls' in request_data:
-        # Run UrlSpider
-        process.crawl(
-            UrlSpider,
+        # Run UrlSpider, or one worker of a distributed crawl
+        spider_class = DistributedUrlSpider if request_data.get('distributed') else UrlSpider
+        return spider_class, dict(
             crawl_id=crawl_id,
             start_urls=request_data['start_urls'],
             max_links=request_data.get('max_links', 10),
             follow_external=request_data.get('follow_external', False),
             depth_limit=request_data.get('depth_limit', 2),
-            concurrent_requests=request_data.get('concurrent_requests', 16),
-            results=[]
+            include_patterns=request_data.get('include_patterns'),
+            exclude_patterns=request_data.get('exclude_patterns'),
+            url_canonicalization=request_data.get('url_canonicalization'),
+            extract_content=request_data.get('extract_content', False),
+            sitemap_discovery=request_data.get('sitemap_discovery', False),
+            sitemap_fallback=request_data.get('sitemap_fallback', True),
+            resume=request_data.get('resume', False)
         )
-    elif 'urls_and_ids' in request_data:
-        # Run ContentSpider
-        urls_and_ids = request_data['urls_and_ids']
-        delay = request_data.get('delay', 0.0)
-        process.crawl(
-            ContentSpider,
+    elif request_data.get('crawl_type') == 'content_crawl' or 'urls_and_ids' in request_data:
+        # Run ContentSpider; the API stores the rows to fetch in the database, the command
+        # line may still pass them inline as urls_and_ids
+        return ContentSpider, dict(
             crawl_id=crawl_id,
-            urls_and_ids=urls_and_ids,
-            results=[]
+            urls_and_ids=request_data.get('urls_and_ids'),
+            resume=request_data.get('resume', False)
         )
+    return None, None
+
+
+def get_crawl_settings(request_data, project_settings):
+    # Scrapy settings overridden per crawl by the request data
+    settings = {}
+    if request_data.get('crawl_id') and not request_data.get('distributed'):
+        # Each crawl persists its scheduler queue in its own job directory, so a paused
+        # crawl resumes with the requests that were queued when it stopped. Distributed
+        # crawls keep theirs in the shared frontier table.
+        settings['JOBDIR'] = os.path.join(project_settings.get('CRAWL_JOBDIR_ROOT'), request_data['crawl_id'])
+    if request_data.get('concurrent_requests'):
+        concurrent_requests = int(request_data['concurrent_requests'])
+        settings['CONCURRENT_REQUESTS'] = concurrent_requests
+        settings['CONCURRENT_REQUESTS_PER_DOMAIN'] = concurrent_requests
+    if request_data.get('near_duplicates'):
+        settings['NEAR_DUPLICATE_ACTION'] = request_data['near_duplicates']
+    if request_data.get('delay'):
+        settings['DOWNLOAD_DELAY'] = float(request_data['delay'])
+    return settings
+
+
+def prepare_jobdir(settings):
+    # Scrapy writes the JOBDIR queue and spider state only when the crawl closes cleanly.
+    # The marker is removed then, so finding it means the last run was killed and the
+    # directory still holds the state of an earlier pause: drop it, and let the spider
+    # restart from the cursor and checkpoints it keeps in the database.
+    jobdir = settings.get('JOBDIR')
+    if not jobdir:
+        return
+    marker = os.path.join(jobdir, 'running')
+    if os.path.exists(marker):
+        logging.getLogger(__name__).warning(f"Discarding the stale job directory {jobdir} of a crawl that died")
+        shutil.rmtree(jobdir, ignore_errors=True)
+    os.makedirs(jobdir, exist_ok=True)
+    open(marker, 'w').close()
+
+
+def cleanup_crawl(crawler):
+    # A crawl that ran to the end has nothing left to resume; drop its job directory.
+    # A paused one keeps it, without the marker of a running crawl.
+    jobdir = crawler.settings.get('JOBDIR')
+    if not jobdir:
+        return
+    if crawler.stats.get_value('finish_reason') in ('finished', 'max_links_reached'):
+        shutil.rmtree(jobdir, ignore_errors=True)
     else:
+        try:
+            os.remove(os.path.join(jobdir, 'running'))
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("No arguments provided.")
+        sys.exit(1)
+
+    # Parse the JSON-encoded request data
+    request_data = resolve_request_data(json.loads(sys.argv[1]))
+    spider_class, spider_args = get_spider_args(request_data)
+    if spider_class is None:
         print("Invalid request data.")
         sys.exit(1)
 
-    # Start the crawling process
+    # Initialize the crawler process and run the spider
+    settings = get_project_settings()
+    settings.setdict(get_crawl_settings(request_data, settings), priority='cmdline')
+    prepare_jobdir(settings)
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(spider_class)
+    process.crawl(crawler, **spider_args)
+
+    # Start the crawling process; SIGTERM (pause) stops it gracefully, draining in-flight requests
     process.start()
+    cleanup_crawl(crawler)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,160 @@
+# crawler_backend/app/scheduler.py
+
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from app import cruds, database, schemas
+
+logger = logging.getLogger(__name__)
+
+# Cap on crawls dispatched to the worker pool at once (default: every worker slot)
+CRAWL_SCHEDULER_MAX_CONCURRENT = int(os.getenv("CRAWL_SCHEDULER_MAX_CONCURRENT", "0"))
+# Cap on concurrent crawls of the same domain, so one site can't take every slot
+CRAWL_SCHEDULER_MAX_PER_DOMAIN = int(os.getenv("CRAWL_SCHEDULER_MAX_PER_DOMAIN", "2"))
+CRAWL_SCHEDULER_POLL_INTERVAL = float(os.getenv("CRAWL_SCHEDULER_POLL_INTERVAL", "2"))
+# A job whose worker died is requeued until it has been dispatched this many times
+CRAWL_SCHEDULER_MAX_ATTEMPTS = int(os.getenv("CRAWL_SCHEDULER_MAX_ATTEMPTS", "3"))
+# A dispatched job no worker has picked up within this time is assumed lost
+CRAWL_SCHEDULER_DISPATCH_TIMEOUT = float(os.getenv("CRAWL_SCHEDULER_DISPATCH_TIMEOUT", "120"))
+
+
+class CrawlScheduler:
+    # Dispatches queued CrawlJob rows to the worker pool: highest priority first, then the
+    # tenant and domain with the fewest running crawls, then the oldest job. Jobs whose worker
+    # died are requeued as resumed crawls.
+
+    def __init__(self, pool, max_concurrent=None, max_per_domain=CRAWL_SCHEDULER_MAX_PER_DOMAIN,
+                 poll_interval=CRAWL_SCHEDULER_POLL_INTERVAL, max_attempts=CRAWL_SCHEDULER_MAX_ATTEMPTS):
+        self.pool = pool
+        self.max_concurrent = (max_concurrent or CRAWL_SCHEDULER_MAX_CONCURRENT
+                               or pool.max_workers * pool.max_crawls_per_worker)
+        self.max_per_domain = max_per_domain
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def start(self):
+        self.pool.on_event = self.handle_worker_event
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+
+    def notify(self):
+        # Called after a job is enqueued so it's dispatched without waiting for the next poll
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopping:
+            db = next(database.get_db())
+            try:
+                self.recover_jobs(db)
+                self.dispatch_jobs(db)
+            except Exception:
+                logger.exception("Crawl scheduler error")
+                db.rollback()
+            finally:
+                db.close()
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def recover_jobs(self, db):
+        # Requeue jobs whose worker process died, or that no worker picked up in time
+        live_workers = set(self.pool.reap_workers())
+        dispatch_deadline = datetime.now() - timedelta(seconds=CRAWL_SCHEDULER_DISPATCH_TIMEOUT)
+        for job in cruds.get_active_crawl_jobs(db):
+            if job.status == 'running' and job.worker_pid in live_workers:
+                continue
+            if job.status == 'dispatched' and job.dispatched_at and job.dispatched_at > dispatch_deadline:
+                continue
+            if job.attempts >= self.max_attempts:
+                cruds.transition_crawl_job(db, job.id, (job.status,), status='failed', finished_at=datetime.now(),
+                                           error=f"Worker lost {job.attempts} times")
+                cruds.update_crawl_session(db, job.crawl_id, schemas.CrawlSessionUpdate(status='failed', pid=None))
+                continue
+            # Restarted crawls pick up from their checkpoint instead of starting over
+            request_data = json.loads(job.request_data)
+            request_data['resume'] = True
+            cruds.transition_crawl_job(db, job.id, (job.status,), status='queued', worker_pid=None,
+                                       request_data=json.dumps(request_data))
+
+    def dispatch_jobs(self, db):
+        active = cruds.get_active_crawl_jobs(db)
+        free = self.max_concurrent - len(active)
+        if free <= 0:
+            return
+        running_by_tenant = Counter(job.tenant for job in active)
+        running_by_domain = Counter(job.domain for job in active)
+
+        candidates = cruds.get_queued_crawl_jobs(db, limit=max(100, free * 10))
+        while free > 0 and candidates:
+            eligible = [job for job in candidates
+                        if not job.domain or running_by_domain[job.domain] < self.max_per_domain]
+            if not eligible:
+                return
+            job = min(eligible, key=lambda j: (-j.priority, running_by_tenant[j.tenant],
+                                               running_by_domain[j.domain], j.enqueued_at))
+            candidates.remove(job)
+            if not cruds.transition_crawl_job(db, job.id, ('queued',), status='dispatched',
+                                              attempts=job.attempts + 1, dispatched_at=datetime.now()):
+                continue
+            self.pool.submit(json.loads(job.request_data))
+            running_by_tenant[job.tenant] += 1
+            running_by_domain[job.domain] += 1
+            free -= 1
+
+    def handle_worker_event(self, event, crawl_id, pid, error=None):
+        # Runs on the pool's event thread
+        db = next(database.get_db())
+        try:
+            job = cruds.get_active_crawl_job(db, crawl_id)
+            if job is None:
+                return
+            if event == 'started':
+                cruds.transition_crawl_job(db, job.id, ('dispatched',), status='running', worker_pid=pid,
+                                           started_at=datetime.now())
+                cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(pid=pid))
+            elif event == 'finished':
+                cruds.transition_crawl_job(db, job.id, cruds.ACTIVE_JOB_STATUSES, status='finished',
+                                           finished_at=datetime.now())
+            else:
+                # The spider didn't close normally, so the session still says it's running
+                cruds.transition_crawl_job(db, job.id, cruds.ACTIVE_JOB_STATUSES, status='failed',
+                                           finished_at=datetime.now(), error=error)
+                cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='failed', pid=None))
+        finally:
+            db.close()
+        self.wakeup.set()
+
+
+def summarize_queue_stats(counts, oldest_queued, waits, window_seconds, max_concurrent):
+    # Queue depth and wait times of the jobs started within the window
+    waits = sorted(waits)
+
+    def percentile(p):
+        return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else None
+
+    return {
+        "queue_depth": counts.get('queued', 0),
+        "active": sum(counts.get(status, 0) for status in cruds.ACTIVE_JOB_STATUSES),
+        "max_concurrent": max_concurrent,
+        "jobs_by_status": counts,
+        "oldest_queued_wait_seconds": (datetime.now() - oldest_queued).total_seconds() if oldest_queued else None,
+        "wait_seconds": {
+            "window_seconds": window_seconds,
+            "count": len(waits),
+            "mean": sum(waits) / len(waits) if waits else None,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "max": waits[-1] if waits else None,
+        },
+    }
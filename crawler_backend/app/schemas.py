@@ -55,10 +55,14 @@ class CrawlSessionCreate(BaseModel):
     crawl_type: str
     start_urls: List[str]
     max_links: Optional[int] = Field(default=None)
+    options: Optional[dict] = Field(default=None)
 
 class CrawlSessionUpdate(BaseModel):
     status: Optional[str] = None
     pid: Optional[int] = None
     request_queue: Optional[bytes] = None
     visited_links: Optional[bytes] = None
-    link_count: Optional[int] = None
\ No newline at end of file
+    link_count: Optional[int] = None
+    stats: Optional[str] = None
+    stats_updated_at: Optional[datetime] = None
+    cursor: Optional[int] = None
\ No newline at end of file
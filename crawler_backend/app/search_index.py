@@ -0,0 +1,236 @@
+# crawler_backend/app/search_index.py
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+import unicodedata
+
+from sqlalchemy import DDL, Integer, Text, column, event, func, literal_column, select, table, text, values
+from sqlalchemy.orm import Session
+
+from app import content_store, database
+from app.database import Base
+from app.models import WebsiteData, ContentCrawlTarget
+
+# Full-text index of the title and text of fetched pages, kept up to date in the transaction
+# that writes them. SQLite gets a contentless FTS5 table (bm25 ranking), Postgres a tsvector
+# column with a GIN index (ts_rank_cd, ts_headline). Neither keeps a copy of the text: the
+# snippets of a page of results are built from the content store (text_snippet on SQLite).
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration of the Postgres index
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "english")
+# Tokens around the matches in a snippet
+SEARCH_SNIPPET_TOKENS = 16
+
+fts_table = table('website_data_fts', column('rowid', Integer), column('title', Text), column('text', Text))
+tsvector_table = table('website_data_search', column('website_data_id', Integer), column('document'))
+
+# Contentless: FTS5 only stores the index. An entry is removed with FTS5's 'delete' command,
+# which needs the exact values it was indexed with.
+FTS_TABLE_DDL = ("CREATE VIRTUAL TABLE IF NOT EXISTS website_data_fts USING fts5("
+                 "title, text, content='', tokenize='unicode61 remove_diacritics 2')")
+
+def drop_stored_fts_table(target, connection, **kw):
+    # An FTS5 table created before the index was contentless holds a copy of the text, and
+    # takes no 'delete' command: it's dropped and created again, empty until `rebuild`
+    if connection.dialect.name != 'sqlite':
+        return
+    sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'website_data_fts'")).scalar()
+    if sql is not None and "content=''" not in sql:
+        logger.warning("Recreating the full-text index as a contentless table; "
+                       "run 'python -m app.search_index rebuild' to index the existing rows")
+        connection.execute(text("DROP TABLE website_data_fts"))
+
+# Created with the other tables by create_all; each statement only runs on its dialect
+event.listen(Base.metadata, 'after_create', drop_stored_fts_table)
+event.listen(Base.metadata, 'after_create', DDL(FTS_TABLE_DDL).execute_if(dialect='sqlite'))
+event.listen(Base.metadata, 'after_create', DDL(
+    "CREATE TABLE IF NOT EXISTS website_data_search ("
+    "website_data_id INTEGER PRIMARY KEY REFERENCES website_data (id), document TSVECTOR NOT NULL)"
+).execute_if(dialect='postgresql'))
+event.listen(Base.metadata, 'after_create', DDL(
+    "CREATE INDEX IF NOT EXISTS ix_website_data_search_document ON website_data_search USING GIN (document)"
+).execute_if(dialect='postgresql'))
+
+
+# Title and text the rows were indexed with, from their WebsiteData rows, for those in the index
+def indexed_documents(db: Session, ids: list):
+    rows = []
+    for i in range(0, len(ids), content_store.LOOKUP_CHUNK_SIZE):
+        rows += db.execute(
+            select(WebsiteData.id, WebsiteData.title, WebsiteData.text, WebsiteData.text_blob_id)
+            .join(fts_table, fts_table.c.rowid == WebsiteData.id)
+            .where(WebsiteData.id.in_(ids[i:i + content_store.LOOKUP_CHUNK_SIZE]))
+        ).all()
+    contents = content_store.load_contents(db, [row.text_blob_id for row in rows])
+    return [
+        {'id': row.id, 'title': row.title or '',
+         'text': (contents[row.text_blob_id] if row.text_blob_id is not None else row.text) or ''}
+        for row in rows
+    ]
+
+# Add or replace the index entries of rows given as dicts with id, title and text (caller
+# commits). Called before the rows are updated: on SQLite the entries they replace are
+# removed with the title and text still stored.
+def index_documents(db: Session, rows: list):
+    rows = [{'id': row['id'], 'title': row.get('title') or '', 'text': row.get('text') or ''} for row in rows]
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == 'sqlite':
+        replaced = indexed_documents(db, [row['id'] for row in rows])
+        if replaced:
+            db.execute(text(
+                "INSERT INTO website_data_fts (website_data_fts, rowid, title, text) VALUES ('delete', :id, :title, :text)"
+            ), replaced)
+        db.execute(text("INSERT INTO website_data_fts (rowid, title, text) VALUES (:id, :title, :text)"), rows)
+    elif dialect == 'postgresql':
+        # Title matches rank above text matches
+        db.execute(text(
+            "INSERT INTO website_data_search (website_data_id, document) VALUES (:id, "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :title), 'A') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :text), 'B')) "
+            "ON CONFLICT (website_data_id) DO UPDATE SET document = excluded.document"
+        ), [{**row, 'config': SEARCH_TS_CONFIG} for row in rows])
+
+
+def fts_match_query(query: str) -> str:
+    # Every word of the query must match, as an FTS5 string so quotes and operators in it are literal
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def fold_token(token: str) -> str:
+    # Case and diacritics folded as by the FTS5 unicode61 tokenizer
+    return "".join(c for c in unicodedata.normalize('NFKD', token.casefold()) if not unicodedata.combining(c))
+
+# SQLite: snippet of `text` for the query, like FTS5's snippet(): the SEARCH_SNIPPET_TOKENS
+# tokens holding the most matched words, matches in <b></b>, cuts marked with …
+def text_snippet(query: str, text: str) -> str:
+    words = {fold_token(word) for word in TOKEN_PATTERN.findall(query)}
+    tokens = list(TOKEN_PATTERN.finditer(text))
+    if not tokens:
+        return ""
+    matches = [i for i, token in enumerate(tokens) if fold_token(token.group()) in words]
+    start = 0
+    if matches:
+        best = -1
+        for match in matches:
+            first = max(0, min(match - SEARCH_SNIPPET_TOKENS // 4, len(tokens) - SEARCH_SNIPPET_TOKENS))
+            found = len({fold_token(tokens[i].group()) for i in matches if first <= i < first + SEARCH_SNIPPET_TOKENS})
+            if found > best:
+                start, best = first, found
+    window = tokens[start:start + SEARCH_SNIPPET_TOKENS]
+    matched = set(matches)
+    parts, position = [], window[0].start()
+    for i, token in enumerate(window, start):
+        parts.append(text[position:token.start()])
+        parts.append(f"<b>{token.group()}</b>" if i in matched else token.group())
+        position = token.end()
+    end = start + len(window) == len(tokens)
+    return ("" if start == 0 else "…") + "".join(parts) + (text[position:] if end else "…")
+
+# Statement for a page of search results, best first: id, website_url, title, crawl_id, score
+# and text_blob_id/text to build the snippet from. Results can be limited to the pages of a
+# crawl, as for its results.
+def search_statement(dialect: str, query: str, crawl_id: str = None, content_crawl: bool = False,
+                     limit: int = 20, offset: int = 0):
+    if dialect == 'sqlite':
+        fts = literal_column('website_data_fts')
+        # bm25 is lower for better matches; titles weigh more than text
+        score = func.bm25(fts, 4.0, 1.0)
+        statement = (
+            select(WebsiteData.id, WebsiteData.website_url, WebsiteData.title, WebsiteData.crawl_id,
+                   (-score).label('score'), WebsiteData.text, WebsiteData.text_blob_id)
+            .select_from(fts_table)
+            .join(WebsiteData, WebsiteData.id == fts_table.c.rowid)
+            .where(fts.op('MATCH')(fts_match_query(query)))
+            .order_by(score)
+        )
+    elif dialect == 'postgresql':
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_TS_CONFIG}'::regconfig"), query)
+        score = func.ts_rank_cd(tsvector_table.c.document, tsquery)
+        statement = (
+            select(WebsiteData.id, WebsiteData.website_url, WebsiteData.title, WebsiteData.crawl_id,
+                   score.label('score'), WebsiteData.text, WebsiteData.text_blob_id)
+            .select_from(tsvector_table)
+            .join(WebsiteData, WebsiteData.id == tsvector_table.c.website_data_id)
+            .where(tsvector_table.c.document.op('@@')(tsquery))
+            .order_by(score.desc())
+        )
+    else:
+        raise ValueError(f"Full-text search isn't supported on {dialect}")
+
+    if crawl_id is not None:
+        if content_crawl:
+            statement = statement.join(ContentCrawlTarget, ContentCrawlTarget.website_data_id == WebsiteData.id) \
+                .where(ContentCrawlTarget.crawl_id == crawl_id)
+        else:
+            statement = statement.where(WebsiteData.crawl_id == crawl_id)
+    return statement.limit(limit).offset(offset)
+
+# Postgres: statement building the snippets of the texts of a page of results, as (id, snippet)
+def headlines_statement(query: str, texts: dict):
+    documents = values(column('id', Integer), column('text', Text), name='documents').data(list(texts.items()))
+    config = literal_column(f"'{SEARCH_TS_CONFIG}'::regconfig")
+    return select(documents.c.id, func.ts_headline(
+        config, documents.c.text, func.websearch_to_tsquery(config, query),
+        f"StartSel=<b>, StopSel=</b>, MaxWords={SEARCH_SNIPPET_TOKENS * 2}, MinWords={SEARCH_SNIPPET_TOKENS}",
+    ))
+
+
+# (Re)index every fetched row, e.g. the rows written before the index existed, in chunks of
+# `chunk_size` rows with one commit each. Returns the number of rows indexed. On SQLite the
+# FTS5 table is created again first, so the 'delete' commands of a full reindex can't
+# hit entries indexed with other values.
+def rebuild_index(db: Session, chunk_size: int = 1000):
+    if db.get_bind().dialect.name == 'sqlite':
+        db.execute(text("DROP TABLE IF EXISTS website_data_fts"))
+        db.execute(text(FTS_TABLE_DDL))
+        db.commit()
+    indexed, after_id = 0, 0
+    while True:
+        chunk = db.execute(
+            select(WebsiteData.id, WebsiteData.title, WebsiteData.text, WebsiteData.text_blob_id)
+            .where(WebsiteData.status.is_(True), WebsiteData.id > after_id)
+            .order_by(WebsiteData.id)
+            .limit(chunk_size)
+        ).all()
+        if not chunk:
+            return indexed
+        contents = content_store.load_contents(db, [row.text_blob_id for row in chunk])
+        index_documents(db, [
+            {'id': row.id, 'title': row.title,
+             'text': contents[row.text_blob_id] if row.text_blob_id is not None else row.text}
+            for row in chunk
+        ])
+        db.commit()
+        indexed += len(chunk)
+        after_id = chunk[-1].id
+
+
+def main():
+    # python -m app.search_index rebuild
+    parser = argparse.ArgumentParser(description="Maintain the full-text search index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    database.create_tables()  # Creates the index on a database that predates it
+    db = database.SessionLocal()
+    started = time.monotonic()
+    try:
+        indexed = rebuild_index(db, args.chunk_size)
+    finally:
+        db.close()
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"Indexed {indexed} rows in {elapsed:.2f}s ({indexed / elapsed:.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# crawler_backend/app/web_scraper/canonical.py
+
+from urllib.parse import urlsplit, urlunsplit, unquote_plus
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that only carry campaign/click tracking and never change the page
+TRACKING_PARAM_PREFIXES = ('utm_',)
+TRACKING_PARAMS = {'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_ga', '_hsenc', '_hsmi'}
+
+
+class UrlCanonicalizer:
+    # Rewrites the variants of one page (#fragment, query order, tracking params, default
+    # port, scheme/host case, optionally trailing slash) to a single URL before dedup
+
+    def __init__(self, strip_fragments=True, sort_query_params=True, drop_tracking_params=True,
+                 strip_trailing_slash=False):
+        self.strip_fragments = strip_fragments
+        self.sort_query_params = sort_query_params
+        self.drop_tracking_params = drop_tracking_params
+        self.strip_trailing_slash = strip_trailing_slash
+
+    def is_tracking_param(self, name):
+        name = unquote_plus(name).lower()
+        return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+    def canonicalize(self, url):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS:
+            return url  # Leave mailto:, javascript:, data: etc. untouched
+        try:
+            port = parts.port
+        except ValueError:
+            return url
+
+        # Hostname is already lower-cased by urlsplit; keep credentials and non-default ports
+        host = parts.hostname or ''
+        if ':' in host:
+            host = f'[{host}]'
+        netloc = host
+        if port and port != DEFAULT_PORTS[scheme]:
+            netloc = f'{netloc}:{port}'
+        if parts.username is not None:
+            userinfo = parts.netloc.rpartition('@')[0]
+            netloc = f'{userinfo}@{netloc}'
+
+        path = parts.path or '/'
+        if self.strip_trailing_slash and len(path) > 1 and path.endswith('/'):
+            path = path.rstrip('/') or '/'
+
+        # Work on the raw "k=v" pairs so the original percent-encoding is preserved
+        params = [p for p in parts.query.split('&') if p]
+        if self.drop_tracking_params:
+            params = [p for p in params if not self.is_tracking_param(p.split('=', 1)[0])]
+        if self.sort_query_params:
+            params.sort()
+        query = '&'.join(params)
+
+        fragment = '' if self.strip_fragments else parts.fragment
+        return urlunsplit((scheme, netloc, path, query, fragment))
@@ -0,0 +1,54 @@
+# crawler_backend/app/web_scraper/checkpoint.py
+
+import time
+from app.database import SessionLocal
+from app import cruds
+
+
+class CrawlCheckpointer:
+    # Buffers the URLs discovered/visited since the last flush and appends only those
+    # to the crawl_checkpoint table, so the cost of a checkpoint does not grow with the crawl
+
+    def __init__(self, crawl_id, interval_pages=100, interval_seconds=30.0):
+        self.crawl_id = crawl_id
+        self.interval_pages = interval_pages
+        self.interval_seconds = interval_seconds
+        self.new_pending = []
+        self.new_visited = []
+        self.pages_since_flush = 0
+        self.last_flush = time.monotonic()
+
+    def record_pending(self, url, depth=0):
+        self.new_pending.append((url, depth))
+
+    def record_visited(self, url):
+        self.new_visited.append(url)
+        self.pages_since_flush += 1
+
+    def maybe_flush(self, link_count):
+        # Flush on whichever comes first: the page-count or the time interval
+        if (self.pages_since_flush >= self.interval_pages
+                or time.monotonic() - self.last_flush >= self.interval_seconds):
+            self.flush(link_count)
+
+    def flush(self, link_count):
+        if not self.crawl_id:
+            return
+        db = SessionLocal()
+        try:
+            cruds.append_crawl_checkpoint(db, self.crawl_id, self.new_pending, self.new_visited, link_count)
+        finally:
+            db.close()
+        self.new_pending = []
+        self.new_visited = []
+        self.pages_since_flush = 0
+        self.last_flush = time.monotonic()
+
+    def replay(self, frontier, backlog):
+        # Rebuild the frontier by replaying the checkpoint log without materialising it;
+        # the URLs still pending go to the backlog
+        db = SessionLocal()
+        try:
+            backlog.extend(frontier.replay(cruds.iter_crawl_checkpoint(db, self.crawl_id)))
+        finally:
+            db.close()
@@ -0,0 +1,94 @@
+# crawler_backend/app/web_scraper/extractor.py
+
+from lxml import etree
+
+# Elements whose text is never page content
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template'}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TextCollector:
+    # lxml parser target: receives start/end/data events as the HTML is fed, so no tree is
+    # built and only the capped body text is kept
+
+    def __init__(self, max_text_chars):
+        self.max_text_chars = max_text_chars
+        self.title = None
+        self.in_title = False
+        self.body_depth = 0
+        self.skip_depth = 0
+        self.parts = []
+        self.text_chars = 0
+        self.truncated = False
+
+    def start(self, tag, attrib):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == 'title' and self.title is None:
+            self.in_title = True
+            self.title = ''
+        elif tag == 'body':
+            self.body_depth += 1
+
+    def end(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == 'title':
+            self.in_title = False
+        elif tag == 'body':
+            self.body_depth = max(0, self.body_depth - 1)
+
+    def data(self, data):
+        if self.skip_depth:
+            return
+        if self.in_title:
+            self.title += data
+        elif self.body_depth and not self.truncated:
+            words = data.split()
+            if not words:
+                return
+            text = ' '.join(words)
+            remaining = self.max_text_chars - self.text_chars
+            if len(text) + 1 > remaining:
+                text = text[:max(0, remaining - 1)]
+                self.truncated = True
+            if text:
+                self.parts.append(text)
+                self.text_chars += len(text) + 1
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self
+
+
+class PageTextExtractor:
+    # Streams a page through lxml's incremental HTML parser and returns its title, body text
+    # (whitespace-collapsed, script/style/noscript skipped) and HTML, each capped per page
+
+    def __init__(self, max_text_chars=200_000, max_html_bytes=2_000_000):
+        self.max_text_chars = max_text_chars
+        self.max_html_bytes = max_html_bytes
+
+    def extract(self, body, encoding='utf-8'):
+        collector = TextCollector(self.max_text_chars)
+        try:
+            parser = etree.HTMLParser(target=collector, encoding=encoding, recover=True)
+        except LookupError:
+            # libxml2 doesn't know every Python codec name; let it sniff the encoding
+            parser = etree.HTMLParser(target=collector, recover=True)
+        view = memoryview(body)
+        try:
+            for offset in range(0, len(view), CHUNK_SIZE):
+                parser.feed(view[offset:offset + CHUNK_SIZE].tobytes())
+                if collector.truncated:
+                    break  # The text cap is reached, the rest of the page can't add anything
+            parser.close()
+        except etree.LxmlError:
+            pass  # Keep whatever was extracted before the parser gave up
+
+        title = collector.title.strip() if collector.title else None
+        html = bytes(view[:self.max_html_bytes]).decode(encoding, errors='ignore')
+        return title, ' '.join(collector.parts), html
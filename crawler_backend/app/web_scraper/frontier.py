@@ -0,0 +1,159 @@
+# crawler_backend/app/web_scraper/frontier.py
+
+import hashlib
+import math
+import os
+import tempfile
+from collections import deque
+
+
+def url_fingerprint(url):
+    # 64-bit fingerprint of a URL; ints are cheaper to store and hash than the full strings
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class BloomFilter:
+    # Fixed-size bit array sized for `capacity` entries at `error_rate` false positives.
+    # Memory stays bounded no matter how many URLs are added; the price is that a small
+    # fraction of new URLs is wrongly reported as already seen.
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, url):
+        # Double hashing: derive all k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, url):
+        # Returns True if the URL was not in the filter yet
+        added = False
+        for pos in self._positions(url):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, url):
+        for pos in self._positions(url):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
+
+
+class FingerprintSet:
+    # Exact membership over URL fingerprints, same interface as BloomFilter
+
+    def __init__(self):
+        self.fingerprints = set()
+
+    def add(self, url):
+        fingerprint = url_fingerprint(url)
+        if fingerprint in self.fingerprints:
+            return False
+        self.fingerprints.add(fingerprint)
+        return True
+
+    def __contains__(self, url):
+        return url_fingerprint(url) in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+
+def url_set(bloom_capacity=None, bloom_error_rate=0.001):
+    # Fixed-size Bloom filter when a capacity is given, exact fingerprints otherwise
+    if bloom_capacity:
+        return BloomFilter(bloom_capacity, bloom_error_rate)
+    return FingerprintSet()
+
+
+class UrlFrontier:
+    # Crawl frontier: O(1) "seen" and "visited" lookups. `seen` covers every URL ever
+    # scheduled, so a link is enqueued at most once; the queue of URLs still to fetch is
+    # the spider's backlog (a SpillQueue), not kept here a second time.
+
+    def __init__(self, bloom_capacity=None, bloom_error_rate=0.001):
+        self.seen = url_set(bloom_capacity, bloom_error_rate)
+        self.visited = url_set(bloom_capacity, bloom_error_rate)
+
+    def replay(self, entries):
+        # Rebuild the frontier from checkpointed (url, visited, depth) entries in log order,
+        # yielding the (url, depth) pairs that were scheduled. Some were visited later in the
+        # log; the spider skips those when they come up in its backlog.
+        for url, visited, depth in entries:
+            if visited:
+                self.mark_visited(url)
+            elif self.add(url):
+                yield url, depth or 0
+
+    def add(self, url, depth=0):
+        # Returns False if the URL was already scheduled or visited
+        return self.seen.add(url)
+
+    def mark_visited(self, url):
+        # Returns False if the URL had already been visited (e.g. a redirect target)
+        self.seen.add(url)
+        return self.visited.add(url)
+
+    def is_visited(self, url):
+        return url in self.visited
+
+
+class SpillQueue:
+    # FIFO of (url, depth) pairs that keeps at most `memory_size` of them in memory; the
+    # rest are appended to an anonymous temporary file and read back in order as the
+    # in-memory head drains, so a huge backlog costs disk space instead of RAM
+
+    def __init__(self, memory_size=100_000):
+        self.memory_size = memory_size
+        self.head = deque()
+        self.file = None
+        self.read_pos = 0
+        self.spilled = 0
+
+    def append(self, item):
+        if not self.spilled and len(self.head) < self.memory_size:
+            self.head.append(item)
+            return
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        url, depth = item
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(f'{depth}\t{url}\n'.encode('utf-8'))
+        self.spilled += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def popleft(self):
+        if not self.head and self.spilled:
+            self._refill()
+        return self.head.popleft()
+
+    def _refill(self):
+        self.file.seek(self.read_pos)
+        while self.spilled and len(self.head) < self.memory_size:
+            depth, url = self.file.readline().decode('utf-8').rstrip('\n').split('\t', 1)
+            self.head.append((url, int(depth)))
+            self.spilled -= 1
+        self.read_pos = self.file.tell()
+        if not self.spilled:
+            # Everything spilled has been read back: start the file over
+            self.file.truncate(0)
+            self.read_pos = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return len(self.head) + self.spilled
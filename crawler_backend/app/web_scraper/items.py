@@ -6,7 +6,50 @@
 import scrapy
 
 
-class WebScraperItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+class WebsiteUrlItem(scrapy.Item):
+    # A newly discovered page, inserted as a WebsiteData row
+    website_url = scrapy.Field()
+    status = scrapy.Field()
+    crawl_id = scrapy.Field()
+    lastmod = scrapy.Field()  # From the sitemap that listed the page
+
+
+class WebsitePageItem(scrapy.Item):
+    # A newly discovered page with its extracted content (single-pass crawls), inserted as a
+    # fetched WebsiteData row
+    website_url = scrapy.Field()
+    crawl_id = scrapy.Field()
+    title = scrapy.Field()
+    text = scrapy.Field()
+    html = scrapy.Field()
+    status = scrapy.Field()
+    etag = scrapy.Field()
+    last_modified = scrapy.Field()
+    body_hash = scrapy.Field()
+
+
+class PageSignatureItem(scrapy.Item):
+    # SimHash of a fetched page and the earlier page of the crawl it nearly duplicates, if any
+    crawl_id = scrapy.Field()
+    url = scrapy.Field()
+    website_data_id = scrapy.Field()
+    signature = scrapy.Field()
+    duplicate_of = scrapy.Field()
+
+
+class ContentUnchangedItem(scrapy.Item):
+    # A content crawl row whose page hasn't changed since its last fetch: nothing to update,
+    # the row is only marked done for the crawl
+    id = scrapy.Field()
+
+
+class WebsiteContentItem(scrapy.Item):
+    # Extracted content for an existing WebsiteData row
+    id = scrapy.Field()
+    title = scrapy.Field()
+    text = scrapy.Field()
+    html = scrapy.Field()
+    status = scrapy.Field()
+    etag = scrapy.Field()
+    last_modified = scrapy.Field()
+    body_hash = scrapy.Field()
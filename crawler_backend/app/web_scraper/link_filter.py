@@ -0,0 +1,63 @@
+# crawler_backend/app/web_scraper/link_filter.py
+
+import re
+from urllib.parse import urlsplit
+
+from scrapy.linkextractors import IGNORED_EXTENSIONS
+
+ALLOWED_SCHEMES = frozenset({'http', 'https'})
+# Binary assets, archives and stylesheets: fetching them never yields a page
+DENIED_EXTENSIONS = frozenset(IGNORED_EXTENSIONS) | {'gz', 'tgz', 'js', 'woff', 'woff2', 'ttf', 'otf', 'avif'}
+
+
+def compile_patterns(patterns):
+    # One alternation per set, so a URL is matched in a single pass
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+
+class LinkFilter:
+    # Decides whether a discovered link is worth a request, cheapest checks first
+    # (scheme, extension, host, depth, then the regexes); check() returns the reason a
+    # link is dropped, or None to keep it
+
+    def __init__(self, start_urls, follow_external=False, depth_limit=0, include_patterns=None,
+                 exclude_patterns=None, denied_extensions=DENIED_EXTENSIONS):
+        self.follow_external = follow_external
+        self.depth_limit = depth_limit or 0  # 0: no limit
+        self.denied_extensions = denied_extensions
+        self.include = compile_patterns(include_patterns)
+        self.exclude = compile_patterns(exclude_patterns)
+        # Start hosts without "www.", matched against a link's host and its parent domains,
+        # so www.example.com, example.com and blog.example.com all count as on-site
+        self.allowed_hosts = set()
+        for url in start_urls:
+            host = urlsplit(url).hostname
+            if host:
+                self.allowed_hosts.add(host[4:] if host.startswith('www.') else host)
+
+    def is_allowed_host(self, host):
+        if not host:
+            return False
+        labels = host.split('.')
+        return any('.'.join(labels[i:]) in self.allowed_hosts for i in range(len(labels)))
+
+    def check(self, url, depth):
+        parts = urlsplit(url)
+        if parts.scheme not in ALLOWED_SCHEMES:
+            return 'scheme'
+        filename = parts.path.rsplit('/', 1)[-1]
+        if '.' in filename:
+            extension = filename.lower().split('.', 1)[1]
+            if extension in self.denied_extensions or extension.rsplit('.', 1)[-1] in self.denied_extensions:
+                return 'extension'
+        if not self.follow_external and not self.is_allowed_host(parts.hostname):
+            return 'external'
+        if self.depth_limit and depth > self.depth_limit:
+            return 'depth'
+        if self.exclude is not None and self.exclude.search(url):
+            return 'exclude'
+        if self.include is not None and not self.include.search(url):
+            return 'include'
+        return None
@@ -0,0 +1,150 @@
+# crawler_backend/app/web_scraper/near_duplicates.py
+
+import hashlib
+import re
+from collections import defaultdict
+from urllib.parse import urlsplit, parse_qsl
+from app.database import SessionLocal
+from app import cruds
+
+WORD_RE = re.compile(r'\w+')
+DIGITS_RE = re.compile(r'\d+')
+
+SIGNATURE_BITS = 64
+SHINGLE_WORDS = 3
+MAX_SIGNATURE_WORDS = 20_000  # Enough to tell pages apart; caps the cost on huge pages
+
+
+def simhash(text):
+    # 64-bit SimHash over word 3-shingles: pages whose text differs only a little (dates,
+    # counters, session ids, a reordered facet) get signatures a few bits apart. None for
+    # pages with too little text to compare.
+    words = WORD_RE.findall(text.lower())[:MAX_SIGNATURE_WORDS]
+    if len(words) < SHINGLE_WORDS:
+        return None
+    features = [
+        format(int.from_bytes(hashlib.blake2b(" ".join(words[i:i + SHINGLE_WORDS]).encode('utf-8'),
+                                              digest_size=8).digest(), 'big'), '064b')
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    ]
+    # Bit i is set when most features have it set; zip(*...) counts the columns in C
+    threshold = len(features) / 2
+    signature = 0
+    for column in zip(*features):
+        signature = (signature << 1) | (column.count('1') > threshold)
+    return signature
+
+def to_signed(signature):
+    # Signatures are stored in a signed 64-bit column
+    return signature - (1 << SIGNATURE_BITS) if signature >= 1 << (SIGNATURE_BITS - 1) else signature
+
+def from_signed(value):
+    return value & ((1 << SIGNATURE_BITS) - 1)
+
+
+def url_template(url):
+    # The shape of a URL: host and path with numbers masked, plus the names (not values) of
+    # its query parameters, so /list?page=2&sort=asc and /list?page=7&sort=desc match
+    parts = urlsplit(url)
+    params = sorted({name for name, _ in parse_qsl(parts.query, keep_blank_values=True)})
+    return f"{parts.netloc}{DIGITS_RE.sub('{n}', parts.path)}" + (f"?{'&'.join(params)}" if params else "")
+
+
+class NearDuplicateIndex:
+    # LSH index over SimHash signatures. A signature is split into max_distance + 1 bands;
+    # two signatures within max_distance bits agree on at least one band (pigeonhole), so
+    # only the pages in the same bucket of some band are compared.
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [SIGNATURE_BITS // bands + (i < SIGNATURE_BITS % bands) for i in range(bands)]
+        self.bands = []  # (shift, mask) of each band
+        shift = 0
+        for width in widths:
+            self.bands.append((shift, (1 << width) - 1))
+            shift += width
+        self.buckets = [defaultdict(list) for _ in self.bands]
+        self.signatures = []
+        self.keys = []
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def find(self, signature):
+        # Key of an indexed page within max_distance bits of `signature`, or None
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            for i in buckets.get((signature >> shift) & mask, ()):
+                if (self.signatures[i] ^ signature).bit_count() <= self.max_distance:
+                    return self.keys[i]
+        return None
+
+    def add(self, signature, key):
+        i = len(self.signatures)
+        self.signatures.append(signature)
+        self.keys.append(key)
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            buckets[(signature >> shift) & mask].append(i)
+
+
+class TemplateStats:
+    # Pages and near-duplicates seen per URL template. A template is noisy once it has
+    # produced at least min_pages pages and at least `ratio` of them were near-duplicates.
+
+    def __init__(self, min_pages=5, ratio=0.5):
+        self.min_pages = min_pages
+        self.ratio = ratio
+        self.pages = defaultdict(int)
+        self.duplicates = defaultdict(int)
+
+    def record(self, url, duplicate):
+        template = url_template(url)
+        self.pages[template] += 1
+        if duplicate:
+            self.duplicates[template] += 1
+
+    def is_noisy(self, url):
+        template = url_template(url)
+        pages = self.pages.get(template, 0)
+        return pages >= self.min_pages and self.duplicates[template] >= self.ratio * pages
+
+
+class NearDuplicateDetector:
+    # A crawl's near-duplicate index and template stats, rebuilt from its persisted
+    # signatures when it resumes
+
+    def __init__(self, crawl_id, max_distance=3, template_min_pages=5, template_ratio=0.5):
+        self.crawl_id = crawl_id
+        self.index = NearDuplicateIndex(max_distance)
+        self.templates = TemplateStats(template_min_pages, template_ratio)
+
+    @classmethod
+    def from_settings(cls, crawl_id, settings):
+        return cls(
+            crawl_id,
+            max_distance=settings.getint('NEAR_DUPLICATE_MAX_DISTANCE', 3),
+            template_min_pages=settings.getint('NEAR_DUPLICATE_TEMPLATE_MIN_PAGES', 5),
+            template_ratio=settings.getfloat('NEAR_DUPLICATE_TEMPLATE_RATIO', 0.5),
+        )
+
+    def check(self, url, text):
+        # (signature, URL of the page it nearly duplicates or None); originals join the index
+        signature = simhash(text or '')
+        if signature is None:
+            return None, None
+        original = self.index.find(signature)
+        if original is None:
+            self.index.add(signature, url)
+        self.templates.record(url, original is not None)
+        return signature, original
+
+    def load(self):
+        # Replay the signatures persisted by an earlier run of the crawl
+        db = SessionLocal()
+        try:
+            for url, signature, duplicate_of in cruds.iter_page_signatures(db, self.crawl_id):
+                if duplicate_of is None:
+                    self.index.add(from_signed(signature), url)
+                self.templates.record(url, duplicate_of is not None)
+        finally:
+            db.close()
@@ -3,11 +3,195 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import time
+from datetime import datetime
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from twisted.internet import defer, task, threads
+
+from app.database import SessionLocal
+from app import cruds
+from app.web_scraper.items import WebsiteUrlItem, WebsitePageItem, WebsiteContentItem, ContentUnchangedItem, PageSignatureItem
 
 
 class WebScraperPipeline:
+    # Buffers WebsiteData inserts/updates and writes them in bulk from a worker thread,
+    # one transaction per batch instead of a session, query and commit per page
+
+    def __init__(self, stats, batch_size=500, flush_interval=5.0, max_pending=5000):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.new_rows = []
+        self.fetched_rows = []  # New rows with their content (single-pass crawls)
+        self.updated_rows = []
+        self.unchanged_rows = []  # Content crawl rows to mark done without an update
+        self.signature_rows = []
+        self.flushing = None  # Deferred of the flush in progress, at most one at a time
+        self.waiters = []  # Items held back until the current flush finishes
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler.stats,
+            batch_size=settings.getint('DB_WRITER_BATCH_SIZE', 500),
+            flush_interval=settings.getfloat('DB_WRITER_FLUSH_INTERVAL', 5.0),
+            max_pending=settings.getint('DB_WRITER_MAX_PENDING', 5000),
+        )
+
+    def open_spider(self, spider):
+        self.spider = spider
+        # Time-based flush so slow crawls don't sit on a half-full batch
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
     def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if isinstance(item, WebsiteUrlItem):
+            self.new_rows.append({
+                'website_url': adapter['website_url'],
+                'status': adapter.get('status', False),
+                'crawl_id': adapter.get('crawl_id'),
+                'lastmod': adapter.get('lastmod'),
+                'created_at': datetime.now(),
+            })
+        elif isinstance(item, WebsitePageItem):
+            self.fetched_rows.append({**adapter.asdict(), 'created_at': datetime.now()})
+        elif isinstance(item, WebsiteContentItem):
+            self.updated_rows.append(adapter.asdict())
+        elif isinstance(item, ContentUnchangedItem):
+            self.unchanged_rows.append(adapter.asdict())
+        elif isinstance(item, PageSignatureItem):
+            self.signature_rows.append(adapter.asdict())
+        else:
+            return item
+
+        if self.pending_count() >= self.batch_size:
+            self.flush()
+
+        # Backpressure: while a flush is running and the buffer is full, hold the item back.
+        # Scrapy counts held items against SCRAPER_SLOT_MAX_ACTIVE_SIZE and slows downloads.
+        if self.flushing is not None and self.pending_count() >= self.max_pending:
+            waiter = defer.Deferred()
+            self.waiters.append((waiter, item))
+            return waiter
         return item
+
+    def pending_count(self):
+        return (len(self.new_rows) + len(self.fetched_rows) + len(self.updated_rows) + len(self.unchanged_rows)
+                + len(self.signature_rows))
+
+    def flush(self):
+        if self.flushing is not None:
+            return self.flushing
+        if not self.pending_count():
+            return defer.succeed(None)
+
+        new_rows, self.new_rows = self.new_rows, []
+        fetched_rows, self.fetched_rows = self.fetched_rows, []
+        updated_rows, self.updated_rows = self.updated_rows, []
+        unchanged_rows, self.unchanged_rows = self.unchanged_rows, []
+        signature_rows, self.signature_rows = self.signature_rows, []
+        self.flushing = threads.deferToThread(
+            self.write_batch, new_rows, fetched_rows, updated_rows, unchanged_rows, signature_rows
+        )
+        self.flushing.addCallback(self.confirm_rows)
+        self.flushing.addBoth(self.flush_done)
+        return self.flushing
+
+    def write_batch(self, new_rows, fetched_rows, updated_rows, unchanged_rows, signature_rows):
+        # Runs in the reactor thread pool. A batch that fails is retried once, then written
+        # row by row so one bad row doesn't take the rest of the batch with it. Returns the
+        # (written, failed) rows, signatures aside.
+        started = time.monotonic()
+        row_count = len(new_rows) + len(fetched_rows) + len(updated_rows)
+        for attempt in (1, 2):
+            try:
+                self.write_rows(new_rows, fetched_rows, updated_rows, unchanged_rows, signature_rows)
+                break
+            except Exception as e:
+                self.spider.logger.warning(f"Error writing batch of {row_count} rows to database (attempt {attempt}): {e}")
+                self.stats.inc_value('db_writer/failed_batches')
+        else:
+            return self.write_rows_separately(new_rows, fetched_rows, updated_rows, unchanged_rows, signature_rows)
+        self.spider.logger.info(
+            f"Saved {len(new_rows) + len(fetched_rows)} new and {len(updated_rows)} updated rows "
+            f"in {time.monotonic() - started:.3f}s"
+        )
+        self.stats.inc_value('db_writer/rows_inserted', len(new_rows) + len(fetched_rows))
+        self.stats.inc_value('db_writer/rows_updated', len(updated_rows))
+        self.stats.inc_value('db_writer/flushes')
+        return new_rows + fetched_rows + updated_rows + unchanged_rows, []
+
+    def write_rows(self, new_rows, fetched_rows, updated_rows, unchanged_rows, signature_rows):
+        # One transaction; rolled back and re-raised on error. A content crawl's rows are
+        # marked done along with their content, so a restarted crawl never fetches them again.
+        db = SessionLocal()
+        try:
+            cruds.bulk_create_website_data(db, new_rows)
+            cruds.bulk_create_website_pages(db, fetched_rows)
+            cruds.bulk_update_website_data(db, updated_rows)
+            if self.spider.crawl_id and (updated_rows or unchanged_rows):
+                cruds.mark_content_crawl_targets_done(
+                    db, self.spider.crawl_id, [row['id'] for row in updated_rows + unchanged_rows]
+                )
+            cruds.bulk_create_page_signatures(db, signature_rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def write_rows_separately(self, *batch):
+        # Fallback for a batch that keeps failing: one transaction per row. Positions as in
+        # write_rows; signatures (the last) aren't reported back.
+        written, failed = [], []
+        for position, rows in enumerate(batch):
+            stored = 0
+            for row in rows:
+                single = [[] for _ in batch]
+                single[position] = [row]
+                try:
+                    self.write_rows(*single)
+                    stored += 1
+                except Exception as e:
+                    self.spider.logger.error(f"Error writing row to database: {e}")
+                    if position < len(batch) - 1:
+                        failed.append(row)
+                else:
+                    if position < len(batch) - 1:
+                        written.append(row)
+            if position < 2:
+                self.stats.inc_value('db_writer/rows_inserted', stored)
+            elif position == 2:
+                self.stats.inc_value('db_writer/rows_updated', stored)
+        self.stats.inc_value('db_writer/failed_rows', len(failed))
+        return written, failed
+
+    def confirm_rows(self, result):
+        # Back in the reactor thread: tell the spider which rows are in the database, so its
+        # checkpoint only ever moves past pages whose rows were written
+        written, failed = result
+        rows_written = getattr(self.spider, 'rows_written', None)
+        if rows_written is not None:
+            rows_written(written, failed)
+
+    def flush_done(self, result):
+        self.flushing = None
+        waiters, self.waiters = self.waiters, []
+        for waiter, item in waiters:
+            waiter.callback(item)
+        return result
+
+    @defer.inlineCallbacks
+    def close_spider(self, spider):
+        # Final flush: wait for the running batch, then write whatever is left
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        while self.flushing is not None or self.pending_count():
+            yield self.flush()
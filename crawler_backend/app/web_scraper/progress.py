@@ -0,0 +1,156 @@
+# crawler_backend/app/web_scraper/progress.py
+
+import json
+import random
+import time
+from datetime import datetime
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task, threads
+
+from app.database import SessionLocal
+from app import cruds, schemas
+
+# Download latencies kept per interval for the percentiles (reservoir sample beyond this)
+LATENCY_SAMPLE_SIZE = 2000
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))] if values else None
+
+
+class CrawlProgressExtension:
+    # Snapshots the Scrapy stats of a crawl every CRAWL_PROGRESS_INTERVAL seconds into its
+    # CrawlSession (throughput, queue depth, errors, latency percentiles, ETA) for the status
+    # API. Only latencies are collected per response; everything else is read at flush time.
+
+    def __init__(self, crawler, interval):
+        self.crawler = crawler
+        self.interval = interval
+        self.latencies = []
+        self.latency_count = 0
+        self.last_latency = {}
+        self.started = None
+        self.last_flush = None
+        self.last_pages = 0
+        self.last_bytes = 0
+        self.loop = None
+        self.writing = None  # Deferred of the write in progress, at most one at a time
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat('CRAWL_PROGRESS_INTERVAL', 5.0)
+        if not interval:
+            raise NotConfigured
+        extension = cls(crawler, interval)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.started = self.last_flush = time.monotonic()
+        self.loop = task.LoopingCall(self.flush)
+        self.loop.start(self.interval, now=False)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return
+        self.latency_count += 1
+        if len(self.latencies) < LATENCY_SAMPLE_SIZE:
+            self.latencies.append(latency)
+        else:
+            i = random.randrange(self.latency_count)
+            if i < LATENCY_SAMPLE_SIZE:
+                self.latencies[i] = latency
+
+    def snapshot(self, final=False):
+        stats = self.crawler.stats.get_stats()
+        engine = self.crawler.engine
+        now = time.monotonic()
+        elapsed = now - self.started
+        window = max(now - self.last_flush, 1e-6)
+
+        pages = stats.get('response_received_count', 0)
+        received_bytes = stats.get('downloader/response_bytes', 0)
+        pages_per_second = (pages - self.last_pages) / window
+        self.last_flush, self.last_pages = now, pages
+        bytes_per_second = (received_bytes - self.last_bytes) / window
+        self.last_bytes = received_bytes
+
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            self.last_latency = {
+                "p50": round(percentile(latencies, 0.5), 4),
+                "p95": round(percentile(latencies, 0.95), 4),
+                "p99": round(percentile(latencies, 0.99), 4),
+            }
+            self.latencies, self.latency_count = [], 0
+
+        queued = len(engine.slot.scheduler) if engine and engine.slot else 0
+        # UrlSpider holds links back for its budget, and those of noisy URL templates until last
+        queued += len(getattr(self.spider, 'backlog', ())) + len(getattr(self.spider, 'deferred', ()))
+        done, total = self.spider.progress() if hasattr(self.spider, 'progress') else (pages, None)
+        eta = None
+        if total is not None and pages_per_second > 0 and not final:
+            eta = round(max(total - done, 0) / pages_per_second, 1)
+
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "pages_fetched": pages,
+            "pages_saved": stats.get('item_scraped_count', 0) + stats.get('frontier/stored', 0),  # Distributed workers store pages themselves
+            "bytes": received_bytes,
+            "pages_per_second": round(pages_per_second, 2),
+            "bytes_per_second": round(bytes_per_second, 1),
+            "avg_pages_per_second": round(pages / elapsed, 2) if elapsed > 0 else 0,
+            "queued": queued,
+            "in_progress": len(engine.downloader.active) if engine else 0,
+            "errors": {
+                "download": stats.get('downloader/exception_count', 0),
+                "http": sum(count for key, count in stats.items()
+                            if key.startswith('downloader/response_status_count/') and key[-3:] >= '400'),
+                "spider": sum(count for key, count in stats.items()
+                              if key.startswith('spider_exceptions/')),
+            },
+            "near_duplicates": stats.get('near_duplicates/found', 0),
+            "latency": self.last_latency,
+            "progress": {"done": done, "total": total},
+            "eta_seconds": eta,
+        }
+
+    def flush(self):
+        if self.writing is not None:
+            return  # The database is slower than the interval; skip this snapshot
+        self.writing = threads.deferToThread(self.write, self.snapshot())
+        self.writing.addBoth(self.write_done)
+
+    def write(self, snapshot):
+        # Runs in the reactor thread pool
+        db = SessionLocal()
+        try:
+            cruds.update_crawl_session(db, self.spider.crawl_id, schemas.CrawlSessionUpdate(
+                stats=json.dumps(snapshot), stats_updated_at=datetime.now()
+            ))
+        finally:
+            db.close()
+
+    def write_done(self, result):
+        self.writing = None
+        if hasattr(result, 'getErrorMessage'):
+            self.spider.logger.error(f"Error saving crawl progress: {result.getErrorMessage()}")
+
+    def spider_closed(self, spider, reason):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        snapshot = self.snapshot(final=True)
+        if self.writing is None:
+            self.write(snapshot)
+            return None
+        # A periodic write still running would overwrite the final snapshot with older
+        # progress: write it once that one is done (Scrapy waits for the returned Deferred)
+        writing = self.writing
+        writing.addCallback(lambda _: threads.deferToThread(self.write, snapshot))
+        return writing
@@ -7,6 +7,8 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = "web_scraper"
 
 SPIDER_MODULES = ["web_scraper.spiders"]
@@ -19,6 +21,9 @@ NEWSPIDER_MODULE = "web_scraper.spiders"
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
+# Scrapy logs every request and scraped item at DEBUG; long benchmark crawls run at INFO
+LOG_LEVEL = os.getenv("CRAWLER_LOG_LEVEL", "DEBUG")
+
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
 #CONCURRENT_REQUESTS = 32
 
@@ -50,21 +55,60 @@ ROBOTSTXT_OBEY = True
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "web_scraper.middlewares.WebScraperDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware": None,
+    "app.web_scraper.shared_cache.SharedRobotsTxtMiddleware": 100,
+    "app.web_scraper.throttle.AdaptiveConcurrencyMiddleware": 950,
+}
+
+# Parsed robots.txt files and DNS results are cached in a local SQLite file shared by all
+# crawler processes, for ROBOTSTXT_CACHE_TTL / DNSCACHE_SHARED_TTL seconds
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), "crawl_cache.sqlite"),
+)
+ROBOTSTXT_CACHE_TTL = 86400
+DNSCACHE_SHARED_TTL = 3600
+DNS_RESOLVER = "app.web_scraper.shared_cache.SharedCachingResolver"
+
+# Per-domain adaptive concurrency (AdaptiveConcurrencyMiddleware): each host starts at
+# ADAPTIVE_CONCURRENCY_START concurrent requests and, every ADAPTIVE_CONCURRENCY_WINDOW
+# responses, gains one while the average latency stays under the target, or is halved
+# (with a longer delay) when errors exceed the max rate or the host answers 429/503.
+# CONCURRENT_REQUESTS_PER_DOMAIN is the ceiling and DOWNLOAD_DELAY the minimum delay;
+# both are set per crawl from the API's concurrent_requests and delay
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_START = 2
+ADAPTIVE_CONCURRENCY_TARGET_LATENCY = 1.0
+ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE = 0.1
+ADAPTIVE_CONCURRENCY_WINDOW = 10
+ADAPTIVE_CONCURRENCY_MAX_DELAY = 30
+
+# Hand out requests for the hosts with the fewest active downloads first, so a slow
+# host can't take every slot of a multi-domain crawl
+SCHEDULER_PRIORITY_QUEUE = "scrapy.pqueues.DownloaderAwarePriorityQueue"
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "app.web_scraper.progress.CrawlProgressExtension": 500,
+}
+
+# Seconds between crawl progress snapshots saved for /crawl-status/ and /metrics (0 disables)
+CRAWL_PROGRESS_INTERVAL = 5
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "web_scraper.pipelines.WebScraperPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "app.web_scraper.pipelines.WebScraperPipeline": 300,
+}
+
+# Batched database writer (WebScraperPipeline): rows are flushed in bulk every
+# DB_WRITER_BATCH_SIZE items or DB_WRITER_FLUSH_INTERVAL seconds; once
+# DB_WRITER_MAX_PENDING rows are buffered behind a running flush, items are held back
+DB_WRITER_BATCH_SIZE = 500
+DB_WRITER_FLUSH_INTERVAL = 5
+DB_WRITER_MAX_PENDING = 5000
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -87,6 +131,59 @@ ROBOTSTXT_OBEY = True
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
+# Per-page caps on what ContentSpider extracts and stores; text past the cap isn't parsed
+CONTENT_MAX_TEXT_CHARS = 200_000
+CONTENT_MAX_HTML_BYTES = 2_000_000
+# ContentSpider reads the rows it fetches from the database this many at a time
+CONTENT_CRAWL_CHUNK_SIZE = 1000
+
+# Near-duplicate detection, in content crawls and URL crawls with extract_content: the
+# SimHash of each fetched page's text is looked up in an LSH index of the crawl's earlier
+# pages (bits apart at most NEAR_DUPLICATE_MAX_DISTANCE). 'mark' records near-duplicates
+# in page_signature.duplicate_of; 'skip' also leaves out their content (and in URL crawls
+# their row, so they don't use up max_links); 'off' disables detection. Links matching a URL template with at least
+# NEAR_DUPLICATE_TEMPLATE_RATIO near-duplicates among its first
+# NEAR_DUPLICATE_TEMPLATE_MIN_PAGES pages are crawled last.
+NEAR_DUPLICATE_ACTION = "mark"
+NEAR_DUPLICATE_MAX_DISTANCE = 3
+NEAR_DUPLICATE_TEMPLATE_MIN_PAGES = 5
+NEAR_DUPLICATE_TEMPLATE_RATIO = 0.5
+# Requests UrlSpider queues in Scrapy ahead of the downloader (0: twice CONCURRENT_REQUESTS);
+# the rest of the discovered links wait in its backlog
+URL_SPIDER_MAX_IN_FLIGHT = 0
+
+# Distributed crawls: each worker leases FRONTIER_LEASE_SIZE URLs at a time from the shared
+# frontier table for FRONTIER_LEASE_SECONDS; leases of a worker that died are handed out
+# again once they expire, and URLs leased FRONTIER_MAX_ATTEMPTS times are given up on.
+# Results are reported every N pages or T seconds, whichever comes first.
+FRONTIER_LEASE_SIZE = 100
+FRONTIER_LEASE_SECONDS = 300
+FRONTIER_MAX_ATTEMPTS = 3
+FRONTIER_REPORT_INTERVAL_PAGES = 50
+FRONTIER_REPORT_INTERVAL_SECONDS = 5
+
+# Crawl-state checkpointing: UrlSpider appends the URLs visited/discovered since the
+# last checkpoint every N pages or T seconds, whichever comes first
+CHECKPOINT_INTERVAL_PAGES = 100
+CHECKPOINT_INTERVAL_SECONDS = 30
+
+# Pausing a crawl lets its in-flight requests finish, then Scrapy persists the scheduler
+# queue and the spider state to CRAWL_JOBDIR_ROOT/<crawl_id> (JOBDIR); resuming picks the
+# queue up from there. The directory is removed once the crawl completes.
+CRAWL_JOBDIR_ROOT = os.getenv(
+    "CRAWL_JOBDIR_ROOT",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), "jobs"),
+)
+
+# Frontier deduplication: 0 keeps exact 64-bit URL fingerprints in memory; a positive
+# capacity switches to fixed-size Bloom filters for very large crawls (fixed-size, but
+# FRONTIER_BLOOM_ERROR_RATE of new URLs may be skipped as false positives)
+FRONTIER_BLOOM_CAPACITY = 0
+FRONTIER_BLOOM_ERROR_RATE = 0.001
+# Discovered links UrlSpider keeps in memory waiting to be requested; the rest of its backlog
+# is spilled to a temporary file, so with Bloom filters the crawl's memory stays bounded
+FRONTIER_MEMORY_QUEUE_SIZE = 100_000
+
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
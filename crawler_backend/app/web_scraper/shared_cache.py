@@ -0,0 +1,147 @@
+# crawler_backend/app/web_scraper/shared_cache.py
+
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from scrapy import signals
+from scrapy.downloadermiddlewares.robotstxt import RobotsTxtMiddleware
+from scrapy.resolver import CachingThreadedResolver, dnscache
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import defer
+
+
+class SharedCache:
+    # Small TTL key/value cache in a local SQLite file, shared by every crawler process on
+    # the machine (run_crawler.py processes and pool workers alike). WAL mode lets readers
+    # and the occasional writer work concurrently.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_cache ("
+            "namespace TEXT, key TEXT, value BLOB, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self.conn.execute("DELETE FROM shared_cache WHERE expires_at < ?", (time.time(),))
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def get(self, namespace, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM shared_cache WHERE namespace = ? AND key = ? AND expires_at >= ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        if row is None:
+            self.misses[namespace] += 1
+            return None
+        self.hits[namespace] += 1
+        return row[0]
+
+    def set(self, namespace, key, value, ttl):
+        try:
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO shared_cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, value, time.time() + ttl),
+                )
+        except sqlite3.OperationalError:
+            pass  # Locked by another process for too long; the next crawl will store it
+
+
+caches = {}  # path -> SharedCache, one connection per process
+
+def get_shared_cache(settings):
+    path = settings.get('SHARED_CACHE_PATH')
+    if path not in caches:
+        caches[path] = SharedCache(path)
+    return caches[path]
+
+
+class SharedRobotsTxtMiddleware(RobotsTxtMiddleware):
+    # RobotsTxtMiddleware that looks robots.txt up in the shared cache before downloading
+    # it, and stores what it downloads for ROBOTSTXT_CACHE_TTL seconds. Also reports the
+    # shared cache hit/miss counts of this crawl (robots.txt and DNS) in the crawl stats.
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.cache = get_shared_cache(crawler.settings)
+        self.ttl = crawler.settings.getfloat('ROBOTSTXT_CACHE_TTL', 86400)
+        self.dns_hits_at_open = self.cache.hits['dns']
+        self.dns_misses_at_open = self.cache.misses['dns']
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def robot_parser(self, request, spider):
+        netloc = urlparse_cached(request).netloc
+        if netloc not in self._parsers:
+            key = f"{urlparse_cached(request).scheme}://{netloc}"
+            body = self.cache.get('robots', key)
+            stats = self.crawler.stats
+            if body is not None:
+                stats.inc_value('shared_cache/robots/hit')
+                self._parsers[netloc] = self._parserimpl.from_crawler(self.crawler, body)
+                return self._parsers[netloc]
+            stats.inc_value('shared_cache/robots/miss')
+        return super().robot_parser(request, spider)
+
+    def _parse_robots(self, response, netloc, spider):
+        # Cache what a later crawl would conclude too: the rules of a 2xx, "allow all" for a
+        # 4xx; 5xx responses are retried by the next crawl instead
+        if response.status < 500:
+            key = f"{urlparse_cached(response).scheme}://{netloc}"
+            self.cache.set('robots', key, response.body if response.status < 400 else b'', self.ttl)
+        return super()._parse_robots(response, netloc, spider)
+
+    def spider_closed(self, spider):
+        # DNS lookups are cached per process, so concurrent crawls in a worker share these counts
+        stats = self.crawler.stats
+        stats.set_value('shared_cache/dns/hit', self.cache.hits['dns'] - self.dns_hits_at_open)
+        stats.set_value('shared_cache/dns/miss', self.cache.misses['dns'] - self.dns_misses_at_open)
+        for kind in ('robots', 'dns'):
+            hits = stats.get_value(f'shared_cache/{kind}/hit', 0)
+            lookups = hits + stats.get_value(f'shared_cache/{kind}/miss', 0)
+            if lookups:
+                stats.set_value(f'shared_cache/{kind}/hit_rate', round(hits / lookups, 3))
+
+
+class SharedCachingResolver(CachingThreadedResolver):
+    # Scrapy's caching resolver with a second level in the shared cache, so a new crawler
+    # process doesn't repeat lookups another one made within DNSCACHE_SHARED_TTL seconds
+
+    def __init__(self, reactor, cache_size, timeout, cache, ttl):
+        super().__init__(reactor, cache_size, timeout)
+        self.cache = cache
+        self.ttl = ttl
+
+    @classmethod
+    def from_crawler(cls, crawler, reactor):
+        # Also created from a CrawlerRunner by the worker pool, which only has settings
+        settings = crawler.settings
+        cache_size = settings.getint('DNSCACHE_SIZE') if settings.getbool('DNSCACHE_ENABLED') else 0
+        return cls(reactor, cache_size, settings.getfloat('DNS_TIMEOUT'),
+                   get_shared_cache(settings), settings.getfloat('DNSCACHE_SHARED_TTL', 3600))
+
+    def getHostByName(self, name, timeout=None):
+        if name in dnscache:
+            return defer.succeed(dnscache[name])
+        address = self.cache.get('dns', name)
+        if address is not None:
+            if dnscache.limit:
+                dnscache[name] = address
+            return defer.succeed(address)
+        d = super().getHostByName(name, timeout)
+        d.addCallback(self.share_result, name)
+        return d
+
+    def share_result(self, address, name):
+        self.cache.set('dns', name, address, self.ttl)
+        return address
@@ -0,0 +1,78 @@
+# crawler_backend/app/web_scraper/sitemaps.py
+
+import gzip
+import io
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from lxml import etree
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def robots_txt_url(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/robots.txt"
+
+def default_sitemap_url(url):
+    # Where sites without a Sitemap: line in robots.txt usually keep theirs
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/sitemap.xml"
+
+def is_sitemap_url(url):
+    path = urlsplit(url).path.lower()
+    return path.endswith(('.xml', '.xml.gz'))
+
+def sitemaps_from_robots(body):
+    # URLs of the Sitemap: lines of a robots.txt
+    urls = []
+    for line in body.decode('utf-8', errors='replace').splitlines():
+        key, _, value = line.partition(':')
+        if key.strip().lower() == 'sitemap' and value.strip():
+            urls.append(value.strip())
+    return urls
+
+
+def parse_lastmod(value):
+    # W3C datetime (a date, or a date and time with offset) as naive UTC; None if invalid
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def iter_sitemap(body):
+    # Stream the entries of a sitemap or sitemap index as (kind, loc, lastmod), kind being
+    # 'url' or 'sitemap'. Gzipped sitemaps are decompressed as they are read and parsed
+    # elements are dropped right away, so memory doesn't grow with the number of entries.
+    # Plain-text sitemaps (one URL per line) are supported too.
+    stream = io.BytesIO(body)
+    if body[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+    head = stream.read(512)
+    stream.seek(0)
+    if not head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<'):
+        for line in io.TextIOWrapper(stream, encoding='utf-8', errors='replace'):
+            if line.strip():
+                yield 'url', line.strip(), None
+        return
+
+    parser = etree.iterparse(stream, events=('end',), tag=('{*}url', '{*}sitemap'),
+                             resolve_entities=False, no_network=True, huge_tree=True)
+    try:
+        for _, element in parser:
+            loc = element.findtext('{*}loc')
+            lastmod = element.findtext('{*}lastmod')
+            kind = etree.QName(element).localname
+            # Free the entry and the ones before it
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if loc and loc.strip():
+                yield kind, loc.strip(), parse_lastmod(lastmod)
+    except etree.XMLSyntaxError:
+        return  # Truncated or broken sitemap: keep the entries read so far
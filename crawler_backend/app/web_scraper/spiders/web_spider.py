@@ -1,180 +1,759 @@
 # crawler_backend/app/web_scraper/spiders/web_spider.py
 
+import os
+import socket
+import time
+import uuid
 import scrapy
+from collections import deque
+from datetime import datetime
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
+from scrapy.http import TextResponse
 from app.database import SessionLocal
 from app.schemas import WebsiteDataCreate
 from app import cruds, schemas
-import json
-import pickle
+from app.web_scraper.checkpoint import CrawlCheckpointer
+from app.web_scraper.frontier import UrlFrontier, SpillQueue, url_set
+from app.web_scraper.canonical import UrlCanonicalizer
+from app.web_scraper.link_filter import LinkFilter
+from app.web_scraper.items import (WebsiteUrlItem, WebsitePageItem, WebsiteContentItem, ContentUnchangedItem,
+                                   PageSignatureItem)
+from app.web_scraper.extractor import PageTextExtractor
+from app.web_scraper.near_duplicates import NearDuplicateDetector, to_signed
+from app.web_scraper.sitemaps import (iter_sitemap, sitemaps_from_robots, robots_txt_url, default_sitemap_url,
+                                      is_sitemap_url)
+import hashlib
+
+
+def build_extractor(settings):
+    return PageTextExtractor(
+        max_text_chars=settings.getint('CONTENT_MAX_TEXT_CHARS', 200_000),
+        max_html_bytes=settings.getint('CONTENT_MAX_HTML_BYTES', 2_000_000),
+    )
+
+def page_content(extractor, response, body_hash):
+    # Content and validators of a fetched page, as stored on its WebsiteData row. The page is
+    # streamed through the extractor instead of building a selector tree and text list.
+    title, body_text, html_content = extractor.extract(
+        response.body, getattr(response, 'encoding', None) or 'utf-8'
+    )
+    return dict(
+        title=title,
+        text=body_text,
+        html=html_content,
+        status=True,  # Mark the status as completed
+        etag=response.headers.get('ETag', b'').decode('latin-1') or None,
+        last_modified=response.headers.get('Last-Modified', b'').decode('latin-1') or None,
+        body_hash=body_hash,
+    )
+
+
+def build_near_duplicate_detector(spider, settings, resuming):
+    # None when detection is off; a resumed crawl gets back the signatures of its earlier runs
+    if settings.get('NEAR_DUPLICATE_ACTION', 'mark') == 'off':
+        return None
+    detector = NearDuplicateDetector.from_settings(spider.crawl_id, settings)
+    if resuming:
+        detector.load()
+    return detector
+
+def check_near_duplicate(spider, url, text, website_data_id=None):
+    # Look the page up in the crawl's near-duplicate index: returns the URL of the page it
+    # nearly duplicates (or None) and the item persisting its signature (or None)
+    signature, original = spider.near_duplicates.check(url, text)
+    if signature is None:
+        return None, None
+    if original is not None:
+        spider.crawler.stats.inc_value('near_duplicates/found')
+    return original, PageSignatureItem(crawl_id=spider.crawl_id, url=url, website_data_id=website_data_id,
+                                       signature=to_signed(signature), duplicate_of=original)
+
 
 class UrlSpider(scrapy.Spider):
     name = 'url_spider'
 
-    def __init__(self, crawl_id=None, start_urls=None, max_links=10, *args, **kwargs):
+    def __init__(self, crawl_id=None, start_urls=None, max_links=10, follow_external=False, depth_limit=2,
+                 include_patterns=None, exclude_patterns=None, url_canonicalization=None, extract_content=False,
+                 sitemap_discovery=False, sitemap_fallback=True, resume=False, *args, **kwargs):
         super(UrlSpider, self).__init__(*args, **kwargs)
         self.crawl_id = crawl_id
         self.max_links = max_links
-        self.visited_links = set()
-        self.pending_urls = list(start_urls) if start_urls else []
+        # Single pass: store each page's content along with its URL, so no content crawl
+        # has to download it again
+        self.extract_content = extract_content
+        # Sitemap discovery: store the pages listed in the sites' sitemaps without fetching
+        # them, and crawl links only if the sitemaps list none (and sitemap_fallback is set)
+        self.sitemap_discovery = sitemap_discovery
+        self.sitemap_fallback = sitemap_fallback
+        self.canonicalizer = UrlCanonicalizer(**(url_canonicalization or {}))
+        self.start_urls = [self.canonicalizer.canonicalize(url) for url in start_urls or []]
+        self.link_filter = LinkFilter(
+            self.start_urls,
+            follow_external=follow_external,
+            depth_limit=depth_limit,
+            include_patterns=include_patterns,
+            exclude_patterns=exclude_patterns,
+        )
         self.link_count = 0
+        self.backlog = deque()  # Discovered (url, depth) pairs not requested yet
+        self.deferred = deque()  # Backlog links of URL templates that keep producing near-duplicates
+        self.state = {}  # Replaced by Scrapy's persisted spider state when the crawl has a JOBDIR
+        self.resuming = False
 
         # Load state from the database if resuming
         if self.crawl_id:
             db = SessionLocal()
             crawl_session = cruds.get_crawl_session(db, self.crawl_id)
-            if crawl_session and crawl_session.status == 'paused':
+            # The API flags resumed crawls explicitly since it marks the session running right away
+            if crawl_session and (resume or crawl_session.status == 'paused'):
                 self.logger.info(f"Resuming crawl {self.crawl_id}")
-                if crawl_session.visited_links:
-                    self.visited_links = set(pickle.loads(crawl_session.visited_links))
-                if crawl_session.pending_urls:
-                    self.pending_urls = pickle.loads(crawl_session.pending_urls)
+                self.resuming = True
                 self.link_count = crawl_session.link_count or 0
             db.close()
+        self.saved_count = self.link_count  # Pages whose row the pipeline has written
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(UrlSpider, cls).from_crawler(crawler, *args, **kwargs)
+        bloom_capacity = crawler.settings.getint('FRONTIER_BLOOM_CAPACITY', 0)
+        bloom_error_rate = crawler.settings.getfloat('FRONTIER_BLOOM_ERROR_RATE', 0.001)
+        spider.frontier = UrlFrontier(bloom_capacity=bloom_capacity, bloom_error_rate=bloom_error_rate)
+        # Raw non-canonical links, only used for the stats; bounded like the frontier
+        spider.seen_variants = url_set(bloom_capacity, bloom_error_rate)
+        # Past FRONTIER_MEMORY_QUEUE_SIZE links each, the backlogs wait on disk
+        memory_queue_size = crawler.settings.getint('FRONTIER_MEMORY_QUEUE_SIZE', 100_000)
+        spider.backlog = SpillQueue(memory_queue_size)
+        spider.deferred = SpillQueue(memory_queue_size)
+        spider.checkpoint = CrawlCheckpointer(
+            spider.crawl_id,
+            interval_pages=crawler.settings.getint('CHECKPOINT_INTERVAL_PAGES', 100),
+            interval_seconds=crawler.settings.getfloat('CHECKPOINT_INTERVAL_SECONDS', 30.0),
+        )
+        if spider.resuming:
+            # Rebuild the frontier and the backlog from the append-only checkpoint log
+            spider.checkpoint.replay(spider.frontier, spider.backlog)
+        if not spider.resuming or not (len(spider.backlog) or spider.link_count):
+            # Fresh crawl, or a restarted one that died before its first checkpoint
+            for url in spider.start_urls:
+                if spider.frontier.add(url):
+                    spider.checkpoint.record_pending(url, 0)
+                    spider.backlog.append((url, 0))
+        # Plain URL crawls don't parse the page text, and aren't slowed down to detect near-duplicates
+        spider.near_duplicates = (
+            build_near_duplicate_detector(spider, crawler.settings, spider.resuming) if spider.extract_content else None
+        )
+        spider.skip_near_duplicates = crawler.settings.get('NEAR_DUPLICATE_ACTION', 'mark') == 'skip'
+        # Requests handed to Scrapy ahead of the downloader; the rest stay in the backlog,
+        # where links of noisy URL templates can still be moved back
+        spider.max_in_flight = crawler.settings.getint('URL_SPIDER_MAX_IN_FLIGHT') or 2 * crawler.settings.getint('CONCURRENT_REQUESTS')
+        spider.extractor = build_extractor(crawler.settings) if spider.extract_content else None
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    @property
+    def in_flight(self):
+        # url -> depth of the requests scheduled whose response or failure hasn't come back
+        # yet. Kept in the spider state so that after a pause it matches the requests Scrapy
+        # restores from the JOBDIR queue.
+        return self.state.setdefault('in_flight', {})
 
     def start_requests(self):
-        for url in self.pending_urls:
-            yield scrapy.Request(url, callback=self.parse)
+        if self.sitemap_discovery and self.state.get('discovery', 'sitemap') == 'sitemap':
+            self.state['discovery'] = 'sitemap'
+            yield from self.sitemap_requests()
+        else:
+            yield from self.schedule_requests()
+
+    def schedule_requests(self):
+        # Each request in flight can still turn into a saved page, so only keep as many in
+        # flight as the max_links budget has pages left. The frontier already dedups, so the
+        # requests skip Scrapy's dupefilter and a redirect always reaches parse/request_failed.
+        # Nothing new is scheduled once the engine is stopping (pause) and draining. Links of
+        # noisy URL templates wait until nothing else is left.
+        engine = self.crawler.engine
+        while ((self.backlog or self.deferred) and self.link_count + len(self.in_flight) < self.max_links
+               and len(self.in_flight) < self.max_in_flight and engine.running):
+            if self.backlog:
+                url, depth = self.backlog.popleft()
+                if self.near_duplicates is not None and self.near_duplicates.templates.is_noisy(url):
+                    self.deferred.append((url, depth))
+                    self.crawler.stats.inc_value('near_duplicates/deferred_links')
+                    continue
+            else:
+                url, depth = self.deferred.popleft()
+            if self.frontier.is_visited(url) or url in self.in_flight:
+                continue  # Already reached through a redirect, or restored from the JOBDIR queue
+            self.in_flight[url] = depth
+            # Not meta['depth']: DepthMiddleware sets that on every request a callback yields,
+            # to the depth of the response the callback is handling, not of the link
+            yield scrapy.Request(url, callback=self.parse, errback=self.request_failed,
+                                 meta={'crawl_depth': depth}, dont_filter=True)
+
+    def request_done(self, request):
+        # Redirected requests are tracked under the URL they were scheduled with
+        self.in_flight.pop(request.meta.get('redirect_urls', [request.url])[0], None)
+
+    def request_failed(self, failure):
+        # The URL stays pending, so a resumed crawl retries it
+        self.request_done(failure.request)
+        yield from self.schedule_requests()
 
     def parse(self, response):
-        db = SessionLocal()
+        # Redirects can land on a non-canonical URL, so canonicalize before dedup and storage
+        page_url = self.canonicalizer.canonicalize(response.url)
 
         # Save the current URL if not already visited and within link limits
-        if response.url not in self.visited_links and self.link_count < self.max_links:
-            self.visited_links.add(response.url)
-            self.link_count += 1
+        items = []
+        if not isinstance(response, TextResponse):
+            # A download or other binary file without a filtered extension: no page to save
+            # or links to follow, but it isn't fetched again either
+            if self.frontier.mark_visited(page_url):
+                self.checkpoint.record_visited(page_url)
+            self.crawler.stats.inc_value('url_spider/non_text_responses')
+        elif not self.frontier.is_visited(page_url) and self.link_count < self.max_links:
+            self.frontier.mark_visited(page_url)
 
-            # Save the URL in the database
-            website_data = schemas.WebsiteDataCreate(
-                website_url=response.url,
-                status=False
-            )
-            try:
-                created_data = cruds.create_website_data(db=db, website_data=website_data)
-                self.logger.info(f"Saved URL: {response.url} with ID: {created_data.id}")
-            except Exception as e:
-                self.logger.error(f"Error saving URL to database: {e}")
+            content, duplicate_of = None, None
+            if self.extractor is not None:
+                content = page_content(self.extractor, response, hashlib.sha256(response.body).hexdigest())
+            if self.near_duplicates is not None:
+                duplicate_of, signature_item = check_near_duplicate(self, page_url, content['text'])
+                if signature_item is not None:
+                    items.append(signature_item)
 
-        db.close()
+            if duplicate_of is not None and self.skip_near_duplicates:
+                # Not saved and not counted against max_links; its links are still followed
+                self.checkpoint.record_visited(page_url)
+                self.crawler.stats.inc_value('near_duplicates/skipped')
+            else:
+                self.link_count += 1
+                # Save the URL (and content) in the database; WebScraperPipeline writes it in the
+                # next batch, and only then is the page checkpointed as visited (rows_written)
+                if self.extract_content:
+                    items.append(WebsitePageItem(website_url=page_url, crawl_id=self.crawl_id, **content))
+                else:
+                    items.append(WebsiteUrlItem(website_url=page_url, status=False, crawl_id=self.crawl_id))
+
+        # Only now that the page is counted does its request give up its share of the max_links
+        # budget: Scrapy runs the callbacks of other responses between this generator's yields,
+        # and their schedule_requests would otherwise see a free slot too early
+        self.request_done(response.request)
+        yield from items
+
+        try:
+            if isinstance(response, TextResponse):
+                self.follow_links(response)
+        finally:
+            # The backlog is scheduled even if the page's links couldn't be read, or the
+            # crawl would stall once its last requests in flight are answered
+            if self.link_count < self.max_links:
+                yield from self.schedule_requests()
+
+        if self.link_count >= self.max_links:
+            # Budget met: close now, dropping whatever is still queued or downloading
+            raise CloseSpider('max_links_reached')
+
+        # Checkpoint the new frontier entries once the page or time interval is reached
+        self.checkpoint.maybe_flush(self.saved_count)
 
-        # Extract links and add to pending URLs if not visited
+    def follow_links(self, response):
+        # Extract links and add to pending URLs if not seen before and not filtered out
+        depth = response.meta.get('crawl_depth', 0) + 1
+        stats = self.crawler.stats
         for next_page in response.css('a::attr(href)').getall():
-            next_page_url = response.urljoin(next_page)
-            if next_page_url not in self.visited_links and next_page_url not in self.pending_urls and self.link_count < self.max_links:
-                self.pending_urls.append(next_page_url)
-                yield scrapy.Request(next_page_url, callback=self.parse)
+            if self.link_count >= self.max_links:
+                break
+            raw_url = response.urljoin(next_page)
+            next_page_url = self.canonicalizer.canonicalize(raw_url)
+            reason = self.link_filter.check(next_page_url, depth)
+            if reason is not None:
+                stats.inc_value(f'link_filter/dropped/{reason}')
+                continue
+            new_variant = next_page_url != raw_url and self.seen_variants.add(raw_url)
+            if self.frontier.add(next_page_url, depth):
+                self.checkpoint.record_pending(next_page_url, depth)
+                self.backlog.append((next_page_url, depth))
+                stats.inc_value('link_filter/accepted')
+            elif new_variant:
+                # First sighting of a variant of an already scheduled page: one fetch (and row) saved
+                stats.inc_value('canonicalize/fetches_avoided')
 
-        # Save state periodically
-        self.save_state()
+    def rows_written(self, written, failed):
+        # Called by WebScraperPipeline once a batch is committed. Pages whose row couldn't be
+        # written stay unvisited in the checkpoint, so a resumed crawl fetches them again.
+        for row in written:
+            self.checkpoint.record_visited(row['website_url'])
+        self.saved_count += len(written)
+
+    @property
+    def requested_sitemaps(self):
+        # robots.txt and sitemap URLs requested so far, kept in the spider state so a resumed
+        # crawl only requests the ones its JOBDIR queue doesn't already have
+        return self.state.setdefault('sitemaps', set())
+
+    def sitemap_requests(self):
+        # Start from robots.txt, or from the start URL itself when it is a sitemap
+        for url in self.start_urls:
+            if is_sitemap_url(url):
+                yield from self.request_sitemaps([url])
+            elif robots_txt_url(url) not in self.requested_sitemaps:
+                self.requested_sitemaps.add(robots_txt_url(url))
+                yield scrapy.Request(robots_txt_url(url), callback=self.parse_robots, errback=self.robots_failed,
+                                     meta={'dont_obey_robotstxt': True}, dont_filter=True)
+
+    def request_sitemaps(self, urls):
+        for url in urls:
+            if url not in self.requested_sitemaps:
+                self.requested_sitemaps.add(url)
+                yield scrapy.Request(url, callback=self.parse_sitemap, errback=self.sitemap_failed, dont_filter=True)
+
+    def parse_robots(self, response):
+        yield from self.request_sitemaps(sitemaps_from_robots(response.body) or [default_sitemap_url(response.url)])
+
+    def robots_failed(self, failure):
+        yield from self.request_sitemaps([default_sitemap_url(failure.request.url)])
+
+    def parse_sitemap(self, response):
+        # Pages listed in the sitemap are stored right away (with their lastmod) and marked
+        # visited; they are never downloaded. Entries are read one at a time, and the
+        # pipeline's backpressure pauses the loop while the database catches up.
+        stats = self.crawler.stats
+        stats.inc_value('sitemap/sitemaps')
+        for kind, loc, lastmod in iter_sitemap(response.body):
+            if kind == 'sitemap':
+                yield from self.request_sitemaps([response.urljoin(loc)])
+                continue
+            stats.inc_value('sitemap/urls')
+            url = self.canonicalizer.canonicalize(response.urljoin(loc))
+            reason = self.link_filter.check(url, 0)
+            if reason is not None:
+                stats.inc_value(f'link_filter/dropped/{reason}')
+                continue
+            if not self.frontier.mark_visited(url):
+                continue  # Listed before, here or in another sitemap
+            self.link_count += 1
+            self.state['sitemap_urls'] = self.state.get('sitemap_urls', 0) + 1
+            yield WebsiteUrlItem(website_url=url, status=False, crawl_id=self.crawl_id, lastmod=lastmod)
+            if self.link_count >= self.max_links:
+                raise CloseSpider('max_links_reached')
+            self.checkpoint.maybe_flush(self.saved_count)
+
+    def sitemap_failed(self, failure):
+        self.crawler.stats.inc_value('sitemap/failed')
+        self.logger.warning(f"Error fetching sitemap {failure.request.url}: {failure.getErrorMessage()}")
+
+    def spider_idle(self, spider):
+        if self.state.get('discovery') == 'sitemap':
+            # Every sitemap has been read; crawl links instead if none of them listed a page
+            if self.state.get('sitemap_urls') or not self.sitemap_fallback:
+                return
+            self.logger.info("No pages found in sitemaps, falling back to link crawling")
+            self.state['discovery'] = 'links'
+        # Nothing in flight but links still waiting (a callback failed before scheduling
+        # them): keep crawling rather than close as finished
+        scheduled = False
+        for request in self.schedule_requests():
+            self.crawler.engine.crawl(request)
+            scheduled = True
+        if scheduled:
+            raise DontCloseSpider
+
+    def progress(self):
+        # (pages done, pages planned) for the progress stats
+        return self.link_count, self.max_links
 
     def save_state(self):
-        # Save the current state to the database
-        db = SessionLocal()
-        crawl_session_update = schemas.CrawlSessionUpdate(
-            visited_links=pickle.dumps(list(self.visited_links)),
-            pending_urls=pickle.dumps(self.pending_urls),
-            link_count=self.link_count
-        )
-        cruds.update_crawl_session(db, self.crawl_id, crawl_session_update)
-        db.close()
+        # Append whatever was discovered or visited since the last checkpoint
+        self.checkpoint.flush(self.saved_count)
 
     def closed(self, reason):
         # When the spider is closed, save the state
         self.save_state()
+        self.backlog.close()
+        self.deferred.close()
         # Update status in the database
         db = SessionLocal()
-        status = 'completed' if reason == 'finished' else 'paused'
-        cruds.update_crawl_session(db, self.crawl_id, schemas.CrawlSessionUpdate(status=status))
+        status = 'completed' if reason in ('finished', 'max_links_reached') else 'paused'
+        cruds.update_crawl_session(db, self.crawl_id, schemas.CrawlSessionUpdate(status=status, pid=None))
         db.close()
 
+class DistributedUrlSpider(UrlSpider):
+    # UrlSpider for crawls spread over several worker processes, on any number of nodes,
+    # sharing one database. Instead of a local frontier and checkpoint log, workers lease
+    # batches of URLs from the crawl_frontier table, fetch them, and report the stored pages,
+    # failures and newly discovered links back in one transaction per batch. Leases of a
+    # worker that dies expire and are handed out again. Near-duplicate detection and sitemap
+    # discovery need a crawl-wide view, so they are not used here.
+    name = 'distributed_url_spider'
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(UrlSpider, cls).from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        spider.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        spider.lease_size = settings.getint('FRONTIER_LEASE_SIZE', 100)
+        spider.lease_seconds = settings.getfloat('FRONTIER_LEASE_SECONDS', 300)
+        spider.max_attempts = settings.getint('FRONTIER_MAX_ATTEMPTS', 3)
+        spider.report_interval_pages = settings.getint('FRONTIER_REPORT_INTERVAL_PAGES', 50)
+        spider.report_interval_seconds = settings.getfloat('FRONTIER_REPORT_INTERVAL_SECONDS', 5.0)
+        spider.max_in_flight = settings.getint('URL_SPIDER_MAX_IN_FLIGHT') or 2 * settings.getint('CONCURRENT_REQUESTS')
+        # Links this worker has already queued, so it doesn't send the same ones again
+        spider.frontier = UrlFrontier(
+            bloom_capacity=settings.getint('FRONTIER_BLOOM_CAPACITY', 0),
+            bloom_error_rate=settings.getfloat('FRONTIER_BLOOM_ERROR_RATE', 0.001),
+        )
+        spider.near_duplicates = None
+        spider.sitemap_discovery = False
+        spider.extractor = build_extractor(settings) if spider.extract_content else None
+        spider.pages = {}  # frontier id -> WebsiteData row of the pages fetched since the last report
+        spider.failed_ids = []
+        spider.discovered = []
+        spider.last_report = time.monotonic()
+        spider.next_lease = 0.0  # Don't ask again before this time once the frontier had nothing to lease
+        spider.crawl_done = 0  # Pages stored by all workers, as of the last lease
+
+        # Every worker queues the start URLs; whichever comes first wins
+        db = SessionLocal()
+        try:
+            cruds.add_frontier_urls(db, spider.crawl_id, [(url, 0) for url in spider.start_urls])
+            db.commit()
+        finally:
+            db.close()
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def start_requests(self):
+        yield from self.schedule_requests()
+
+    def lease(self):
+        # Lease the next batch, no more than the crawl's max_links budget has pages left for
+        if time.monotonic() < self.next_lease:
+            return
+        db = SessionLocal()
+        try:
+            cruds.reclaim_expired_frontier_leases(db, self.crawl_id, self.max_attempts)
+            counts = cruds.get_frontier_counts(db, self.crawl_id)
+            self.crawl_done = counts['done']
+            budget = self.max_links - counts['done'] - counts['leased']
+            rows = []
+            if budget > 0:
+                rows = cruds.lease_frontier_urls(db, self.crawl_id, self.worker_id,
+                                                 min(self.lease_size, budget), self.lease_seconds)
+        finally:
+            db.close()
+        if not rows:
+            self.next_lease = time.monotonic() + 1.0
+        self.crawler.stats.inc_value('frontier/leased', len(rows))
+        self.backlog.extend(rows)
+
+    def schedule_requests(self):
+        engine = self.crawler.engine
+        while len(self.in_flight) < self.max_in_flight and engine.running:
+            if not self.backlog:
+                self.lease()
+                if not self.backlog:
+                    return
+            id, url, depth = self.backlog.popleft()
+            self.in_flight[url] = id
+            yield scrapy.Request(url, callback=self.parse, errback=self.request_failed,
+                                 meta={'frontier_id': id, 'frontier_depth': depth}, dont_filter=True)
+
+    def request_failed(self, failure):
+        self.request_done(failure.request)
+        self.failed_ids.append(failure.request.meta['frontier_id'])
+        self.maybe_report()
+        yield from self.schedule_requests()
+
+    def parse(self, response):
+        self.request_done(response.request)
+        if not isinstance(response, TextResponse):
+            # Not a page: settled as failed, so it's neither stored nor leased again
+            self.failed_ids.append(response.meta['frontier_id'])
+            self.crawler.stats.inc_value('url_spider/non_text_responses')
+        else:
+            page_url = self.canonicalizer.canonicalize(response.url)
+            row = {'website_url': page_url, 'crawl_id': self.crawl_id, 'created_at': datetime.now()}
+            if self.extractor is not None:
+                row.update(page_content(self.extractor, response, hashlib.sha256(response.body).hexdigest()))
+            else:
+                row.update(status=False, lastmod=None)
+            self.pages[response.meta['frontier_id']] = row
+
+        try:
+            if isinstance(response, TextResponse):
+                self.follow_links(response)
+            self.maybe_report()
+        finally:
+            if self.crawl_done < self.max_links:
+                yield from self.schedule_requests()
+        if self.crawl_done >= self.max_links:
+            raise CloseSpider('max_links_reached')
+
+    def follow_links(self, response):
+        # Not Scrapy's depth: a leased request's depth is its link depth in the crawl, not
+        # in this worker's chain of responses
+        depth = response.meta['frontier_depth'] + 1
+        stats = self.crawler.stats
+        for next_page in response.css('a::attr(href)').getall():
+            next_page_url = self.canonicalizer.canonicalize(response.urljoin(next_page))
+            reason = self.link_filter.check(next_page_url, depth)
+            if reason is not None:
+                stats.inc_value(f'link_filter/dropped/{reason}')
+                continue
+            if self.frontier.add(next_page_url, depth):
+                self.discovered.append((next_page_url, depth))
+                stats.inc_value('link_filter/accepted')
+
+    def maybe_report(self):
+        if (len(self.pages) + len(self.failed_ids) >= self.report_interval_pages
+                or time.monotonic() - self.last_report >= self.report_interval_seconds):
+            self.report()
+
+    def report(self):
+        pages, self.pages = self.pages, {}
+        failed_ids, self.failed_ids = self.failed_ids, []
+        discovered, self.discovered = self.discovered, []
+        self.last_report = time.monotonic()
+        if not (pages or failed_ids or discovered):
+            return
+        db = SessionLocal()
+        try:
+            stored = cruds.report_frontier_results(db, self.crawl_id, self.worker_id, pages, failed_ids, discovered)
+        finally:
+            db.close()
+        self.link_count += stored
+        self.crawl_done += stored
+        self.next_lease = 0.0  # New links may have been queued
+        stats = self.crawler.stats
+        stats.inc_value('frontier/stored', stored)
+        stats.inc_value('frontier/lost_leases', len(pages) - stored)
+        stats.inc_value('frontier/failed', len(failed_ids))
+
+    def spider_idle(self, spider):
+        # Nothing in flight here. Report, then keep polling while other workers still hold
+        # leases: the links they report may be this worker's next batch.
+        self.report()
+        for request in self.schedule_requests():
+            self.crawler.engine.crawl(request)
+        if self.in_flight:
+            raise DontCloseSpider
+        db = SessionLocal()
+        try:
+            counts = cruds.get_frontier_counts(db, self.crawl_id)
+        finally:
+            db.close()
+        if counts['leased'] and counts['done'] < self.max_links:
+            raise DontCloseSpider
+
+    def progress(self):
+        return self.crawl_done, self.max_links
+
+    def closed(self, reason):
+        # Store what was fetched, hand unused leases back and settle the crawl-wide status
+        self.report()
+        db = SessionLocal()
+        try:
+            cruds.release_frontier_leases(db, self.crawl_id, self.worker_id)
+            status = cruds.update_distributed_crawl_status(db, self.crawl_id, self.max_links, pid=os.getpid())
+        finally:
+            db.close()
+        self.logger.info(f"Worker {self.worker_id} stopped ({reason}); crawl {self.crawl_id} is {status}")
+
 class ContentSpider(scrapy.Spider):
     name = 'content_spider'
+    # Conditional re-crawls get 304 Not Modified back, which HttpErrorMiddleware would drop
+    handle_httpstatus_list = [304]
 
-    def __init__(self, crawl_id=None, url=None, id=None, results=[], *args, **kwargs):
+    def __init__(self, crawl_id=None, urls_and_ids=None, resume=False, *args, **kwargs):
         super(ContentSpider, self).__init__(*args, **kwargs)
         self.crawl_id = crawl_id
-        self.results = results
-        self.pending_requests = []
-
-        # Load state if resuming
-        self.visited_ids = set()
+        self.pages_since_save = 0
+        self.cursor = 0  # Row id to continue after when the JOBDIR state has none
+        self.total = 0
+        self.state = {}  # Replaced by Scrapy's persisted spider state when the crawl has a JOBDIR
+        self.resuming = False
 
+        # The rows are paged from the database (content_crawl_target), never held in memory
         if self.crawl_id:
             db = SessionLocal()
             crawl_session = cruds.get_crawl_session(db, self.crawl_id)
-            if crawl_session and crawl_session.status == 'paused':
+            if crawl_session and (resume or crawl_session.status == 'paused'):
                 self.logger.info(f"Resuming crawl {self.crawl_id}")
-                if crawl_session.request_queue:
-                    self.pending_requests = pickle.loads(crawl_session.request_queue)
-                else:
-                    self.pending_requests = []
-                if crawl_session.visited_links:
-                    self.visited_ids = set(pickle.loads(crawl_session.visited_links))
-                else:
-                    self.visited_ids = set()
-            else:
-                # Initialize pending requests from start_urls
-                self.pending_requests = [(url, id) for url, id in zip(json.loads(crawl_session.start_urls), [item['id'] for item in kwargs.get('urls_and_ids', [])])]
-                self.visited_ids = set()
+                self.resuming = True
+                self.cursor = crawl_session.cursor or 0
+            elif urls_and_ids:
+                # Command-line crawls can still list their rows inline
+                cruds.add_content_crawl_targets(db, self.crawl_id, [item['id'] for item in urls_and_ids])
+                db.commit()
+            self.total = cruds.count_content_crawl_rows(db, self.crawl_id)
             db.close()
-        else:
-            # Handle case where crawl_id is not provided
-            self.pending_requests = []
-            self.visited_ids = set()
 
-    def start_requests(self):
-        for url, id in self.pending_requests:
-            if id not in self.visited_ids:
-                yield scrapy.Request(url, callback=self.parse, meta={'id': id})
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(ContentSpider, cls).from_crawler(crawler, *args, **kwargs)
+        spider.extractor = build_extractor(crawler.settings)
+        spider.near_duplicates = build_near_duplicate_detector(spider, crawler.settings, spider.resuming)
+        spider.skip_near_duplicates = crawler.settings.get('NEAR_DUPLICATE_ACTION', 'mark') == 'skip'
+        spider.chunk_size = crawler.settings.getint('CONTENT_CRAWL_CHUNK_SIZE', 1000)
+        return spider
 
-    def parse(self, response):
-        id = response.meta['id']
-        self.visited_ids.add(id)
+    @property
+    def in_flight_ids(self):
+        # Ids of the requests scheduled but not answered yet, kept in the spider state like
+        # UrlSpider.in_flight so a resumed crawl doesn't schedule them a second time
+        return self.state.setdefault('in_flight_ids', set())
 
-        # Extract content as before
-        title = response.css('title::text').get()
-        body_text = response.css('body *::text').getall()
-        body_text = ' '.join(body_text).strip()
-        html_content = response.text
+    @property
+    def unwritten_ids(self):
+        # Ids of the rows parsed but not yet written by the pipeline
+        return self.state.setdefault('unwritten_ids', set())
 
+    def reconcile_state(self):
+        # The JOBDIR state is only as recent as the last clean close. Rows written since
+        # (marked done with their content) are no longer pending, and a row the state still
+        # has waiting for the pipeline but that never got written is fetched again.
+        pending_ids = self.in_flight_ids | self.unwritten_ids
+        if not pending_ids:
+            return
         db = SessionLocal()
         try:
-            cruds.update_website_data(
-                db=db,
-                id=id,
-                title=title,
-                text=body_text,
-                html=html_content,
-                status=True  # Mark the status as completed
-            )
-            self.logger.info(f"Successfully updated record ID: {id} with content from {response.url}")
-        except Exception as e:
-            self.logger.error(f"Error updating database: {e}")
+            done_ids = cruds.get_done_content_crawl_targets(db, self.crawl_id, pending_ids)
         finally:
             db.close()
+        self.in_flight_ids.difference_update(done_ids)
+        self.unwritten_ids.difference_update(done_ids)
+        if self.unwritten_ids:
+            self.state['cursor'] = min(self.state.get('cursor', self.cursor), min(self.unwritten_ids) - 1)
+            self.unwritten_ids.clear()
+        if done_ids:
+            self.logger.info(f"{len(done_ids)} rows pending in the crawl state were already written")
+
+    def start_requests(self):
+        # Scrapy pulls start requests only as the downloader has room, so one chunk of rows
+        # is in memory at a time. The JOBDIR state has the exact position after a pause;
+        # rows already written are left out by the query.
+        if self.resuming:
+            self.reconcile_state()
+        cursor = self.state.get('cursor', self.cursor)
+        while True:
+            db = SessionLocal()
+            rows = cruds.get_content_crawl_rows(db, self.crawl_id, cursor, self.chunk_size)
+            # Rows fetched before are requested conditionally with the validators of that fetch
+            validators = cruds.get_website_data_validators(db, [id for id, url in rows])
+            db.close()
+            if not rows:
+                return
+            for id, url in rows:
+                cursor = self.state['cursor'] = id
+                if id in self.in_flight_ids:
+                    continue  # In flight when the crawl was paused; restored from the JOBDIR queue
+                headers = {}
+                previous = validators.get(id)
+                if previous:
+                    if previous['etag']:
+                        headers['If-None-Match'] = previous['etag']
+                    if previous['last_modified']:
+                        headers['If-Modified-Since'] = previous['last_modified']
+                self.in_flight_ids.add(id)
+                # Rows are distinct even when their URLs aren't; the dupefilter would drop the
+                # second request and leave its id in flight for good
+                yield scrapy.Request(url, callback=self.parse, errback=self.request_failed, headers=headers,
+                                     meta={'id': id, 'previous': previous}, dont_filter=True)
+
+    def request_failed(self, failure):
+        # The row keeps status=False, so a later crawl of the pending rows retries it
+        self.in_flight_ids.discard(failure.request.meta['id'])
+
+    def parse(self, response):
+        id = response.meta['id']
+        previous = response.meta.get('previous')
+        if id not in self.in_flight_ids:
+            # A request restored from the JOBDIR queue for a row written since
+            self.crawler.stats.inc_value('content/stale_responses')
+            return
+        self.in_flight_ids.discard(id)
+
+        if response.status == 304:
+            # Not modified: nothing was downloaded, nothing to parse; the row is only marked done
+            self.crawler.stats.inc_value('conditional/not_modified')
+            self.crawler.stats.inc_value('conditional/bytes_saved', previous['size'] if previous else 0)
+            self.crawler.stats.inc_value('conditional/db_writes_saved')
+            self.unwritten_ids.add(id)
+            yield ContentUnchangedItem(id=id)
+            self.count_page()
+            return
 
-        self.results.append({'id': id, 'content': body_text})
+        body_hash = hashlib.sha256(response.body).hexdigest()
+        if previous and previous['body_hash'] == body_hash:
+            # The server doesn't support validators, but the page is byte-for-byte the same
+            self.crawler.stats.inc_value('conditional/unchanged')
+            self.crawler.stats.inc_value('conditional/db_writes_saved')
+            self.unwritten_ids.add(id)
+            yield ContentUnchangedItem(id=id)
+            self.count_page()
+            return
 
+        content = page_content(self.extractor, response, body_hash)
+        if self.near_duplicates is not None:
+            url = response.meta.get('redirect_urls', [response.url])[0]
+            duplicate_of, signature_item = check_near_duplicate(self, url, content['text'], website_data_id=id)
+            if signature_item is not None:
+                yield signature_item
+            if duplicate_of is not None and self.skip_near_duplicates:
+                # The row is marked fetched, but its content isn't stored again
+                self.crawler.stats.inc_value('near_duplicates/skipped')
+                content.update(text=None, html=None)
+
+        # Update the record through WebScraperPipeline, which writes it in the next batch
+        self.unwritten_ids.add(id)
+        yield WebsiteContentItem(id=id, **content)
+        self.count_page()
+
+    def rows_written(self, written, failed):
+        # Called by WebScraperPipeline once a batch is committed. Rows it couldn't write
+        # keep status=False, like the failed requests.
+        for row in written + failed:
+            self.unwritten_ids.discard(row['id'])
+
+    def count_page(self):
         # Save state periodically
-        self.save_state()
+        self.state['pages_done'] = self.state.get('pages_done', 0) + 1
+        self.pages_since_save += 1
+        if self.pages_since_save >= self.settings.getint('CHECKPOINT_INTERVAL_PAGES', 100):
+            self.save_state()
+
+    def progress(self):
+        return self.state.get('pages_done', 0), self.total
 
     def save_state(self):
-        # Save the current state to the database
+        # Every row before the oldest one in flight or waiting for the pipeline has been
+        # fetched and written, so a crawl that dies without writing its JOBDIR state
+        # restarts from there
+        self.pages_since_save = 0
+        cursor = self.state.get('cursor', self.cursor)
+        pending_ids = self.in_flight_ids | self.unwritten_ids
+        if pending_ids:
+            cursor = min(cursor, min(pending_ids) - 1)
         db = SessionLocal()
-        crawl_session_update = schemas.CrawlSessionUpdate(
-            request_queue=pickle.dumps(self.pending_requests),
-            visited_links=pickle.dumps(list(self.visited_ids))
-        )
-        cruds.update_crawl_session(db, self.crawl_id, crawl_session_update)
+        cruds.update_crawl_session(db, self.crawl_id, schemas.CrawlSessionUpdate(cursor=cursor))
         db.close()
 
     def closed(self, reason):
         # When the spider is closed, save the state
         self.save_state()
+        stats = self.crawler.stats
+        self.logger.info(
+            f"Conditional re-crawl: {stats.get_value('conditional/not_modified', 0)} not modified, "
+            f"{stats.get_value('conditional/unchanged', 0)} unchanged, "
+            f"{stats.get_value('conditional/bytes_saved', 0)} bytes and "
+            f"{stats.get_value('conditional/db_writes_saved', 0)} DB writes saved"
+        )
         # Update the status
         db = SessionLocal()
         if reason == 'finished':
             status = 'completed'
         else:
-            status = 'stopped'
+            status = 'paused'
         cruds.update_crawl_session(db, self.crawl_id, schemas.CrawlSessionUpdate(status=status, pid=None))
         db.close()
\ No newline at end of file
@@ -0,0 +1,142 @@
+# crawler_backend/app/web_scraper/throttle.py
+
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+# Statuses that mean the host wants us to slow down
+BACKOFF_STATUSES = {429, 503}
+
+
+class DomainThrottle:
+    # Per-host state: the current concurrency/delay, the outcomes of the current
+    # adjustment window and running totals for the per-domain stats
+
+    def __init__(self, concurrency, delay):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.window_count = 0
+        self.window_errors = 0
+        self.window_latency = 0.0
+        self.responses = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.first_seen = time.monotonic()
+        self.last_seen = self.first_seen
+
+    def record(self, latency=None, size=0, error=False):
+        self.last_seen = time.monotonic()
+        self.window_count += 1
+        if error:
+            self.errors += 1
+            self.window_errors += 1
+        else:
+            self.responses += 1
+            self.bytes += size
+        if latency is not None:
+            self.latency += latency
+            self.window_latency += latency
+
+    def reset_window(self):
+        self.window_count = 0
+        self.window_errors = 0
+        self.window_latency = 0.0
+
+    def summary(self):
+        elapsed = self.last_seen - self.first_seen
+        return {
+            "responses": self.responses,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "avg_latency": round(self.latency / self.responses, 3) if self.responses else None,
+            "pages_per_second": round(self.responses / elapsed, 2) if elapsed > 0 else None,
+            "concurrency": self.concurrency,
+            "delay": round(self.delay, 3),
+        }
+
+
+class AdaptiveConcurrencyMiddleware:
+    # Adjusts each downloader slot (one per host) from what it observes: concurrency grows by
+    # one per window of fast, clean responses and halves on errors, 429/503 or slow responses
+    # (AIMD). Backoff also raises the slot delay; DOWNLOAD_DELAY stays the floor and
+    # CONCURRENT_REQUESTS_PER_DOMAIN the ceiling.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.max_concurrency = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self.start_concurrency = min(settings.getint('ADAPTIVE_CONCURRENCY_START', 2), self.max_concurrency)
+        self.target_latency = settings.getfloat('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', 1.0)
+        self.max_error_rate = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE', 0.1)
+        self.window = settings.getint('ADAPTIVE_CONCURRENCY_WINDOW', 10)
+        self.min_delay = settings.getfloat('DOWNLOAD_DELAY')
+        self.max_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_DELAY', 30.0)
+        self.domains = {}  # download slot key -> DomainThrottle
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def get_slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def request_reached_downloader(self, request, spider):
+        # The downloader has just created or picked the slot; new hosts start slow
+        key, slot = self.get_slot(request)
+        if slot is not None and key not in self.domains:
+            self.domains[key] = DomainThrottle(self.start_concurrency, max(slot.delay, self.min_delay))
+            slot.concurrency = self.start_concurrency
+
+    def process_response(self, request, response, spider):
+        error = response.status in BACKOFF_STATUSES or response.status >= 500
+        self.observe(request, request.meta.get('download_latency'), len(response.body), error,
+                     backoff=response.status in BACKOFF_STATUSES)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self.observe(request, None, 0, True)
+
+    def observe(self, request, latency, size, error, backoff=False):
+        key, slot = self.get_slot(request)
+        domain = self.domains.get(key)
+        if slot is None or domain is None:
+            return
+        domain.record(latency, size, error)
+        if backoff:
+            self.decrease(domain)
+        elif domain.window_count >= self.window:
+            answered = domain.window_count - domain.window_errors
+            avg_latency = domain.window_latency / answered if answered else None
+            if domain.window_errors / domain.window_count > self.max_error_rate:
+                self.decrease(domain)
+            elif avg_latency is not None and avg_latency > 2 * self.target_latency:
+                domain.concurrency = max(1, domain.concurrency // 2)
+            elif avg_latency is not None and avg_latency <= self.target_latency:
+                domain.concurrency = min(self.max_concurrency, domain.concurrency + 1)
+                domain.delay = max(self.min_delay, domain.delay / 2)
+            domain.reset_window()
+        else:
+            return
+        slot.concurrency = domain.concurrency
+        slot.delay = domain.delay
+        self.crawler.stats.set_value(f'throttle/domains/{key}', domain.summary())
+
+    def decrease(self, domain):
+        domain.concurrency = max(1, domain.concurrency // 2)
+        domain.delay = min(self.max_delay, max(domain.delay * 2, 0.5))
+        domain.reset_window()
+        self.crawler.stats.inc_value('throttle/backoffs')
+
+    def spider_closed(self, spider):
+        for key, domain in self.domains.items():
+            summary = domain.summary()
+            self.crawler.stats.set_value(f'throttle/domains/{key}', summary)
+            spider.logger.info(f"Domain {key}: {summary}")
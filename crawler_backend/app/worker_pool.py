@@ -0,0 +1,186 @@
+# crawler_backend/app/worker_pool.py
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+
+# Number of long-lived crawler processes; 0 falls back to one run_crawler.py process per crawl
+CRAWLER_POOL_WORKERS = int(os.getenv("CRAWLER_POOL_WORKERS", "2"))
+# Spiders run concurrently inside one worker's reactor
+CRAWLER_POOL_MAX_CRAWLS_PER_WORKER = int(os.getenv("CRAWLER_POOL_MAX_CRAWLS_PER_WORKER", "4"))
+
+
+def worker_main(jobs, control, events, max_crawls):
+    # Entry point of a worker process: one Twisted reactor running up to `max_crawls`
+    # spiders at a time, fed from the shared job queue. Imports happen here so the
+    # interpreter, Scrapy and the project settings are loaded once per worker, not per crawl.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The API process shuts workers down
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))  # scrapy.cfg lives next to this file
+
+    from scrapy.crawler import Crawler, CrawlerRunner
+    from scrapy.utils.log import configure_logging
+    from scrapy.utils.misc import create_instance, load_object
+    from scrapy.utils.project import get_project_settings
+    from scrapy.utils.reactor import install_reactor
+    from twisted.python.failure import Failure
+
+    settings = get_project_settings()
+    install_reactor(settings["TWISTED_REACTOR"], settings["ASYNCIO_EVENT_LOOP"])
+    from twisted.internet import reactor
+
+    from app.run_crawler import (resolve_request_data, get_spider_args, get_crawl_settings, prepare_jobdir,
+                                 cleanup_crawl)
+
+    configure_logging(settings)
+    runner = CrawlerRunner(settings)
+    resolver = create_instance(load_object(settings["DNS_RESOLVER"]), settings, runner, reactor=reactor)
+    resolver.install_on_reactor()
+    reactor.getThreadPool().adjustPoolsize(maxthreads=settings.getint("REACTOR_THREADPOOL_MAXSIZE"))
+
+    pid = os.getpid()
+    running = {}  # crawl_id -> Crawler
+    slots = threading.Semaphore(max_crawls)
+
+    def start_crawl(request_data):
+        crawl_id = request_data.get('crawl_id')
+        try:
+            request_data = resolve_request_data(request_data)
+            spider_class, spider_args = get_spider_args(request_data)
+            crawl_settings = settings.copy()
+            crawl_settings.setdict(get_crawl_settings(request_data, settings), priority='cmdline')
+            prepare_jobdir(crawl_settings)
+            crawler = runner.create_crawler(Crawler(spider_class, crawl_settings))
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Invalid crawl job {crawl_id}: {e}")
+            slots.release()
+            events.put(('failed', crawl_id, pid, f"Invalid crawl job: {e}"))
+            return
+        running[crawl_id] = crawler
+        events.put(('started', crawl_id, pid, None))
+        d = runner.crawl(crawler, **spider_args)
+        d.addBoth(finish_crawl, crawl_id)
+
+    def finish_crawl(result, crawl_id):
+        crawler = running.pop(crawl_id, None)
+        if crawler is not None and crawler.stats is not None:
+            cleanup_crawl(crawler)
+        slots.release()
+        if isinstance(result, Failure):
+            # The crawl raised instead of closing its spider, which never got to record a status
+            logging.getLogger(__name__).error(f"Crawl {crawl_id} failed:\n{result.getTraceback()}")
+            events.put(('failed', crawl_id, pid, result.getErrorMessage()))
+        else:
+            events.put(('finished', crawl_id, pid, None))
+
+    def stop_crawl(crawl_id):
+        crawler = running.get(crawl_id)
+        if crawler is not None:
+            crawler.stop()
+
+    def shutdown():
+        d = runner.stop()
+        d.addBoth(lambda _: reactor.stop())
+
+    def take_jobs():
+        # Only take a job once a slot is free so queued jobs stay available to idle workers
+        while True:
+            slots.acquire()
+            request_data = jobs.get()
+            reactor.callFromThread(start_crawl, request_data)
+
+    def take_control():
+        while True:
+            command, crawl_id = control.get()
+            if command == 'shutdown':
+                reactor.callFromThread(shutdown)
+                return
+            reactor.callFromThread(stop_crawl, crawl_id)
+
+    threading.Thread(target=take_jobs, daemon=True).start()
+    threading.Thread(target=take_control, daemon=True).start()
+    reactor.run(installSignalHandlers=False)
+
+
+class CrawlerWorkerPool:
+    # Long-lived crawler processes taking crawl jobs (run_crawler.py request data) from a
+    # queue, so starting a crawl is a queue put instead of a new interpreter
+
+    def __init__(self, max_workers=CRAWLER_POOL_WORKERS, max_crawls_per_worker=CRAWLER_POOL_MAX_CRAWLS_PER_WORKER,
+                 on_event=None):
+        self.max_workers = max_workers
+        self.max_crawls_per_worker = max_crawls_per_worker
+        self.on_event = on_event  # Called as on_event(event, crawl_id, pid, error) from the event thread
+        self.context = multiprocessing.get_context('spawn')
+        self.jobs = self.context.Queue()
+        self.events = self.context.Queue()
+        self.workers = {}  # pid -> (process, control queue)
+        self.assignments = {}  # crawl_id -> worker pid
+        self.lock = threading.Lock()
+
+    def start(self):
+        for _ in range(self.max_workers):
+            self.spawn_worker()
+        threading.Thread(target=self.read_events, daemon=True).start()
+
+    def spawn_worker(self):
+        control = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main,
+            args=(self.jobs, control, self.events, self.max_crawls_per_worker),
+            daemon=True,
+        )
+        process.start()
+        self.workers[process.pid] = (process, control)
+        return process.pid
+
+    def reap_workers(self):
+        # Replace worker processes that died; returns the PIDs of the live workers
+        for pid, (process, control) in list(self.workers.items()):
+            if not process.is_alive():
+                del self.workers[pid]
+                with self.lock:
+                    self.assignments = {c: p for c, p in self.assignments.items() if p != pid}
+                self.spawn_worker()
+        return list(self.workers)
+
+    def submit(self, request_data):
+        self.jobs.put(request_data)
+
+    def stop_crawl(self, crawl_id):
+        # Ask the worker running this crawl to stop it; False if no worker has it
+        with self.lock:
+            pid = self.assignments.get(crawl_id)
+        if pid is None or pid not in self.workers:
+            return False
+        self.workers[pid][1].put(('stop', crawl_id))
+        return True
+
+    def is_running(self, crawl_id):
+        with self.lock:
+            return crawl_id in self.assignments
+
+    def read_events(self):
+        while True:
+            try:
+                event, crawl_id, pid, error = self.events.get()
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                if event == 'started':
+                    self.assignments[crawl_id] = pid
+                else:
+                    self.assignments.pop(crawl_id, None)
+            if self.on_event:
+                self.on_event(event, crawl_id, pid, error)
+
+    def shutdown(self, timeout=30):
+        # Workers stop their running crawls (spiders close as 'shutdown') and exit
+        for process, control in self.workers.values():
+            control.put(('shutdown', None))
+        for process, control in self.workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.workers = {}
@@ -0,0 +1,5 @@
+# crawler_backend/benchmarks/__main__.py
+
+from benchmarks.runner import main
+
+main()
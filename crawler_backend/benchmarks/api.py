@@ -0,0 +1,353 @@
+# crawler_backend/benchmarks/api.py
+
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+from uuid import uuid4
+
+from sqlalchemy import select, func
+
+from app import cruds, database, schemas
+from app.models import WebsiteData
+from benchmarks.crawl import crawl_rows
+from benchmarks.harness import (
+    BACKEND_DIR, ChildProcess, ProcessTreeMonitor, benchmark_env, latency_summary, rate, wait_until,
+)
+from benchmarks.micro import seed_pages
+from benchmarks.site import SiteServer, SyntheticSite, WORDS
+
+# Benchmarks of the FastAPI app served by uvicorn in a child process: crawls started and
+# followed through the endpoints, endpoint latency under concurrent load, crawl start
+# latency through the worker pool and bulk ingestion memory.
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ApiClient:
+    # Keep-alive HTTP client on the standard library (one per thread)
+
+    def __init__(self, base_url, timeout=120):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        # (status, body, seconds); reconnects once when the server dropped the connection
+        for attempt in (0, 1):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            started = time.perf_counter()
+            try:
+                self.connection.request(method, path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            return response.status, data, time.perf_counter() - started
+
+    def json(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        status, data, seconds = self.request(method, path, body, {"Content-Type": "application/json"} if body else None)
+        try:
+            data = json.loads(data) if data else None
+        except ValueError:
+            pass
+        return status, data, seconds
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ApiServer:
+    # uvicorn serving app.main:app on a free local port, with the process tree (the API and
+    # the crawlers or pool workers it starts) monitored. `env` sets the app's settings.
+
+    def __init__(self, workdir, name="api", **env):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.process = ChildProcess(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            benchmark_env(workdir, CRAWLER_LOG_LEVEL="INFO", **env), BACKEND_DIR, os.path.join(workdir, f"{name}.log"),
+        )
+        self.monitor = ProcessTreeMonitor(self.process.pid).start()
+        self.client = ApiClient(self.base_url)
+        self.result = None
+
+    def wait_ready(self, timeout=60):
+        def ready():
+            if not self.process.running():
+                raise RuntimeError(f"API server exited, see {self.process.log_path}")
+            try:
+                return self.client.request("GET", "/openapi.json")[0] == 200
+            except OSError:
+                self.client.close()
+                return False
+        if not wait_until(ready, timeout):
+            raise RuntimeError(f"API server not ready after {timeout}s, see {self.process.log_path}")
+
+    def wait_for_status(self, crawl_id, statuses, timeout, interval=0.5):
+        # Poll /crawl-status/ until the crawl reaches one of `statuses`; returns its last status
+        last = {}
+
+        def reached():
+            status, body, _ = self.client.json("GET", f"/crawl-status/{crawl_id}")
+            if status == 200:
+                last.update(body)
+            return last.get("status") in statuses
+        wait_until(reached, timeout, interval)
+        return last
+
+    def stop(self):
+        # uvicorn shuts down gracefully on SIGINT, stopping the worker pool with it
+        if self.result is None:
+            self.client.close()
+            self.process.signal(signal.SIGINT)
+            process = self.process.finish(120)
+            tree = self.monitor.stop()
+            self.result = {
+                "api_peak_rss_mb": tree["root_peak_rss_mb"] or process["peak_rss_mb"],
+                "crawler_peak_rss_mb": tree["child_peak_rss_mb"],
+                "peak_total_rss_mb": tree["peak_total_rss_mb"],
+                "cpu_seconds": tree["cpu_seconds"] if tree["cpu_seconds"] is not None else process["cpu_seconds"],
+                "processes": tree["processes"],
+            }
+        return self.result
+
+    def __enter__(self):
+        try:
+            self.wait_ready()
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def bench_api_crawl(params, workdir):
+    # A URL crawl of the site started with POST /crawl-url/ and followed on /crawl-status/,
+    # then a content crawl of its pages with POST /crawl-content/pending
+    site = SyntheticSite(**params['site'])
+    results = {}
+    with SiteServer(site) as server, ApiServer(workdir, "api_crawl", CRAWLER_POOL_WORKERS=params['pool_workers']) as api:
+        started = time.monotonic()
+        status, body, post_seconds = api.client.json("POST", "/crawl-url/", {
+            "start_urls": [server.base_url + "/"], "max_links": site.pages, "depth_limit": 50,
+            "concurrent_requests": params['concurrent_requests'],
+        })
+        if status != 200:
+            raise RuntimeError(f"POST /crawl-url/ answered {status}: {body}")
+        url_crawl_id = body['crawl_id']
+        final = api.wait_for_status(url_crawl_id, ("completed", "paused"), params['timeout'])
+        url_seconds = time.monotonic() - started
+        rows, _ = crawl_rows(url_crawl_id)
+        results["url_crawl"] = {
+            "status": final.get("status"),
+            "post_ms": round(post_seconds * 1000, 3),
+            "seconds": round(url_seconds, 3),
+            "pages_saved": rows,
+            "pages_per_second": rate(rows, url_seconds),
+        }
+
+        started = time.monotonic()
+        status, body, post_seconds = api.client.json("POST", "/crawl-content/pending", {})
+        if status != 200:
+            raise RuntimeError(f"POST /crawl-content/pending answered {status}: {body}")
+        final = api.wait_for_status(body['crawl_id'], ("completed", "paused"), params['timeout'])
+        content_seconds = time.monotonic() - started
+        db = database.SessionLocal()
+        fetched = db.scalar(select(func.count(WebsiteData.id))
+                            .where(WebsiteData.crawl_id == url_crawl_id, WebsiteData.status.is_(True)))
+        db.close()
+        results["content_crawl"] = {
+            "status": final.get("status"),
+            "post_ms": round(post_seconds * 1000, 3),
+            "seconds": round(content_seconds, 3),
+            "pages_saved": fetched,
+            "pages_per_second": rate(fetched, content_seconds),
+        }
+        results["site"] = server.stats()
+    results["server"] = api.result
+    return results
+
+
+def run_load(base_url, paths, clients, duration):
+    # `clients` threads requesting `paths` round robin for `duration` seconds
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client_loop(offset):
+        client = ApiClient(base_url)
+        mine, failed = [], 0
+        k = offset
+        while time.monotonic() < deadline:
+            try:
+                status, _, seconds = client.request("GET", paths[k % len(paths)])
+            except OSError:
+                status, seconds = None, 0
+            k += 1
+            if status == 200:
+                mine.append(seconds)
+            else:
+                failed += 1
+        client.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client_loop, args=(k,)) for k in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.monotonic() - started
+    return {"requests_per_second": rate(len(latencies), seconds), "errors": sum(errors), **latency_summary(latencies)}
+
+def bench_api_latency(params, workdir):
+    # p50/p99 latency and requests/sec of the read endpoints under params['clients']
+    # concurrent clients, on a database holding params['pages'] fetched pages
+    site = SyntheticSite(pages=params['pages'], page_size=params['page_size'])
+    crawl_id = str(uuid4())
+    db = database.SessionLocal()
+    cruds.create_crawl_session(db, schemas.CrawlSessionCreate(
+        crawl_id=crawl_id, spider_name='url_spider', crawl_type='url_crawl', start_urls=["http://bench.example/"],
+        max_links=params['pages'], options={"extract_content": True},
+    ))
+    seed_pages(db, site, crawl_id, params['pages'])
+    cruds.update_crawl_session(db, crawl_id, schemas.CrawlSessionUpdate(status='completed'))
+    ids = db.scalars(select(WebsiteData.id).where(WebsiteData.crawl_id == crawl_id).order_by(WebsiteData.id)).all()
+    db.close()
+
+    rng = random.Random(1)
+    content_words = [word for word in WORDS if len(word) > 3]
+    endpoints = {
+        "crawl_status": [f"/crawl-status/{crawl_id}"],
+        "crawl_results_first_page": [f"/crawl-results/{crawl_id}?limit={params['results_limit']}"],
+        "crawl_results_deep_page": [f"/crawl-results/{crawl_id}?limit={params['results_limit']}&after_id={id}"
+                                    for id in rng.sample(ids, min(len(ids), 50))],
+        "search": [f"/search?q={quote(' '.join(rng.sample(content_words, 2)))}" for _ in range(50)],
+        "crawl_queue": ["/crawl-queue/"],
+        "metrics": ["/metrics"],
+    }
+    results = {}
+    with ApiServer(workdir, "api_latency", CRAWLER_POOL_WORKERS=params['pool_workers']) as api:
+        for name, paths in endpoints.items():
+            run_load(api.base_url, paths, params['clients'], min(1.0, params['duration']))  # Warm-up
+            results[name] = run_load(api.base_url, paths, params['clients'], params['duration'])
+    return {"clients": params['clients'], "endpoints": results, "server": api.result}
+
+
+def bench_worker_pool(params, workdir):
+    # params['crawls'] small crawls posted at once to /crawl-url/, with one run_crawler.py
+    # process per crawl (CRAWLER_POOL_WORKERS=0) and through the worker pool: request
+    # latency, time from the request to the crawl's first page, and memory of the whole tree
+    site = SyntheticSite(**params['site'])
+    results = {}
+    with SiteServer(site) as server:
+        for mode, env in params['modes'].items():
+            server.reset_stats()
+            env = {"CRAWL_SCHEDULER_MAX_PER_DOMAIN": params['crawls'], **env}
+            with ApiServer(workdir, f"worker_pool_{mode}", **env) as api:
+                posts = [None] * params['crawls']
+
+                def post(k):
+                    # Every crawl starts on its own URL, so its first fetch can be told apart
+                    path = f"{site.path(k % (site.pages - 1) + 1)}?crawl={k}"
+                    client = ApiClient(api.base_url)
+                    sent_at = time.time()
+                    status, body, seconds = client.json("POST", "/crawl-url/", {
+                        "start_urls": [server.base_url + path], "max_links": params['max_links'], "depth_limit": 1,
+                        "concurrent_requests": 4,
+                    })
+                    client.close()
+                    posts[k] = (path, sent_at, seconds, body.get('crawl_id') if status == 200 else None)
+
+                started = time.monotonic()
+                threads = [threading.Thread(target=post, args=(k,)) for k in range(params['crawls'])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                pending = {crawl_id for _, _, _, crawl_id in posts if crawl_id}
+
+                def all_done():
+                    for crawl_id in list(pending):
+                        status, body, _ = api.client.json("GET", f"/crawl-status/{crawl_id}")
+                        if status == 200 and body.get("status") in ("completed", "paused"):
+                            pending.discard(crawl_id)
+                    return not pending
+                wait_until(all_done, params['timeout'], 0.5)
+                seconds = time.monotonic() - started
+
+            first_fetch = server.first_path_request
+            start_latencies = [first_fetch[path] - sent_at for path, sent_at, _, _ in posts if path in first_fetch]
+            results[mode] = {
+                "request_ms": latency_summary([seconds for _, _, seconds, _ in posts]),
+                "start_latency_ms": latency_summary(start_latencies),
+                "crawls_started": len(start_latencies),
+                "crawls_unfinished": len(pending),
+                "all_finished_seconds": round(seconds, 3),
+                "server": api.result,
+            }
+    return {"crawls": params['crawls'], "modes": results}
+
+
+def bench_bulk_ingest(params, workdir):
+    # Upload params['lines'] NDJSON lines to /crawl-content/bulk in one streamed request, let
+    # the content crawl run for params['crawl_seconds'] and pause it: ingestion lines/sec and
+    # the peak RSS of the API and of the crawler, which shouldn't grow with the upload
+    site = SyntheticSite(**params['site'])
+    with SiteServer(site) as server, ApiServer(workdir, "bulk_ingest", CRAWLER_POOL_WORKERS=1) as api:
+        def lines():
+            for start in range(0, params['lines'], 1000):
+                yield "".join(
+                    json.dumps({"url": f"{server.base_url}{site.path(i % site.pages)}?n={i}"}) + "\n"
+                    for i in range(start, min(start + 1000, params['lines']))
+                ).encode()
+
+        connection = http.client.HTTPConnection("127.0.0.1", api.port, timeout=3600)
+        started = time.monotonic()
+        connection.request("POST", "/crawl-content/bulk", body=lines(),
+                           headers={"Content-Type": "application/x-ndjson"}, encode_chunked=True)
+        response = connection.getresponse()
+        body = json.loads(response.read() or b"{}")
+        upload_seconds = time.monotonic() - started
+        connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"POST /crawl-content/bulk answered {response.status}: {body}")
+
+        crawl_id = body['crawl_id']
+        time.sleep(params['crawl_seconds'])
+        fetched = server.stats()['requests'].get('page', 0)
+        api.client.json("POST", "/pause-crawl/", {"crawl_id": crawl_id})
+        final = api.wait_for_status(crawl_id, ("paused", "completed"), 300)
+    return {
+        "lines": body.get('lines'),
+        "upload_seconds": round(upload_seconds, 3),
+        "lines_per_second": rate(params['lines'], upload_seconds),
+        "pages_fetched_while_running": fetched,
+        "fetch_rate": rate(fetched, params['crawl_seconds']),
+        "final_status": final.get("status"),
+        "server": api.result,
+    }
@@ -0,0 +1,382 @@
+# crawler_backend/benchmarks/crawl.py
+
+import os
+import signal
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import select, func, distinct
+
+from app import cruds, database, schemas
+from app.models import WebsiteData, CrawlSession
+from benchmarks.harness import (
+    CRAWLER_STAT_PREFIXES, benchmark_env, parse_scrapy_stats, rate, run_crawler, start_crawler, stats_subset,
+    wait_until,
+)
+from benchmarks.site import SiteServer, SyntheticSite
+
+# End-to-end crawls of the synthetic site through run_crawler.py, the way the API starts
+# them. Each benchmark serves its own site on a local port and returns its metrics.
+
+CRAWL_OPTIONS = {
+    "follow_external": False,
+    "depth_limit": 50,
+    "concurrent_requests": 16,
+    "include_patterns": None,
+    "exclude_patterns": None,
+    "url_canonicalization": {"strip_fragments": True, "sort_query_params": True,
+                             "drop_tracking_params": True, "strip_trailing_slash": False},
+    "extract_content": False,
+    "near_duplicates": None,
+    "sitemap_discovery": False,
+    "sitemap_fallback": True,
+    "distributed": False,
+}
+
+
+def crawl_env(workdir):
+    return benchmark_env(workdir, CRAWLER_LOG_LEVEL="INFO")
+
+def log_path(workdir, name):
+    return os.path.join(workdir, f"{name}-{int(time.time() * 1000)}.log")
+
+def url_crawl(server, max_links, **options):
+    # Create a URL crawl session the way POST /crawl-url/ does; returns its request data
+    crawl_id = str(uuid4())
+    options = {**CRAWL_OPTIONS, **options}
+    db = database.SessionLocal()
+    cruds.create_crawl_session(db, schemas.CrawlSessionCreate(
+        crawl_id=crawl_id,
+        spider_name='distributed_url_spider' if options['distributed'] else 'url_spider',
+        crawl_type='url_crawl',
+        start_urls=[server.base_url + "/"],
+        max_links=max_links,
+        options=options,
+    ))
+    db.close()
+    return {"crawl_id": crawl_id, "start_urls": [server.base_url + "/"], "max_links": max_links, **options}
+
+def content_crawl(ids, concurrent_requests=16):
+    # Create a content crawl session over WebsiteData rows, like POST /crawl-content/
+    crawl_id = str(uuid4())
+    db = database.SessionLocal()
+    cruds.create_crawl_session(db, schemas.CrawlSessionCreate(
+        crawl_id=crawl_id, spider_name='content_spider', crawl_type='content_crawl', start_urls=[], max_links=None,
+        options={"delay": 0.0, "concurrent_requests": concurrent_requests},
+    ))
+    cruds.add_content_crawl_targets(db, crawl_id, ids)
+    db.commit()
+    db.close()
+    return {"crawl_id": crawl_id, "crawl_type": "content_crawl", "delay": 0.0,
+            "concurrent_requests": concurrent_requests}
+
+def site_rows(site, server):
+    # One unfetched WebsiteData row per page of the site, as a URL crawl leaves them; returns their ids
+    db = database.SessionLocal()
+    first = (db.scalar(select(func.max(WebsiteData.id))) or 0) + 1
+    for start in range(0, site.pages, 10_000):
+        cruds.bulk_create_website_data(db, [
+            {'website_url': server.base_url + site.path(page), 'status': False, 'crawl_id': None,
+             'created_at': datetime.now()}
+            for page in range(start, min(start + 10_000, site.pages))
+        ])
+        db.commit()
+    ids = db.scalars(select(WebsiteData.id).where(WebsiteData.id >= first).order_by(WebsiteData.id)).all()
+    db.close()
+    return ids
+
+def crawl_rows(crawl_id):
+    # Rows of a URL crawl, and how many distinct URLs they hold
+    db = database.SessionLocal()
+    rows, urls = db.execute(
+        select(func.count(WebsiteData.id), func.count(distinct(WebsiteData.website_url)))
+        .where(WebsiteData.crawl_id == crawl_id)
+    ).one()
+    db.close()
+    return rows, urls
+
+def fetched_rows(ids):
+    db = database.SessionLocal()
+    count = 0
+    for start in range(0, len(ids), 500):
+        count += db.scalar(select(func.count(WebsiteData.id)).where(
+            WebsiteData.id.in_(ids[start:start + 500]), WebsiteData.status.is_(True)))
+    db.close()
+    return count
+
+def session_status(crawl_id):
+    db = database.SessionLocal()
+    status = db.scalar(select(CrawlSession.status).where(CrawlSession.crawl_id == crawl_id))
+    db.close()
+    return status
+
+def db_writes(stats):
+    return (stats.get('db_writer/rows_inserted', 0) + stats.get('db_writer/rows_updated', 0)
+            + stats.get('frontier/stored', 0))
+
+def crawl_summary(result, server, pages_saved):
+    # Metrics of one finished crawl: process (wait4), site (server counters) and crawler stats
+    stats = result['stats']
+    writes = db_writes(stats)
+    crawl_seconds = stats.get('elapsed_time_seconds') or result['wall_seconds']
+    return {
+        "wall_seconds": result['wall_seconds'],
+        "crawl_seconds": round(crawl_seconds, 3),
+        "cpu_seconds": result['cpu_seconds'],
+        "peak_rss_mb": result['peak_rss_mb'],
+        "pages_saved": pages_saved,
+        "pages_per_second": rate(pages_saved, crawl_seconds),
+        "db_writes": writes,
+        "db_writes_per_second": rate(writes, crawl_seconds),
+        "site": server.stats(),
+        "crawler_stats": stats_subset(stats, CRAWLER_STAT_PREFIXES),
+    }
+
+
+def bench_url_spider(params, workdir):
+    # UrlSpider over the whole site: pages/sec, DB writes/sec, and how many duplicate URL
+    # variants the canonicalization kept out of the frontier
+    site = SyntheticSite(**params['site'])
+    with SiteServer(site) as server:
+        request_data = url_crawl(server, site.pages, concurrent_requests=params['concurrent_requests'],
+                                 extract_content=params.get('extract_content', False))
+        result = run_crawler(request_data, crawl_env(workdir), log_path(workdir, "url_spider"))
+        rows, urls = crawl_rows(request_data['crawl_id'])
+        summary = crawl_summary(result, server, rows)
+    summary["duplicate_rows"] = rows - urls
+    return summary
+
+
+def bench_content_spider(params, workdir):
+    # ContentSpider over one row per page: pages/sec with extraction, content store and
+    # index writes
+    site = SyntheticSite(**params['site'])
+    with SiteServer(site) as server:
+        ids = site_rows(site, server)
+        request_data = content_crawl(ids, params['concurrent_requests'])
+        result = run_crawler(request_data, crawl_env(workdir), log_path(workdir, "content_spider"))
+        return crawl_summary(result, server, fetched_rows(ids))
+
+
+def bench_single_pass(params, workdir):
+    # The same site crawled as a URL crawl followed by a content crawl of its rows, and as a
+    # single URL crawl with extract_content: fetches and wall time of each
+    site = SyntheticSite(**params['site'])
+    env = crawl_env(workdir)
+    with SiteServer(site) as server:
+        request_data = url_crawl(server, site.pages, concurrent_requests=params['concurrent_requests'])
+        discover = run_crawler(request_data, env, log_path(workdir, "two_pass_urls"))
+        db = database.SessionLocal()
+        ids = db.scalars(select(WebsiteData.id).where(WebsiteData.crawl_id == request_data['crawl_id'])
+                         .order_by(WebsiteData.id)).all()
+        db.close()
+        content = run_crawler(content_crawl(ids, params['concurrent_requests']), env, log_path(workdir, "two_pass_content"))
+        two_pass_site = server.stats()
+
+        server.reset_stats()
+        request_data = url_crawl(server, site.pages, concurrent_requests=params['concurrent_requests'],
+                                 extract_content=True)
+        single = run_crawler(request_data, env, log_path(workdir, "single_pass"))
+        single_site = server.stats()
+        single_rows, _ = crawl_rows(request_data['crawl_id'])
+
+    two_pass_seconds = discover['wall_seconds'] + content['wall_seconds']
+    return {
+        "two_pass": {
+            "wall_seconds": round(two_pass_seconds, 3),
+            "cpu_seconds": round(discover['cpu_seconds'] + content['cpu_seconds'], 3),
+            "page_fetches": two_pass_site['requests'].get('page', 0),
+            "pages_saved": fetched_rows(ids),
+        },
+        "single_pass": {
+            "wall_seconds": single['wall_seconds'],
+            "cpu_seconds": single['cpu_seconds'],
+            "page_fetches": single_site['requests'].get('page', 0),
+            "pages_saved": single_rows,
+        },
+        "fetch_ratio": round(single_site['requests'].get('page', 0) / max(1, two_pass_site['requests'].get('page', 0)), 3),
+        "wall_time_ratio": round(single['wall_seconds'] / two_pass_seconds, 3),
+    }
+
+
+def bench_max_links(params, workdir):
+    # Pages fetched against max_links: a crawl should stop close to its budget instead of
+    # draining everything already queued
+    site = SyntheticSite(**params['site'])
+    results = {}
+    with SiteServer(site) as server:
+        for max_links in params['budgets']:
+            server.reset_stats()
+            request_data = url_crawl(server, max_links, concurrent_requests=params['concurrent_requests'])
+            result = run_crawler(request_data, crawl_env(workdir), log_path(workdir, f"max_links_{max_links}"))
+            rows, _ = crawl_rows(request_data['crawl_id'])
+            fetched = server.stats()['requests'].get('page', 0)
+            results[str(max_links)] = {
+                "page_fetches": fetched,
+                "pages_saved": rows,
+                "overshoot": fetched - max_links,
+                "wall_seconds": result['wall_seconds'],
+                "finish_reason": result['stats'].get('finish_reason'),
+            }
+    return {"budgets": results}
+
+
+def bench_conditional_recrawl(params, workdir):
+    # A content crawl of the whole site, then re-crawls after params['change_share'] of the
+    # pages changed: with validators (304s) and, on a site that ignores them, by body hash.
+    # Bytes transferred and DB writes against the first crawl.
+    site = SyntheticSite(**params['site'])
+    env = crawl_env(workdir)
+    results = {}
+    with SiteServer(site) as server:
+        ids = site_rows(site, server)
+
+        def crawl(name):
+            server.reset_stats()
+            result = run_crawler(content_crawl(ids, params['concurrent_requests']), env, log_path(workdir, name))
+            site_stats = server.stats()
+            results[name] = {
+                "wall_seconds": result['wall_seconds'],
+                "bytes_sent": site_stats['bytes_sent'],
+                "statuses": site_stats['statuses'],
+                "db_writes": db_writes(result['stats']),
+                "crawler_stats": stats_subset(result['stats'], ("conditional/", "db_writer/", "downloader/response_bytes")),
+            }
+
+        crawl("initial")
+        results["changed_pages"] = site.change(params['change_share'], round=1)
+        crawl("validators")
+        site.validators = False
+        results["changed_pages_hash"] = site.change(params['change_share'], round=2)
+        crawl("body_hash")
+
+    for name in ("validators", "body_hash"):
+        results[name]["bytes_saved_share"] = round(
+            1 - results[name]["bytes_sent"] / max(1, results["initial"]["bytes_sent"]), 3)
+        results[name]["db_writes_saved_share"] = round(
+            1 - results[name]["db_writes"] / max(1, results["initial"]["db_writes"]), 3)
+    return results
+
+
+def bench_shared_cache(params, workdir):
+    # Time to first page of a cold crawler process (robots.txt fetched, DNS resolved) and of
+    # the next ones, which find both in the shared cache. The site's robots.txt is slow.
+    site = SyntheticSite(**params['site'])
+    env = crawl_env(workdir)
+    runs = []
+    with SiteServer(site) as server:
+        for run in range(params['runs']):
+            server.reset_stats()
+            request_data = url_crawl(server, params['max_links'], concurrent_requests=params['concurrent_requests'])
+            crawler = start_crawler(request_data, env, log_path(workdir, f"shared_cache_{run}"))
+            result = crawler.finish(params.get('timeout', 600))
+            stats = parse_scrapy_stats(crawler.output())
+            first_page = server.first_request.get('page')
+            runs.append({
+                "time_to_first_page_ms": round((first_page - crawler.started_at) * 1000, 1) if first_page else None,
+                "wall_seconds": result['wall_seconds'],
+                "robots_fetches": server.stats()['requests'].get('robots', 0),
+                "shared_cache": stats_subset(stats, ("shared_cache/",)),
+            })
+    warm = [run["time_to_first_page_ms"] for run in runs[1:] if run["time_to_first_page_ms"] is not None]
+    return {
+        "cold_time_to_first_page_ms": runs[0]["time_to_first_page_ms"],
+        "warm_time_to_first_page_ms": round(sum(warm) / len(warm), 1) if warm else None,
+        "runs": runs,
+    }
+
+
+def bench_pause_resume(params, workdir):
+    # Stop a crawl with SIGTERM (as /pause-crawl/ does) at each share of params['pause_at'],
+    # resume it (as /resume-crawl/ does) and let it finish: every page must be fetched and
+    # stored exactly once. Done for a URL crawl and a content crawl.
+    site = SyntheticSite(**params['site'])
+    env = crawl_env(workdir)
+    results = {}
+    with SiteServer(site) as server:
+        for kind in ('url_crawl', 'content_crawl'):
+            server.reset_stats()
+            if kind == 'url_crawl':
+                request_data = url_crawl(server, site.pages, concurrent_requests=params['concurrent_requests'])
+            else:
+                ids = site_rows(site, server)
+                request_data = content_crawl(ids, params['concurrent_requests'])
+            started = time.monotonic()
+            pauses = []
+            for share in params['pause_at']:
+                crawler = start_crawler(request_data, env, log_path(workdir, f"{kind}_until_{share}"))
+                wait_until(lambda: not crawler.running()
+                           or server.stats()['pages_fetched'] >= share * site.pages, params.get('timeout', 600), 0.02)
+                signalled_at = server.stats()['pages_fetched']
+                crawler.signal(signal.SIGTERM)
+                crawler.finish(params.get('timeout', 600))
+                pauses.append({"pages_at_signal": signalled_at, "pages_when_stopped": server.stats()['pages_fetched'],
+                               "status": session_status(request_data['crawl_id'])})
+                request_data = {**request_data, "resume": True}
+            run_crawler(request_data, env, log_path(workdir, f"{kind}_final"))
+            site_stats = server.stats()
+            if kind == 'url_crawl':
+                rows, urls = crawl_rows(request_data['crawl_id'])
+            else:
+                rows = urls = fetched_rows(ids)
+            results[kind] = {
+                "pauses": pauses,
+                "status": session_status(request_data['crawl_id']),
+                "pages": site.pages,
+                "pages_fetched": site_stats['pages_fetched'],
+                "pages_fetched_more_than_once": site_stats['pages_fetched_more_than_once'],
+                "max_fetches_per_page": site_stats['max_fetches_per_page'],
+                "rows_saved": rows,
+                "duplicate_rows": rows - urls,
+                "wall_seconds": round(time.monotonic() - started, 3),
+            }
+    return results
+
+
+def bench_distributed(params, workdir):
+    # One distributed crawl of the site per entry of params['workers'], with that many
+    # run_crawler.py workers sharing its frontier table: pages/sec and duplicate work
+    site = SyntheticSite(**params['site'])
+    env = crawl_env(workdir)
+    results = {}
+    with SiteServer(site) as server:
+        for workers in params['workers']:
+            server.reset_stats()
+            request_data = url_crawl(server, site.pages, concurrent_requests=params['concurrent_requests'],
+                                     distributed=True)
+            crawlers = [start_crawler({"crawl_id": request_data['crawl_id'], "distributed": True}, env,
+                                      log_path(workdir, f"distributed_{workers}_{k}"))
+                        for k in range(workers)]
+            started = time.monotonic()
+            finished = [crawler.finish(params.get('timeout', 3600)) for crawler in crawlers]
+            seconds = time.monotonic() - started
+            rows, urls = crawl_rows(request_data['crawl_id'])
+            site_stats = server.stats()
+            results[str(workers)] = {
+                "wall_seconds": round(seconds, 3),
+                "pages_saved": rows,
+                "pages_per_second": rate(rows, seconds),
+                "duplicate_rows": rows - urls,
+                "pages_fetched_more_than_once": site_stats['pages_fetched_more_than_once'],
+                "cpu_seconds": round(sum(result['cpu_seconds'] for result in finished), 3),
+                "max_worker_rss_mb": max(result['peak_rss_mb'] for result in finished),
+                "failed_workers": sum(result['returncode'] != 0 for result in finished),
+                "status": session_status(request_data['crawl_id']),
+            }
+    return {"workers": results}
+
+
+def bench_sitemap_crawl(params, workdir):
+    # UrlSpider in sitemap discovery mode on a site listing every page in sitemaps: URLs
+    # stored per second and the crawler's memory with very large sitemaps
+    site = SyntheticSite(**params['site'], sitemap=True)
+    with SiteServer(site) as server:
+        request_data = url_crawl(server, site.pages, concurrent_requests=params['concurrent_requests'],
+                                 sitemap_discovery=True)
+        result = run_crawler(request_data, crawl_env(workdir), log_path(workdir, "sitemap"))
+        rows, urls = crawl_rows(request_data['crawl_id'])
+        summary = crawl_summary(result, server, rows)
+    summary["duplicate_rows"] = rows - urls
+    summary["urls_per_second"] = summary.pop("pages_per_second")
+    return summary
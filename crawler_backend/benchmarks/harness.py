@@ -0,0 +1,250 @@
+# crawler_backend/benchmarks/harness.py
+
+import datetime
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+RUN_CRAWLER = os.path.join(APP_DIR, "run_crawler.py")
+
+# Shared measuring helpers. Every benchmark runs in its own process (see runner.py), with
+# DATABASE_URL and the crawler's cache/job/content directories pointing into its work
+# directory, so the app modules can be imported at the top of the benchmark modules.
+
+
+def percentiles(values, points=(50, 99)):
+    # Nearest-rank percentiles, in the unit of `values`
+    if not values:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(values)
+    return {f"p{point}": ordered[min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))]
+            for point in points}
+
+def latency_summary(seconds):
+    # p50/p99/max of a list of durations, in milliseconds
+    summary = {key: round(value * 1000, 3) if value is not None else None
+               for key, value in percentiles(seconds).items()}
+    summary["max"] = round(max(seconds) * 1000, 3) if seconds else None
+    summary["samples"] = len(seconds)
+    return summary
+
+def rate(count, seconds):
+    return round(count / seconds, 2) if seconds > 0 else None
+
+def peak_rss_mb():
+    # Peak RSS of this process so far (ru_maxrss is in KiB on Linux, bytes on macOS)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def current_rss_mb():
+    # Current RSS of this process, for memory growth within a benchmark (None off Linux)
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except OSError:
+        return None
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def benchmark_env(workdir, **extra):
+    # Environment of the processes a benchmark starts: same database, and crawler state
+    # kept in the work directory instead of next to the code
+    env = dict(os.environ)
+    env.update({
+        "SHARED_CACHE_PATH": os.path.join(workdir, "crawl_cache.sqlite"),
+        "CRAWL_JOBDIR_ROOT": os.path.join(workdir, "jobs"),
+        "CONTENT_STORE_DIR": os.path.join(workdir, "content_store"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")])),
+    })
+    env.update({key: str(value) for key, value in extra.items()})
+    return env
+
+
+class ChildProcess:
+    # A process started by a benchmark, with its output in a log file. finish() reaps it with
+    # wait4, which returns the exact peak RSS and CPU time of that process.
+
+    def __init__(self, args, env, cwd, log_path):
+        self.log_path = log_path
+        self.log = open(log_path, "wb")
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.process = subprocess.Popen(args, env=env, cwd=cwd, stdout=self.log, stderr=subprocess.STDOUT)
+        self.pid = self.process.pid
+        self.result = None
+
+    def signal(self, signum=signal.SIGTERM):
+        if self.result is None:
+            self.process.send_signal(signum)
+
+    def running(self):
+        return self.result is None and self.process.poll() is None
+
+    def finish(self, timeout=None):
+        if self.result is not None:
+            return self.result
+        deadline = None if timeout is None else time.monotonic() + timeout
+        timed_out = False
+        while True:
+            pid, status, usage = os.wait4(self.pid, os.WNOHANG if deadline is not None else 0)
+            if pid:
+                break
+            if time.monotonic() > deadline:
+                self.process.kill()
+                deadline, timed_out = None, True
+            time.sleep(0.05)
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        self.log.close()
+        self.result = {
+            "returncode": self.process.returncode,
+            "timed_out": timed_out,
+            "wall_seconds": round(time.monotonic() - self.started, 3),
+            "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+            "peak_rss_mb": round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        }
+        return self.result
+
+    def output(self):
+        with open(self.log_path, "rb") as f:
+            return f.read().decode("utf-8", errors="replace")
+
+
+def start_crawler(request_data, env, log_path):
+    # run_crawler.py the way the API starts it, from the app directory (scrapy.cfg)
+    return ChildProcess([sys.executable, RUN_CRAWLER, json.dumps(request_data)], env, APP_DIR, log_path)
+
+def run_crawler(request_data, env, log_path, timeout=3600):
+    # Run a crawl to the end: process metrics plus the crawler's final Scrapy stats
+    crawler = start_crawler(request_data, env, log_path)
+    result = crawler.finish(timeout)
+    result["stats"] = parse_scrapy_stats(crawler.output())
+    if result["returncode"] != 0 or not result["stats"]:
+        raise RuntimeError(f"run_crawler.py failed ({result['returncode']}), see {log_path}")
+    return result
+
+
+def parse_scrapy_stats(log_text):
+    # The stats dict Scrapy logs when a spider closes ("Dumping Scrapy stats:"), last one wins
+    marker = log_text.rfind("Dumping Scrapy stats:")
+    if marker < 0:
+        return {}
+    # The pprinted dict runs until the next log line, which starts with a timestamp
+    lines = []
+    for line in log_text[marker:].splitlines()[1:]:
+        if not line.startswith(("{", " ")):
+            break
+        lines.append(line)
+    if not lines:
+        return {}
+    stats = eval("\n".join(lines), {"__builtins__": {}, "datetime": datetime})
+    return {key: value.isoformat() if isinstance(value, datetime.datetime) else value
+            for key, value in stats.items()}
+
+def stats_subset(stats, prefixes):
+    # The crawler stats worth keeping in the results
+    return {key: value for key, value in sorted(stats.items()) if key.startswith(prefixes)}
+
+CRAWLER_STAT_PREFIXES = (
+    "downloader/request_count", "downloader/response_count", "downloader/response_bytes",
+    "downloader/response_status_count", "item_scraped_count", "finish_reason", "elapsed_time_seconds",
+    "db_writer/", "conditional/", "canonicalize/", "link_filter/", "shared_cache/", "frontier/",
+    "sitemap/", "near_duplicates/", "retry/count",
+)
+
+
+class ProcessTreeMonitor:
+    # Samples the RSS and CPU time of a process and all its descendants from /proc (Linux),
+    # for servers whose crawlers run in child processes. Reports the peak RSS of the root
+    # process and of the largest child, the peak of the tree's total RSS and the CPU time
+    # used by the whole tree.
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}  # pid -> peak RSS
+        self.peak_total_rss = 0
+        self.cpu = {}  # pid -> last CPU seconds seen
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.available = os.path.isdir("/proc")
+
+    def start(self):
+        if self.available:
+            self.thread.start()
+        return self
+
+    def descendants(self):
+        children = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        fields = f.read().rsplit(")", 1)[1].split()
+                except OSError:
+                    continue
+                children.setdefault(int(fields[1]), []).append(int(entry))
+        tree, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            tree.append(pid)
+            stack.extend(children.get(pid, []))
+        return tree
+
+    def sample(self):
+        total = 0
+        for pid in self.descendants():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    status = dict(line.split(":", 1) for line in f if ":" in line)
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except (OSError, ValueError):
+                continue
+            rss = int(status.get("VmRSS", "0 kB").split()[0]) * 1024
+            hwm = int(status.get("VmHWM", "0 kB").split()[0]) * 1024
+            total += rss
+            self.peaks[pid] = max(self.peaks.get(pid, 0), hwm)
+            self.cpu[pid] = (int(fields[11]) + int(fields[12])) / self.ticks
+        self.peak_total_rss = max(self.peak_total_rss, total)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        if not self.available:
+            return {"root_peak_rss_mb": None, "child_peak_rss_mb": None, "peak_total_rss_mb": None,
+                    "cpu_seconds": None, "processes": None}
+        self.stopped.set()
+        self.thread.join()
+        children = [peak for pid, peak in self.peaks.items() if pid != self.pid]
+        return {
+            "root_peak_rss_mb": round(self.peaks.get(self.pid, 0) / 2 ** 20, 1),
+            "child_peak_rss_mb": round(max(children, default=0) / 2 ** 20, 1),
+            "peak_total_rss_mb": round(self.peak_total_rss / 2 ** 20, 1),
+            "cpu_seconds": round(sum(self.cpu.values()), 3),
+            "processes": len(self.peaks),
+        }
+
+
+def wait_until(predicate, timeout, interval=0.2):
+    # Poll `predicate` until it returns something truthy; returns it, or None on timeout
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(interval)
+    return None
@@ -0,0 +1,472 @@
+# crawler_backend/benchmarks/micro.py
+
+import gzip
+import hashlib
+import logging
+import os
+import pickle
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import uuid4
+
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from sqlalchemy import select, func
+
+from app import content_store, cruds, database, export, search_index
+from app.models import WebsiteData
+from app.schemas import WebsiteDataCreate
+from app.web_scraper.checkpoint import CrawlCheckpointer
+from app.web_scraper.extractor import PageTextExtractor
+from app.web_scraper.frontier import UrlFrontier, SpillQueue
+from app.web_scraper.near_duplicates import NearDuplicateIndex, simhash
+from app.web_scraper.pipelines import WebScraperPipeline
+from app.web_scraper.sitemaps import iter_sitemap
+from benchmarks.harness import current_rss_mb, latency_summary, percentiles, rate
+from benchmarks.site import SyntheticSite, WORDS, iter_sitemap_xml
+
+# Benchmarks of single components (checkpointing, frontier, DB writer, extraction, content
+# store, results queries, export, full-text index, SimHash, sitemap parsing) on synthetic
+# data, without running a crawl. Each takes its parameters and work directory and returns
+# its metrics.
+
+BASE_URL = "http://bench.example"
+
+
+def url(i):
+    return f"{BASE_URL}/section/{i % 100}/page-{i}.html"
+
+def page_row(site, page, extractor, crawl_id):
+    # A fetched page as the single-pass crawl stores it
+    html = site.render(page, BASE_URL)
+    title, text, stored_html = extractor.extract(html)
+    return {
+        'website_url': f"{BASE_URL}{site.path(page)}", 'crawl_id': crawl_id, 'created_at': datetime.now(),
+        'title': title, 'text': text, 'html': stored_html, 'status': True, 'etag': site.etag(page),
+        'last_modified': site.last_modified(page), 'body_hash': hashlib.sha256(html).hexdigest(),
+    }
+
+def seed_pages(db, site, crawl_id, count, batch_size=500):
+    # Store `count` pages with their content (content store, search index) in batches;
+    # returns the raw bytes of html+text and the seconds spent writing
+    extractor = PageTextExtractor()
+    raw_bytes, seconds = 0, 0.0
+    for start in range(0, count, batch_size):
+        rows = [page_row(site, page, extractor, crawl_id) for page in range(start, min(start + batch_size, count))]
+        raw_bytes += sum(len(row['html'].encode()) + len(row['text'].encode()) for row in rows)
+        started = time.perf_counter()
+        cruds.bulk_create_website_pages(db, rows)
+        db.commit()
+        seconds += time.perf_counter() - started
+    return raw_bytes, seconds
+
+def sqlite_file_size():
+    url = database.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return sum(os.path.getsize(path) for path in (url.database, url.database + '-wal') if os.path.exists(path))
+
+
+def bench_checkpoint(params, workdir):
+    # Per-page checkpoint cost as the crawl grows: appending only what changed since the
+    # last flush should stay flat, where the old full pickle rewrite grew with the crawl
+    results = {}
+    for size in params['sizes']:
+        crawl_id = str(uuid4())
+        checkpoint = CrawlCheckpointer(crawl_id, interval_pages=params['interval_pages'], interval_seconds=1e9)
+        flush_times = []
+        started = time.perf_counter()
+        for i in range(size):
+            checkpoint.record_visited(url(i))
+            for k in range(params['links_per_page']):
+                checkpoint.record_pending(url(size * (k + 1) + i), 1)
+            if checkpoint.pages_since_flush >= checkpoint.interval_pages:
+                flush_started = time.perf_counter()
+                checkpoint.flush(i + 1)
+                flush_times.append(time.perf_counter() - flush_started)
+        checkpoint.flush(size)
+        elapsed = time.perf_counter() - started
+
+        tenth = max(1, len(flush_times) // 10)
+        first, last = flush_times[:tenth], flush_times[-tenth:]
+        frontier, backlog = UrlFrontier(), SpillQueue()
+        replay_started = time.perf_counter()
+        checkpoint.replay(frontier, backlog)
+        replay_seconds = time.perf_counter() - replay_started
+
+        # One save of the replaced approach at this size: pickling the whole visited set
+        visited = {url(i) for i in range(size)}
+        legacy_started = time.perf_counter()
+        pickle.dumps(visited)
+        legacy_seconds = time.perf_counter() - legacy_started
+        del visited
+
+        results[str(size)] = {
+            "pages_per_second": rate(size, elapsed),
+            "per_page_us": round(elapsed / size * 1e6, 2),
+            "flush_ms": latency_summary(flush_times),
+            "first_tenth_flush_ms": round(sum(first) / len(first) * 1000, 3) if first else None,
+            "last_tenth_flush_ms": round(sum(last) / len(last) * 1000, 3) if last else None,
+            "replay_seconds": round(replay_seconds, 3),
+            "replay_urls_per_second": rate(size * (1 + params['links_per_page']), replay_seconds),
+            "legacy_pickle_save_ms": round(legacy_seconds * 1000, 3),
+        }
+    return {"sizes": results}
+
+
+def bench_frontier(params, workdir):
+    # Links/sec of frontier dedup against frontier size, exact fingerprints and Bloom mode,
+    # next to the list scan UrlSpider used to do
+    results = {}
+    probe = params['probe_links']
+    for size in params['sizes']:
+        for mode in ('fingerprints', 'bloom'):
+            before = current_rss_mb()
+            frontier = UrlFrontier(bloom_capacity=(size + probe) * 2 if mode == 'bloom' else 0)
+            started = time.perf_counter()
+            for i in range(size):
+                frontier.add(url(i))
+            fill_seconds = time.perf_counter() - started
+            after = current_rss_mb()
+            # Half the probe links are already known, half new
+            links = [url(i) for i in range(size - probe // 2, size + probe // 2)]
+            started = time.perf_counter()
+            for link in links:
+                frontier.add(link)
+            probe_seconds = time.perf_counter() - started
+            results[f"{size}/{mode}"] = {
+                "fill_links_per_second": rate(size, fill_seconds),
+                "links_per_second": rate(len(links), probe_seconds),
+                "rss_growth_mb": round(after - before, 1) if before is not None else None,
+            }
+            del frontier
+        if size <= params['legacy_max_size']:
+            pending = [url(i) for i in range(size)]
+            lookups = [url(size + i) for i in range(params['legacy_lookups'])]
+            started = time.perf_counter()
+            sum(link in pending for link in lookups)
+            results[f"{size}/legacy_list"] = {"links_per_second": rate(len(lookups), time.perf_counter() - started)}
+            del pending
+    return {"sizes": results}
+
+
+def bench_pipeline(params, workdir):
+    # DB writer throughput: WebScraperPipeline batches (inserts of discovered URLs, then
+    # content updates) at several batch sizes, against one commit per row
+    site = SyntheticSite(pages=params['rows'], page_size=params['page_size'])
+    extractor = PageTextExtractor()
+    stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+    results = {}
+    for batch_size in params['batch_sizes']:
+        crawl_id = str(uuid4())
+        pipeline = WebScraperPipeline(stats, batch_size=batch_size)
+        pipeline.spider = SimpleNamespace(logger=logging.getLogger("benchmarks"))
+        insert_seconds = 0.0
+        for start in range(0, params['rows'], batch_size):
+            rows = [{'website_url': f"{BASE_URL}/{crawl_id}/{i}", 'status': False, 'crawl_id': crawl_id,
+                     'lastmod': None, 'created_at': datetime.now()}
+                    for i in range(start, min(start + batch_size, params['rows']))]
+            started = time.perf_counter()
+            pipeline.write_batch(rows, [], [], [])
+            insert_seconds += time.perf_counter() - started
+
+        db = database.SessionLocal()
+        ids = db.scalars(select(WebsiteData.id).where(WebsiteData.crawl_id == crawl_id).order_by(WebsiteData.id)).all()
+        db.close()
+        update_seconds = 0.0
+        for start in range(0, len(ids), batch_size):
+            rows = []
+            for page, id in enumerate(ids[start:start + batch_size], start):
+                row = page_row(site, page, extractor, crawl_id)
+                rows.append({'id': id, **{key: row[key] for key in cruds.PAGE_CONTENT_FIELDS}})
+            started = time.perf_counter()
+            pipeline.write_batch([], [], rows, [])
+            update_seconds += time.perf_counter() - started
+        results[str(batch_size)] = {
+            "inserts_per_second": rate(params['rows'], insert_seconds),
+            "updates_per_second": rate(len(ids), update_seconds),
+        }
+
+    # The replaced path: a query, commit and refresh per row
+    crawl_id = str(uuid4())
+    db = database.SessionLocal()
+    started = time.perf_counter()
+    created = [cruds.create_website_data(db, WebsiteDataCreate(website_url=f"{BASE_URL}/{crawl_id}/{i}"))
+               for i in range(params['legacy_rows'])]
+    insert_seconds = time.perf_counter() - started
+    contents = [page_row(site, page, extractor, crawl_id) for page in range(len(created))]
+    started = time.perf_counter()
+    for row, content in zip(created, contents):
+        cruds.update_website_data(db, row.id, content['title'], content['text'], content['html'], True)
+    update_seconds = time.perf_counter() - started
+    db.close()
+    results["legacy_per_row"] = {
+        "inserts_per_second": rate(len(created), insert_seconds),
+        "updates_per_second": rate(len(created), update_seconds),
+    }
+    return {"dialect": database.engine.dialect.name, "batch_sizes": results,
+            "failed_rows": stats.get_value('db_writer/failed_rows', 0)}
+
+
+def bench_extraction(params, workdir):
+    # MB/s and memory of the streaming extractor over a corpus of large saved pages, then of
+    # the selector-based extraction it replaced (which also kept every result in memory)
+    site = SyntheticSite(pages=params['pages'], page_size=params['page_size'])
+    corpus = os.path.join(workdir, "corpus")
+    os.makedirs(corpus, exist_ok=True)
+    paths = []
+    for page in range(params['pages']):
+        path = os.path.join(corpus, f"{page}.html")
+        with open(path, "wb") as f:
+            f.write(site.render(page, BASE_URL))
+        paths.append(path)
+
+    def run(extract):
+        total, seconds, base, peak = 0, 0.0, current_rss_mb(), current_rss_mb()
+        for path in paths:
+            with open(path, "rb") as f:
+                body = f.read()
+            started = time.perf_counter()
+            extract(body)
+            seconds += time.perf_counter() - started
+            total += len(body)
+            peak = max(peak or 0, current_rss_mb() or 0)
+        return {
+            "mb_per_second": rate(total / 2 ** 20, seconds),
+            "pages_per_second": rate(len(paths), seconds),
+            "rss_growth_mb": round(peak - base, 1) if base is not None else None,
+        }
+
+    extractor = PageTextExtractor(max_text_chars=params['max_text_chars'], max_html_bytes=params['max_html_bytes'])
+    streaming = run(extractor.extract)
+    results = []
+
+    def legacy(body):
+        response = HtmlResponse(BASE_URL, body=body, encoding='utf-8')
+        text = ' '.join(response.css('body *::text').getall())
+        results.append((response.css('title::text').get(), text, response.text))
+
+    return {"corpus_mb": round(sum(os.path.getsize(path) for path in paths) / 2 ** 20, 1),
+            "streaming": streaming, "legacy_selector": run(legacy)}
+
+
+def bench_content_store(params, workdir):
+    # Storage ratio (compression and dedup of identical bodies) and read/write cost of the
+    # content store on pages sharing boilerplate, with some exact duplicates
+    site = SyntheticSite(pages=params['pages'], page_size=params['page_size'], duplicate_rate=params['duplicate_rate'])
+    crawl_id = str(uuid4())
+    db = database.SessionLocal()
+    size_before = sqlite_file_size()
+    raw_bytes, write_seconds = seed_pages(db, site, crawl_id, params['pages'])
+    stats = content_store.get_content_store_stats(db)
+
+    started = time.perf_counter()
+    rows = sum(len(chunk) for chunk in cruds.iter_crawl_results(db, crawl_id, False, ['html', 'text']))
+    bulk_read_seconds = time.perf_counter() - started
+
+    ids = db.scalars(select(WebsiteData.id).where(WebsiteData.crawl_id == crawl_id)).all()
+    read_times = []
+    for id in random.Random(1).sample(ids, min(len(ids), params['single_reads'])):
+        started = time.perf_counter()
+        cruds.get_website_data_by_id(db, id)
+        read_times.append(time.perf_counter() - started)
+    db.close()
+    size_after = sqlite_file_size()
+    return {
+        "codec": content_store.CONTENT_STORE_CODEC,
+        "raw_mb": round(raw_bytes / 2 ** 20, 2),
+        "stored_mb": round(stats['stored_bytes'] / 2 ** 20, 2),
+        "storage_ratio": round(raw_bytes / stats['stored_bytes'], 2) if stats['stored_bytes'] else None,
+        "compression_ratio": round(stats['compression_ratio'], 2) if stats['compression_ratio'] else None,
+        "dedup_ratio": round(stats['dedup_ratio'], 3) if stats['dedup_ratio'] else None,
+        "database_growth_mb": round((size_after - size_before) / 2 ** 20, 2) if size_before is not None else None,
+        "write_mb_per_second": rate(raw_bytes / 2 ** 20, write_seconds),
+        "bulk_read_rows_per_second": rate(rows, bulk_read_seconds),
+        "bulk_read_mb_per_second": rate(raw_bytes / 2 ** 20, bulk_read_seconds),
+        "single_row_read_ms": latency_summary(read_times),
+    }
+
+
+def bench_results_query(params, workdir):
+    # Keyset page latency of a crawl's results (as /crawl-results/ reads them) with
+    # params['rows'] rows in the table spread over several crawls, at the start, middle
+    # and end of the crawl
+    crawl_ids = [str(uuid4()) for _ in range(params['crawls'])]
+    db = database.SessionLocal()
+    started = time.perf_counter()
+    for start in range(0, params['rows'], 10_000):
+        cruds.bulk_create_website_data(db, [
+            {'website_url': f"{BASE_URL}/{i}", 'title': f"Page {i}", 'status': False,
+             'crawl_id': crawl_ids[i % len(crawl_ids)], 'created_at': datetime.now()}
+            for i in range(start, min(start + 10_000, params['rows']))
+        ])
+        db.commit()
+    seed_seconds = time.perf_counter() - started
+
+    crawl_id = crawl_ids[0]
+    ids = db.scalars(select(WebsiteData.id).where(WebsiteData.crawl_id == crawl_id).order_by(WebsiteData.id)).all()
+    fields = ['id', 'website_url', 'title', 'status', 'created_at']
+    positions = {"start": 0, "middle": ids[len(ids) // 2], "end": ids[max(0, len(ids) - params['limit'] - 1)]}
+    pages = {}
+    for name, after_id in positions.items():
+        times = []
+        for _ in range(params['samples']):
+            started = time.perf_counter()
+            db.execute(cruds.crawl_results_query(crawl_id, False, fields, after_id).limit(params['limit'])).all()
+            times.append(time.perf_counter() - started)
+        pages[name] = latency_summary(times)
+
+    started = time.perf_counter()
+    streamed = sum(len(chunk) for chunk in cruds.iter_crawl_results(db, crawl_id, False, fields))
+    stream_seconds = time.perf_counter() - started
+    total = db.scalar(select(func.count(WebsiteData.id)))
+    db.close()
+    return {
+        "table_rows": total,
+        "crawl_rows": len(ids),
+        "seed_rows_per_second": rate(params['rows'], seed_seconds),
+        "page_ms": pages,
+        "stream_rows_per_second": rate(streamed, stream_seconds),
+    }
+
+
+def bench_export(params, workdir):
+    # Export throughput per format, and memory growth while exporting
+    site = SyntheticSite(pages=params['rows'], page_size=params['page_size'])
+    crawl_id = str(uuid4())
+    db = database.SessionLocal()
+    raw_bytes, _ = seed_pages(db, site, crawl_id, params['rows'])
+    results = {}
+    for format in params['formats']:
+        if format == 'parquet' and export.pyarrow is None:
+            results[format] = {"skipped": "pyarrow is not installed"}
+            continue
+        stats = {}
+        base = peak = current_rss_mb()
+        path = os.path.join(workdir, f"export.{export.EXPORT_FORMATS[format][0]}")
+        started = time.perf_counter()
+        with open(path, "wb") as f:
+            for data in export.export_crawl(db, crawl_id, False, format, stats=stats):
+                f.write(data)
+                peak = max(peak or 0, current_rss_mb() or 0)
+        seconds = time.perf_counter() - started
+        results[format] = {
+            "rows_per_second": rate(stats['rows'], seconds),
+            "output_mb_per_second": rate(stats['bytes'] / 2 ** 20, seconds),
+            "input_mb_per_second": rate(raw_bytes / 2 ** 20, seconds),
+            "output_mb": round(stats['bytes'] / 2 ** 20, 2),
+            "rss_growth_mb": round(peak - base, 1) if base is not None else None,
+        }
+    db.close()
+    return {"rows": params['rows'], "raw_mb": round(raw_bytes / 2 ** 20, 2), "formats": results}
+
+
+def bench_search(params, workdir):
+    # Full-text index build throughput (incremental, as pages are written, and a full
+    # rebuild) and ranked query latency on a corpus of params['pages'] pages
+    site = SyntheticSite(pages=params['pages'], page_size=params['page_size'])
+    crawl_id = str(uuid4())
+    db = database.SessionLocal()
+    dialect = db.get_bind().dialect.name
+    _, write_seconds = seed_pages(db, site, crawl_id, params['pages'], batch_size=1000)
+
+    started = time.perf_counter()
+    indexed = search_index.rebuild_index(db)
+    rebuild_seconds = time.perf_counter() - started
+
+    rng = random.Random(1)
+    content_words = [word for word in WORDS if len(word) > 3]
+    queries = [" ".join(rng.sample(content_words, rng.choice((1, 2, 3)))) for _ in range(params['queries'])]
+    times, scoped_times, hits = [], [], 0
+    for query in queries:
+        started = time.perf_counter()
+        hits += len(db.execute(search_index.search_statement(dialect, query, limit=20)).all())
+        times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        db.execute(search_index.search_statement(dialect, query, crawl_id=crawl_id, limit=20)).all()
+        scoped_times.append(time.perf_counter() - started)
+    db.close()
+    return {
+        "pages": params['pages'],
+        "write_and_index_rows_per_second": rate(params['pages'], write_seconds),
+        "rebuild_rows_per_second": rate(indexed, rebuild_seconds),
+        "query_ms": latency_summary(times),
+        "crawl_scoped_query_ms": latency_summary(scoped_times),
+        "mean_results": round(hits / len(queries), 1),
+    }
+
+
+def bench_simhash(params, workdir):
+    # SimHash signatures/sec on page texts, then LSH index inserts and lookup latency with
+    # params['signatures'] pages indexed
+    site = SyntheticSite(pages=params['texts'], page_size=params['page_size'])
+    extractor = PageTextExtractor()
+    texts = [extractor.extract(site.render(page, BASE_URL))[1] for page in range(params['texts'])]
+    started = time.perf_counter()
+    for text in texts:
+        simhash(text)
+    signature_seconds = time.perf_counter() - started
+
+    rng = random.Random(1)
+    index = NearDuplicateIndex(params['max_distance'])
+    signatures = [rng.getrandbits(64) for _ in range(params['signatures'])]
+    base = current_rss_mb()
+    started = time.perf_counter()
+    for i, signature in enumerate(signatures):
+        index.add(signature, i)
+    insert_seconds = time.perf_counter() - started
+    growth = current_rss_mb()
+
+    near_times, random_times, found = [], [], 0
+    for _ in range(params['lookups']):
+        signature = signatures[rng.randrange(len(signatures))]
+        for bit in rng.sample(range(64), rng.randint(1, params['max_distance'])):
+            signature ^= 1 << bit
+        started = time.perf_counter()
+        found += index.find(signature) is not None
+        near_times.append(time.perf_counter() - started)
+        query = rng.getrandbits(64)
+        started = time.perf_counter()
+        index.find(query)
+        random_times.append(time.perf_counter() - started)
+    def to_us(values):
+        return {key: round(value * 1e6, 2) for key, value in percentiles(values).items()}
+
+    return {
+        "signatures_per_second": rate(len(texts), signature_seconds),
+        "text_mb_per_second": rate(sum(len(text) for text in texts) / 2 ** 20, signature_seconds),
+        "index_size": len(index),
+        "inserts_per_second": rate(len(signatures), insert_seconds),
+        "index_rss_mb": round(growth - base, 1) if base is not None else None,
+        "near_lookup_us": to_us(near_times),
+        "random_lookup_us": to_us(random_times),
+        "near_recall": round(found / params['lookups'], 4),
+    }
+
+
+def bench_sitemap_parse(params, workdir):
+    # Streaming parse of one gzipped sitemap with params['entries'] entries: entries/sec and
+    # memory growth beyond the compressed body
+    path = os.path.join(workdir, "sitemap.xml.gz")
+    with gzip.open(path, "wb", compresslevel=5) as f:
+        for chunk in iter_sitemap_xml((url(i), "2024-01-01") for i in range(params['entries'])):
+            f.write(chunk)
+    with open(path, "rb") as f:
+        body = f.read()
+    base = peak = current_rss_mb()
+    count = 0
+    started = time.perf_counter()
+    for kind, loc, lastmod in iter_sitemap(body):
+        count += 1
+        if not count % 50_000:
+            peak = max(peak or 0, current_rss_mb() or 0)
+    seconds = time.perf_counter() - started
+    return {
+        "entries": count,
+        "compressed_mb": round(len(body) / 2 ** 20, 2),
+        "entries_per_second": rate(count, seconds),
+        "rss_growth_mb": round(peak - base, 1) if base is not None else None,
+    }
@@ -0,0 +1,342 @@
+# crawler_backend/benchmarks/runner.py
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.harness import BACKEND_DIR, ChildProcess, benchmark_env
+
+# Benchmark suite runner. Every benchmark runs in a fresh process with its own work
+# directory and (unless --database-url is given) its own SQLite database, so runs are
+# independent and wait4 gives each one's peak RSS and CPU time. Results are saved as JSON
+# and two result files can be compared.
+#
+#   python -m benchmarks list
+#   python -m benchmarks run [NAME|GROUP ...] [--scale small|full] [--set [NAME.]KEY=VALUE ...]
+#                            [--database-url URL] [--output FILE] [--keep-workdir]
+#   python -m benchmarks compare OLD.json NEW.json
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+
+def site(pages, **options):
+    return {"pages": pages, "fan_out": 10, "page_size": 8192, **options}
+
+# name -> (group, "module:function", {scale: params})
+BENCHMARKS = {
+    # Components
+    "checkpoint": ("micro", "benchmarks.micro:bench_checkpoint", {
+        "small": {"sizes": [10_000], "interval_pages": 100, "links_per_page": 5},
+        "full": {"sizes": [10_000, 100_000, 1_000_000], "interval_pages": 100, "links_per_page": 5},
+    }),
+    "frontier": ("micro", "benchmarks.micro:bench_frontier", {
+        "small": {"sizes": [10_000, 100_000], "probe_links": 10_000, "legacy_max_size": 100_000, "legacy_lookups": 200},
+        "full": {"sizes": [10_000, 100_000, 1_000_000, 10_000_000], "probe_links": 100_000,
+                 "legacy_max_size": 100_000, "legacy_lookups": 1000},
+    }),
+    "pipeline": ("micro", "benchmarks.micro:bench_pipeline", {
+        "small": {"rows": 5000, "page_size": 8192, "batch_sizes": [1, 50, 500], "legacy_rows": 200},
+        "full": {"rows": 50_000, "page_size": 8192, "batch_sizes": [1, 10, 50, 200, 1000], "legacy_rows": 2000},
+    }),
+    "extraction": ("micro", "benchmarks.micro:bench_extraction", {
+        "small": {"pages": 50, "page_size": 200_000, "max_text_chars": 200_000, "max_html_bytes": 2_000_000},
+        "full": {"pages": 200, "page_size": 2_000_000, "max_text_chars": 200_000, "max_html_bytes": 2_000_000},
+    }),
+    "content_store": ("micro", "benchmarks.micro:bench_content_store", {
+        "small": {"pages": 2000, "page_size": 16_384, "duplicate_rate": 0.1, "single_reads": 200},
+        "full": {"pages": 50_000, "page_size": 16_384, "duplicate_rate": 0.1, "single_reads": 2000},
+    }),
+    "results_query": ("micro", "benchmarks.micro:bench_results_query", {
+        "small": {"rows": 100_000, "crawls": 10, "limit": 1000, "samples": 20},
+        "full": {"rows": 1_000_000, "crawls": 10, "limit": 1000, "samples": 50},
+    }),
+    "export": ("micro", "benchmarks.micro:bench_export", {
+        "small": {"rows": 2000, "page_size": 16_384, "formats": ["jsonl", "parquet", "warc"]},
+        "full": {"rows": 50_000, "page_size": 16_384, "formats": ["jsonl", "parquet", "warc"]},
+    }),
+    "search": ("micro", "benchmarks.micro:bench_search", {
+        "small": {"pages": 5000, "page_size": 8192, "queries": 200},
+        "full": {"pages": 100_000, "page_size": 8192, "queries": 1000},
+    }),
+    "simhash": ("micro", "benchmarks.micro:bench_simhash", {
+        "small": {"texts": 1000, "page_size": 16_384, "signatures": 100_000, "max_distance": 3, "lookups": 1000},
+        "full": {"texts": 10_000, "page_size": 16_384, "signatures": 1_000_000, "max_distance": 3, "lookups": 10_000},
+    }),
+    "sitemap_parse": ("micro", "benchmarks.micro:bench_sitemap_parse", {
+        "small": {"entries": 200_000},
+        "full": {"entries": 5_000_000},
+    }),
+    # Crawls through run_crawler.py
+    "url_spider": ("crawl", "benchmarks.crawl:bench_url_spider", {
+        "small": {"site": site(500, latency_ms=5, jitter_ms=10, duplicate_variants=4), "concurrent_requests": 16},
+        "full": {"site": site(20_000, latency_ms=5, jitter_ms=10, duplicate_variants=4, error_rate=0.01),
+                 "concurrent_requests": 32},
+    }),
+    "content_spider": ("crawl", "benchmarks.crawl:bench_content_spider", {
+        "small": {"site": site(500, latency_ms=5, jitter_ms=10), "concurrent_requests": 16},
+        "full": {"site": site(20_000, latency_ms=5, jitter_ms=10, error_rate=0.01), "concurrent_requests": 32},
+    }),
+    "single_pass": ("crawl", "benchmarks.crawl:bench_single_pass", {
+        "small": {"site": site(300, latency_ms=5), "concurrent_requests": 16},
+        "full": {"site": site(5000, latency_ms=5), "concurrent_requests": 16},
+    }),
+    "max_links": ("crawl", "benchmarks.crawl:bench_max_links", {
+        "small": {"site": site(5000, fan_out=20, latency_ms=20), "budgets": [5, 50, 200], "concurrent_requests": 16},
+        "full": {"site": site(5000, fan_out=20, latency_ms=20), "budgets": [5, 50, 200, 1000], "concurrent_requests": 32},
+    }),
+    "conditional_recrawl": ("crawl", "benchmarks.crawl:bench_conditional_recrawl", {
+        "small": {"site": site(300), "change_share": 0.1, "concurrent_requests": 16},
+        "full": {"site": site(5000), "change_share": 0.1, "concurrent_requests": 16},
+    }),
+    "shared_cache": ("crawl", "benchmarks.crawl:bench_shared_cache", {
+        "small": {"site": site(100, robots_latency_ms=500), "runs": 3, "max_links": 5, "concurrent_requests": 4},
+        "full": {"site": site(100, robots_latency_ms=500), "runs": 5, "max_links": 5, "concurrent_requests": 4},
+    }),
+    "pause_resume": ("crawl", "benchmarks.crawl:bench_pause_resume", {
+        "small": {"site": site(400, latency_ms=20), "pause_at": [0.3, 0.6], "concurrent_requests": 8},
+        "full": {"site": site(3000, latency_ms=20), "pause_at": [0.2, 0.4, 0.6, 0.8], "concurrent_requests": 16},
+    }),
+    "distributed": ("crawl", "benchmarks.crawl:bench_distributed", {
+        "small": {"site": site(600, latency_ms=10), "workers": [1, 2], "concurrent_requests": 8},
+        "full": {"site": site(10_000, latency_ms=10), "workers": [1, 2, 4], "concurrent_requests": 16},
+    }),
+    "sitemap_crawl": ("crawl", "benchmarks.crawl:bench_sitemap_crawl", {
+        "small": {"site": site(20_000, sitemap_chunk=10_000), "concurrent_requests": 16},
+        "full": {"site": site(1_000_000, sitemap_chunk=50_000), "concurrent_requests": 16},
+    }),
+    # The API served by uvicorn
+    "api_crawl": ("api", "benchmarks.api:bench_api_crawl", {
+        "small": {"site": site(200, latency_ms=5), "pool_workers": 2, "concurrent_requests": 16, "timeout": 600},
+        "full": {"site": site(5000, latency_ms=5), "pool_workers": 2, "concurrent_requests": 16, "timeout": 3600},
+    }),
+    "api_latency": ("api", "benchmarks.api:bench_api_latency", {
+        "small": {"pages": 2000, "page_size": 8192, "results_limit": 100, "clients": 8, "duration": 5,
+                  "pool_workers": 1},
+        "full": {"pages": 100_000, "page_size": 8192, "results_limit": 100, "clients": 32, "duration": 15,
+                 "pool_workers": 1},
+    }),
+    "worker_pool": ("api", "benchmarks.api:bench_worker_pool", {
+        "small": {"site": site(300, latency_ms=5), "crawls": 10, "max_links": 5, "timeout": 900,
+                  "modes": {"subprocess": {"CRAWLER_POOL_WORKERS": 0}, "pool": {"CRAWLER_POOL_WORKERS": 2}}},
+        "full": {"site": site(300, latency_ms=5), "crawls": 100, "max_links": 5, "timeout": 1800,
+                 "modes": {"subprocess": {"CRAWLER_POOL_WORKERS": 0}, "pool": {"CRAWLER_POOL_WORKERS": 2}}},
+    }),
+    "bulk_ingest": ("api", "benchmarks.api:bench_bulk_ingest", {
+        "small": {"site": site(1000, latency_ms=5), "lines": 100_000, "crawl_seconds": 10},
+        "full": {"site": site(1000, latency_ms=5), "lines": 1_000_000, "crawl_seconds": 30},
+    }),
+}
+
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def apply_overrides(name, params, overrides):
+    # --set KEY=VALUE applies to every selected benchmark that has KEY, NAME.KEY to one of
+    # them; nested keys are dotted (site.pages=5000). Values are JSON, else strings.
+    for override in overrides:
+        key, _, value = override.partition("=")
+        path = key.split(".")
+        if path[0] in BENCHMARKS:
+            if path[0] != name:
+                continue
+            path = path[1:]
+        elif path[0] not in params:
+            continue
+        target = params
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        target[path[-1]] = parse_value(value)
+    return params
+
+def select_benchmarks(names):
+    if not names:
+        return list(BENCHMARKS)
+    selected = []
+    for name in names:
+        matches = [bench for bench, (group, _, _) in BENCHMARKS.items() if name in (bench, group)]
+        if not matches:
+            raise SystemExit(f"Unknown benchmark or group {name!r}, see `python -m benchmarks list`")
+        selected += [match for match in matches if match not in selected]
+    return selected
+
+def git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def suite_metadata(args):
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git("rev-parse", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "scale": args.scale,
+        "database": (args.database_url or "sqlite").split("://", 1)[0],
+        "overrides": args.set,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_one(args):
+    # Child process: run one benchmark and write its metrics to --output
+    from app import database
+    database.create_tables()
+    module_name, function_name = BENCHMARKS[args.name][1].split(":")
+    function = getattr(importlib.import_module(module_name), function_name)
+    metrics = function(json.loads(args.params), args.workdir)
+    with open(args.output, "w") as f:
+        json.dump(metrics, f, indent=2, default=str)
+
+def run_benchmark(name, params, root, args):
+    workdir = os.path.join(root, name)
+    os.makedirs(workdir, exist_ok=True)
+    output = os.path.join(workdir, "metrics.json")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    child = ChildProcess(
+        [sys.executable, "-m", "benchmarks.runner", "run-one", name, "--params", json.dumps(params),
+         "--workdir", workdir, "--output", output],
+        benchmark_env(workdir, DATABASE_URL=database_url), BACKEND_DIR, os.path.join(workdir, "benchmark.log"),
+    )
+    process = child.finish(args.timeout)
+    result = {"group": BENCHMARKS[name][0], "params": params, "metrics": None, "error": None,
+              "process": {key: process[key] for key in ("wall_seconds", "cpu_seconds", "peak_rss_mb")}}
+    if process["returncode"] == 0 and os.path.exists(output):
+        with open(output) as f:
+            result["metrics"] = json.load(f)
+    else:
+        reason = "timed out" if process["timed_out"] else f"exited with {process['returncode']}"
+        result["error"] = f"{reason}: " + "\n".join(child.output().strip().splitlines()[-20:])
+    return result
+
+def run(args):
+    names = select_benchmarks(args.benchmarks)
+    suite = {"suite": suite_metadata(args), "benchmarks": {}}
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{(suite['suite']['commit'] or 'nogit')[:8]}.json")
+    root = args.workdir or tempfile.mkdtemp(prefix="crawler-bench-")
+    started = time.monotonic()
+    try:
+        for name in names:
+            group, _, scales = BENCHMARKS[name]
+            params = apply_overrides(name, json.loads(json.dumps(scales[args.scale])), args.set)
+            print(f"{name} ({group}) ...", end=" ", flush=True, file=sys.stderr)
+            result = run_benchmark(name, params, root, args)
+            suite["benchmarks"][name] = result
+            process = result["process"]
+            print(f"{'failed' if result['error'] else 'ok'} in {process['wall_seconds']:.1f}s, "
+                  f"peak RSS {process['peak_rss_mb']} MB", file=sys.stderr)
+            if result["error"]:
+                print(result["error"], file=sys.stderr)
+    finally:
+        suite["suite"]["seconds"] = round(time.monotonic() - started, 1)
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(suite, f, indent=2, default=str)
+        if not args.keep_workdir and not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+    print(f"Results written to {output}", file=sys.stderr)
+    return 1 if any(result["error"] for result in suite["benchmarks"].values()) else 0
+
+
+def flatten(value, prefix=""):
+    # Numeric leaves of a metrics dict as {"a/b/c": number}
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f"{prefix}/{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"old: {old['suite'].get('commit')} ({old['suite'].get('scale')}, {old['suite'].get('started_at')})")
+    print(f"new: {new['suite'].get('commit')} ({new['suite'].get('scale')}, {new['suite'].get('started_at')})")
+    for name, result in new["benchmarks"].items():
+        previous = old["benchmarks"].get(name)
+        if previous is None:
+            continue
+        before = flatten({"process": previous["process"], **(previous["metrics"] or {})})
+        after = flatten({"process": result["process"], **(result["metrics"] or {})})
+        rows = []
+        for key, value in after.items():
+            if key not in before:
+                continue
+            if value == before[key]:
+                change = 0.0
+            else:
+                change = (value - before[key]) / abs(before[key]) * 100 if before[key] else None
+            if change is not None and abs(change) < args.threshold:
+                continue
+            rows.append((key, before[key], value, "n/a" if change is None else f"{change:+.1f}%"))
+        if rows:
+            print(f"\n{name}")
+            width = max(len(key) for key, *_ in rows)
+            for key, before_value, value, change in rows:
+                print(f"  {key:<{width}}  {before_value:>14}  {value:>14}  {change:>8}")
+    return 0
+
+def list_benchmarks(args):
+    for name, (group, target, scales) in BENCHMARKS.items():
+        print(f"{name:<20} {group:<6} {target}")
+        print(f"{'':<27} {json.dumps(scales[args.scale])}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Crawler benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and save the results as JSON")
+    run_parser.add_argument("benchmarks", nargs="*", help="Benchmarks or groups (micro, crawl, api); default all")
+    run_parser.add_argument("--scale", choices=["small", "full"], default="small")
+    run_parser.add_argument("--set", action="append", default=[], metavar="[NAME.]KEY=VALUE",
+                            help="Override a parameter, e.g. site.pages=2000 or frontier.sizes=[1000]")
+    run_parser.add_argument("--database-url", help="Database shared by all benchmarks (default: SQLite per benchmark)")
+    run_parser.add_argument("--output", help=f"Results file (default: {os.path.relpath(RESULTS_DIR)}/<time>-<commit>.json)")
+    run_parser.add_argument("--workdir", help="Keep work directories (databases, logs) here")
+    run_parser.add_argument("--keep-workdir", action="store_true", help="Don't remove the temporary work directories")
+    run_parser.add_argument("--timeout", type=float, default=3600, help="Seconds per benchmark")
+    run_parser.set_defaults(handler=run)
+
+    list_parser = commands.add_parser("list", help="List the benchmarks and their parameters")
+    list_parser.add_argument("--scale", choices=["small", "full"], default="small")
+    list_parser.set_defaults(handler=list_benchmarks)
+
+    compare_parser = commands.add_parser("compare", help="Compare the metrics of two results files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.0, help="Hide changes under this many percent")
+    compare_parser.set_defaults(handler=compare)
+
+    run_one_parser = commands.add_parser("run-one")  # Internal: one benchmark in its own process
+    run_one_parser.add_argument("name", choices=list(BENCHMARKS))
+    run_one_parser.add_argument("--params", required=True)
+    run_one_parser.add_argument("--workdir", required=True)
+    run_one_parser.add_argument("--output", required=True)
+    run_one_parser.set_defaults(handler=run_one)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args) or 0)
+
+
+if __name__ == "__main__":
+    main()
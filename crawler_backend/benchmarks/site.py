@@ -0,0 +1,355 @@
+# crawler_backend/benchmarks/site.py
+
+import argparse
+import gzip
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Deterministic synthetic website for the benchmarks. Pages form a tree (page i links to
+# pages i*fan_out+1 ... i*fan_out+fan_out) so every page is reachable within log(pages)
+# levels; leaves link to pseudo-random pages instead. Everything about a page (text, links,
+# latency, errors, validators) is derived from its number and the seed, so two runs with
+# the same options serve exactly the same site.
+
+WORDS = (
+    "the of and to in is was for on that with as by at from his her an which be this are were had "
+    "crawler page index search archive report market energy water city river council school garden "
+    "music history science health travel winter summer harvest station bridge museum library harbor "
+    "forest mountain valley island desert coast village engine signal network storage memory latency "
+    "budget contract tenant domain server client request response header cookie session ticket order "
+    "product review rating price discount shipping invoice payment account profile message comment "
+    "article editor author chapter volume figure table diagram method result analysis evidence theory"
+).split()
+
+BASE_TIME = 1_700_000_000  # Last-Modified of revision 0 of every page
+
+
+def fraction(seed, *parts):
+    # Stable pseudo-random number in [0, 1) for a page property
+    digest = hashlib.blake2b(repr((seed,) + parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def iter_sitemap_xml(entries):
+    # A <urlset> sitemap of (loc, lastmod) entries as chunks of bytes
+    yield b'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    chunk = []
+    for loc, lastmod in entries:
+        chunk.append(f"<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>\n")
+        if len(chunk) >= 1000:
+            yield "".join(chunk).encode()
+            chunk = []
+    yield ("".join(chunk) + "</urlset>\n").encode()
+
+
+class SyntheticSite:
+    # The pages of the site. Options:
+    # pages, fan_out         size and shape of the link tree
+    # page_size              approximate bytes of HTML per page
+    # latency_ms, jitter_ms  response delay per page, base plus a stable per-page share of jitter
+    # robots_latency_ms      extra delay of robots.txt (what a shared robots cache saves)
+    # error_rate             share of pages answering error_status (never the home page)
+    # duplicate_variants     extra links per page to non-canonical variants of its links
+    #                        (fragments, tracking parameters, upper-case host)
+    # duplicate_rate         share of leaf pages serving the exact body of the page before them
+    # validators             send ETag/Last-Modified and answer conditional requests with 304
+    # sitemap                list every page in a sitemap index referenced from robots.txt
+
+    def __init__(self, pages=1000, fan_out=10, page_size=8192, latency_ms=0.0, jitter_ms=0.0,
+                 robots_latency_ms=0.0, error_rate=0.0, error_status=500, duplicate_variants=0,
+                 duplicate_rate=0.0, validators=True, sitemap=False, sitemap_chunk=50_000, seed=1):
+        self.pages = pages
+        self.fan_out = max(1, fan_out)
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.robots_latency_ms = robots_latency_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.duplicate_variants = duplicate_variants
+        self.duplicate_rate = duplicate_rate
+        self.validators = validators
+        self.sitemap = sitemap
+        self.sitemap_chunk = sitemap_chunk
+        self.seed = seed
+        self.revisions = {}  # page -> revision, for pages changed since the site was built
+        # Page text is cut from one pool of words, at an offset per page
+        rng = random.Random(seed)
+        self.text_pool = " ".join(rng.choice(WORDS) for _ in range(400_000))
+        self.sitemap_files = {}
+
+    def config(self):
+        return {key: value for key, value in vars(self).items()
+                if key not in ('revisions', 'text_pool', 'sitemap_files')}
+
+    def path(self, page):
+        return "/" if page == 0 else f"/p/{page}.html"
+
+    def page_number(self, path):
+        # Page of a path, or None; query strings and fragments are ignored like on most sites
+        if path == "/":
+            return 0
+        if path.startswith("/p/") and path.endswith(".html"):
+            try:
+                page = int(path[3:-5])
+            except ValueError:
+                return None
+            return page if 0 <= page < self.pages else None
+        return None
+
+    def links(self, page):
+        first_child = page * self.fan_out + 1
+        links = list(range(first_child, min(first_child + self.fan_out, self.pages)))
+        k = 0
+        while len(links) < self.fan_out and self.pages > 1:
+            links.append(int(fraction(self.seed, 'link', page, k) * self.pages))
+            k += 1
+        return links
+
+    def is_leaf(self, page):
+        return page * self.fan_out + 1 >= self.pages
+
+    def is_error(self, page):
+        return page > 0 and fraction(self.seed, 'error', page) < self.error_rate
+
+    def content_source(self, page):
+        # Duplicate leaves serve the body of the first page of their run of duplicates
+        while (page > 1 and self.is_leaf(page - 1)
+               and fraction(self.seed, 'duplicate', page) < self.duplicate_rate):
+            page -= 1
+        return page
+
+    def latency(self, page):
+        return (self.latency_ms + self.jitter_ms * fraction(self.seed, 'latency', page)) / 1000
+
+    def revision(self, page):
+        return self.revisions.get(self.content_source(page), 0)
+
+    def etag(self, page):
+        return f'"{self.content_source(page)}-{self.revision(page)}"'
+
+    def last_modified(self, page):
+        return formatdate(BASE_TIME + self.revision(page) * 86400, usegmt=True)
+
+    def change(self, share, round=1):
+        # Give a stable `share` of the pages a new revision (new text, validators and hash);
+        # returns the number of pages changed
+        changed = 0
+        for page in range(self.pages):
+            if fraction(self.seed, 'change', round, page) < share:
+                self.revisions[page] = self.revisions.get(page, 0) + 1
+                changed += 1
+        return changed
+
+    def render(self, page, base_url):
+        source = self.content_source(page)
+        revision = self.revisions.get(source, 0)
+        links = self.links(source)
+        nav = "".join(f'<li><a href="{self.path(link)}">Page {link}</a></li>' for link in links)
+        host = urlsplit(base_url).netloc
+        for k in range(self.duplicate_variants):
+            target = self.path(links[k % len(links)]) if links else "/"
+            variant = (
+                f"{target}#section-{k}",
+                f"{target}?utm_source=bench&utm_campaign={k}",
+                f"{target}?gclid={k}",
+                f"http://{host.upper()}{target}",
+            )[k % 4]
+            nav += f'<li><a href="{variant}">Variant {k}</a></li>'
+        head = (
+            f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Page {source} r{revision}</title>"
+            "<style>body{font-family:sans-serif}nav li{display:inline}</style>"
+            "<script>window.analytics=window.analytics||[];analytics.push(['page']);</script></head>"
+            "<body><header><h1>Synthetic benchmark site</h1><p>Shared boilerplate header text.</p></header>"
+            f"<nav><ul>{nav}</ul></nav><main><h2>Page {source}</h2><p>Revision {revision}.</p>"
+        )
+        tail = "</main><footer><p>Copyright notice and other shared footer text.</p></footer></body></html>"
+        text_size = max(0, self.page_size - len(head) - len(tail))
+        offset = int(fraction(self.seed, 'text', source, revision) * (len(self.text_pool) - 1))
+        text = self.text_pool[offset:offset + text_size]
+        while len(text) < text_size:  # Wrap around the pool
+            text += " " + self.text_pool[:text_size - len(text) - 1]
+        paragraphs = "".join(f"<p>{text[i:i + 600]}</p>" for i in range(0, len(text), 600))
+        return (head + paragraphs + tail).encode('utf-8')
+
+    def robots_txt(self, base_url):
+        lines = ["User-agent: *", "Allow: /"]
+        if self.sitemap:
+            lines.append(f"Sitemap: {base_url}/sitemap.xml")
+        return ("\n".join(lines) + "\n").encode()
+
+    def sitemap_index(self, base_url):
+        files = "".join(
+            f"<sitemap><loc>{base_url}/sitemaps/{n}.xml.gz</loc></sitemap>\n"
+            for n in range(-(-self.pages // self.sitemap_chunk))
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{files}</sitemapindex>\n'
+        ).encode()
+
+    def sitemap_file(self, n, base_url):
+        # Built once, then served from memory
+        if n not in self.sitemap_files:
+            pages = range(n * self.sitemap_chunk, min((n + 1) * self.sitemap_chunk, self.pages))
+            entries = ((f"{base_url}{self.path(page)}", "2024-01-01") for page in pages)
+            self.sitemap_files[n] = gzip.compress(b"".join(iter_sitemap_xml(entries)), compresslevel=5)
+        return self.sitemap_files[n]
+
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like real sites
+
+    def do_GET(self):
+        server = self.server
+        site = server.site
+        path = urlsplit(self.path).path
+        page = site.page_number(path)
+        headers = {}
+        if path == "/robots.txt":
+            time.sleep(site.robots_latency_ms / 1000)
+            status, body, kind = 200, site.robots_txt(server.base_url), 'robots'
+        elif path == "/sitemap.xml" and site.sitemap:
+            status, body, kind = 200, site.sitemap_index(server.base_url), 'sitemap'
+        elif path.startswith("/sitemaps/") and path.endswith(".xml.gz") and site.sitemap:
+            try:
+                status, body, kind = 200, site.sitemap_file(int(path[10:-7]), server.base_url), 'sitemap'
+            except ValueError:
+                status, body, kind = 404, b"Not found", 'other'
+        elif page is None:
+            status, body, kind = 404, b"Not found", 'other'
+        else:
+            kind = 'page'
+            time.sleep(site.latency(page))
+            if site.is_error(page):
+                status, body = site.error_status, b"Injected error"
+            else:
+                status, body = 200, b""
+                if site.validators:
+                    etag, last_modified = site.etag(page), site.last_modified(page)
+                    headers.update({'ETag': etag, 'Last-Modified': last_modified})
+                    if self.not_modified(etag, last_modified):
+                        status = 304
+                if status == 200:
+                    body = site.render(page, server.base_url)
+        server.record(kind, self.path, page, status, len(body))
+
+        self.send_response(status)
+        content_type = 'text/html; charset=utf-8' if kind != 'robots' else 'text/plain'
+        if kind == 'sitemap':
+            content_type = 'application/xml' if path.endswith('.xml') else 'application/gzip'
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SiteServer(ThreadingHTTPServer):
+    # Serves a SyntheticSite on localhost from a background thread and counts what was
+    # requested: requests per kind and status, bytes sent, fetches per page and the time of
+    # the first request of each kind
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, site, port=0, host='localhost'):
+        super().__init__((host, port), SiteRequestHandler)
+        self.site = site
+        self.base_url = f"http://{host}:{self.server_address[1]}"
+        self.lock = threading.Lock()
+        self.thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = Counter()  # kind -> requests
+            self.statuses = Counter()
+            self.page_fetches = Counter()  # page -> requests
+            self.bytes_sent = 0
+            self.first_request = {}  # kind -> time.time() of its first request
+            self.first_path_request = {}  # path with query -> time.time() of its first request
+
+    def record(self, kind, path, page, status, size):
+        with self.lock:
+            self.requests[kind] += 1
+            self.statuses[status] += 1
+            self.bytes_sent += size
+            self.first_request.setdefault(kind, time.time())
+            self.first_path_request.setdefault(path, time.time())
+            if page is not None:
+                self.page_fetches[page] += 1
+
+    def stats(self):
+        with self.lock:
+            fetched = self.page_fetches
+            return {
+                "requests": dict(self.requests),
+                "statuses": {str(status): count for status, count in self.statuses.items()},
+                "bytes_sent": self.bytes_sent,
+                "pages_fetched": len(fetched),
+                "pages_fetched_more_than_once": sum(1 for count in fetched.values() if count > 1),
+                "max_fetches_per_page": max(fetched.values(), default=0),
+            }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    # python -m benchmarks.site [--pages N] [--fan-out N] ... serves the site until interrupted
+    parser = argparse.ArgumentParser(description="Serve the synthetic benchmark site")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = SyntheticSite(pages=1).config()
+    for name, default in defaults.items():
+        option = "--" + name.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(option, type=lambda value: value.lower() in ("1", "true", "yes"), default=default)
+        else:
+            parser.add_argument(option, type=type(default), default=1000 if name == 'pages' else default)
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    server = SiteServer(SyntheticSite(**args), port=port)
+    print(f"Serving {args['pages']} pages at {server.base_url}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
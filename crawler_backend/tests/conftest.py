@@ -0,0 +1,30 @@
+# crawler_backend/tests/conftest.py
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The tests share one throwaway SQLite database. app.database reads DATABASE_URL when it is
+# imported, so it's set before anything from app is. Crawls run as run_crawler.py processes
+# (a Scrapy reactor can't be restarted in-process) and inherit it.
+WORKDIR = tempfile.mkdtemp(prefix='crawler-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.sqlite')}"
+os.environ.pop('ASYNC_DATABASE_URL', None)
+
+from app import database  # noqa: E402
+from benchmarks.harness import benchmark_env  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def tables():
+    database.create_tables()
+    yield
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def crawl_env(tmp_path):
+    # Environment of the crawler processes: the test database, crawler state under tmp_path
+    return benchmark_env(str(tmp_path), CRAWLER_LOG_LEVEL='INFO')
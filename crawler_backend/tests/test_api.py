@@ -0,0 +1,49 @@
+# crawler_backend/tests/test_api.py
+
+import json
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import cruds, database
+from app.models import ContentCrawlTarget, CrawlSession, WebsiteData
+from benchmarks.api import ApiServer
+from benchmarks.crawl import session_status
+from benchmarks.site import SiteServer, SyntheticSite
+
+
+def test_bulk_upload_canonicalizes_urls_and_commits_in_batches(tmp_path):
+    # One line per batch; the URL variant of a crawled row is matched to it instead of
+    # becoming a new row
+    site = SyntheticSite(pages=10, fan_out=3)
+    with SiteServer(site) as server, ApiServer(str(tmp_path), CRAWLER_POOL_WORKERS=0,
+                                               CONTENT_BULK_BATCH_SIZE=1) as api:
+        db = database.SessionLocal()
+        crawled_url = server.base_url + site.path(1)
+        cruds.bulk_create_website_data(db, [{'website_url': crawled_url, 'status': False, 'crawl_id': None,
+                                             'created_at': datetime.now()}])
+        db.commit()
+        crawled_id = db.scalar(select(WebsiteData.id).where(WebsiteData.website_url == crawled_url))
+        lines = [{"url": crawled_url + "?utm_source=feed#top"}, {"url": server.base_url + site.path(2)},
+                 {"id": crawled_id}]
+        status, body, _ = api.client.request("POST", "/crawl-content/bulk",
+                                             "".join(json.dumps(line) + "\n" for line in lines).encode())
+        assert status == 200, body
+        crawl_id = json.loads(body)['crawl_id']
+        api.wait_for_status(crawl_id, ("completed",), 120)
+
+        status, body, _ = api.client.request("POST", "/crawl-content/bulk", b'{"url": "http://a.test/"}\nnot json\n')
+        assert status == 400
+        failed_urls = db.scalars(select(WebsiteData.id).where(WebsiteData.website_url == "http://a.test/")).all()
+        pending_sessions = db.scalars(select(CrawlSession.crawl_id).where(CrawlSession.status == 'pending')).all()
+
+        targets = db.scalars(select(WebsiteData.website_url).join(
+            ContentCrawlTarget, ContentCrawlTarget.website_data_id == WebsiteData.id
+        ).where(ContentCrawlTarget.crawl_id == crawl_id)).all()
+        db.close()
+
+    assert sorted(targets) == [crawled_url, server.base_url + site.path(2)]
+    assert session_status(crawl_id) == 'completed'
+    # The first line of the failed upload was committed with its batch, and its session failed
+    assert len(failed_urls) == 1
+    assert pending_sessions == []
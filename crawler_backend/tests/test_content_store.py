@@ -0,0 +1,66 @@
+# crawler_backend/tests/test_content_store.py
+
+import hashlib
+import os
+import uuid
+
+from sqlalchemy import insert, select
+
+from app import content_store, database
+from app.models import ContentBlob
+
+
+def blob_refs(db, blob_id):
+    return db.scalar(select(ContentBlob.refs).where(ContentBlob.id == blob_id))
+
+def stored_files(directory):
+    return [name for _, _, names in os.walk(directory) for name in names]
+
+
+def test_blob_inserted_by_another_writer_gets_the_references(monkeypatch):
+    # The blob appears between the reference update and the lookup, as when a concurrent
+    # crawler commits it in that window on Postgres (SQLite writers can't overlap, so the
+    # row is inserted in this transaction, as the other writer would have)
+    content = f"shared page {uuid.uuid4()}"
+    raw = content.encode()
+    add_references = content_store.add_references
+
+    def add_references_then_insert(db, refs):
+        referenced = add_references(db, refs)
+        db.execute(insert(ContentBlob).values(
+            content_hash=hashlib.sha256(raw).hexdigest(), codec='none', size=len(raw), stored_size=len(raw),
+            data=raw, path=None, refs=1,
+        ))
+        return referenced
+
+    monkeypatch.setattr(content_store, 'add_references', add_references_then_insert)
+    db = database.SessionLocal()
+    blob_id, = content_store.store_contents(db, [content])
+    db.commit()
+    assert blob_refs(db, blob_id) == 2
+
+    content_store.release_contents(db, [blob_id])
+    db.commit()
+    assert blob_refs(db, blob_id) == 1
+    db.close()
+
+
+def test_offloaded_files_follow_the_transaction(monkeypatch, tmp_path):
+    monkeypatch.setattr(content_store, 'CONTENT_STORE_OFFLOAD_BYTES', 1)
+    monkeypatch.setattr(content_store, 'CONTENT_STORE_DIR', str(tmp_path))
+    db = database.SessionLocal()
+
+    content_store.store_contents(db, [f"rolled back {uuid.uuid4()}"])
+    assert len(stored_files(tmp_path)) == 1
+    db.rollback()
+    assert stored_files(tmp_path) == []
+
+    blob_id, = content_store.store_contents(db, [f"kept {uuid.uuid4()}"])
+    db.commit()
+    content_store.release_contents(db, [blob_id])
+    db.rollback()
+    assert len(stored_files(tmp_path)) == 1  # The blob wasn't deleted after all
+    content_store.release_contents(db, [blob_id])
+    db.commit()
+    assert stored_files(tmp_path) == []
+    db.close()
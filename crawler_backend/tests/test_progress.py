@@ -0,0 +1,35 @@
+# crawler_backend/tests/test_progress.py
+
+import time
+
+import scrapy
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+from app.web_scraper import progress
+from app.web_scraper.progress import CrawlProgressExtension
+
+
+def test_final_snapshot_is_written_after_a_pending_write(monkeypatch):
+    # Thread pool writes run inline here; the periodic write is held pending by hand
+    monkeypatch.setattr(progress.threads, 'deferToThread', defer.maybeDeferred)
+    crawler = get_crawler(scrapy.Spider)
+    spider = scrapy.Spider(name='progress')
+    extension = CrawlProgressExtension(crawler, 5)
+    extension.spider = spider
+    extension.started = extension.last_flush = time.monotonic()
+    written = []
+    extension.write = lambda snapshot: written.append('final')  # Only the final snapshot is written here
+
+    pending = defer.Deferred()
+    extension.writing = pending
+    closed = extension.spider_closed(spider, 'finished')
+    assert written == []
+    written.append('periodic')  # The pending write completes
+    pending.callback(None)
+    assert written == ['periodic', 'final']
+    assert closed.called
+
+    extension.writing = None
+    extension.spider_closed(spider, 'finished')
+    assert written[-1] == 'final'
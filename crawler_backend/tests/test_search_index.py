@@ -0,0 +1,35 @@
+# crawler_backend/tests/test_search_index.py
+
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+from app import cruds, database, search_index
+from app.models import WebsiteData
+
+
+def search(db, query):
+    return db.execute(search_index.search_statement('sqlite', query)).mappings().all()
+
+
+def test_reindexed_rows_only_match_their_new_text():
+    db = database.SessionLocal()
+    cruds.bulk_create_website_data(db, [{'website_url': 'https://example.com/reindexed', 'status': False,
+                                         'crawl_id': None, 'created_at': datetime.now()}])
+    id = db.scalar(select(WebsiteData.id).where(WebsiteData.website_url == 'https://example.com/reindexed'))
+    cruds.bulk_update_website_data(db, [{'id': id, 'title': 'First title', 'text': 'Oldword about a Café',
+                                         'html': '<p>Oldword</p>', 'status': True}])
+    db.commit()
+    assert [row['id'] for row in search(db, 'oldword')] == [id]
+
+    cruds.bulk_update_website_data(db, [{'id': id, 'title': 'Second title', 'text': 'Newword only',
+                                         'html': '<p>Newword</p>', 'status': True}])
+    db.commit()
+    assert search(db, 'oldword') == []
+    assert search(db, 'first') == []
+    assert [row['id'] for row in search(db, 'newword second')] == [id]
+    assert search_index.text_snippet('newword', 'Newword only') == '<b>Newword</b> only'
+
+    # Contentless: the index keeps no copy of the text
+    assert db.execute(text("SELECT text FROM website_data_fts WHERE rowid = :id"), {'id': id}).scalar() is None
+    db.close()
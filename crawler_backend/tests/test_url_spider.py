@@ -0,0 +1,98 @@
+# crawler_backend/tests/test_url_spider.py
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+from sqlalchemy import func, select
+
+from app import database
+from app.models import PageSignature, WebsiteData
+from benchmarks.crawl import crawl_rows, url_crawl
+from benchmarks.harness import run_crawler
+from benchmarks.site import SiteServer, SyntheticSite
+
+
+@pytest.mark.parametrize('max_links', [5, 50, 200])
+def test_max_links_saves_the_budget_and_fetches_no_more(crawl_env, tmp_path, max_links):
+    # 20 ms pages keep many requests in flight when the budget runs out; none of them may be
+    # fetched past the budget or saved as an extra row
+    site = SyntheticSite(pages=5000, fan_out=20, latency_ms=20)
+    with SiteServer(site) as server:
+        request_data = url_crawl(server, max_links, concurrent_requests=16)
+        result = run_crawler(request_data, crawl_env, str(tmp_path / 'crawl.log'))
+        site_stats = server.stats()
+
+    rows, urls = crawl_rows(request_data['crawl_id'])
+    assert result['stats']['finish_reason'] == 'max_links_reached'
+    assert rows == urls == max_links
+    assert site_stats['requests']['page'] == max_links
+
+
+def test_depth_limit_saves_the_pages_within_it(crawl_env, tmp_path):
+    # The site is a tree of fan_out links per page, so depth_limit=2 reaches the home page,
+    # its 5 children and their 25. Few requests in flight keep pages of one depth being
+    # scheduled from the responses of another.
+    site = SyntheticSite(pages=1000, fan_out=5)
+    with SiteServer(site) as server:
+        request_data = url_crawl(server, 1000, concurrent_requests=2, depth_limit=2)
+        result = run_crawler(request_data, crawl_env, str(tmp_path / 'crawl.log'))
+        site_stats = server.stats()
+
+    db = database.SessionLocal()
+    urls = db.scalars(select(WebsiteData.website_url).where(WebsiteData.crawl_id == request_data['crawl_id'])).all()
+    signatures = db.scalar(select(func.count(PageSignature.id)).where(PageSignature.crawl_id == request_data['crawl_id']))
+    db.close()
+    pages = {site.page_number(urlsplit(url).path) for url in urls}
+    assert result['stats']['finish_reason'] == 'finished'
+    assert len(urls) == site_stats['requests']['page'] == 1 + 5 + 25
+    assert pages == set(range(1 + 5 + 25))  # Depth 2 ends with page 5 * 5 + 5
+    # Without extract_content the page text isn't parsed for near-duplicate detection
+    assert signatures == 0
+
+
+class DownloadsHandler(BaseHTTPRequestHandler):
+    # "/" links to two binary downloads first, then to two pages
+    bodies = {
+        '/': (b'<a href="/feed1">1</a><a href="/feed2">2</a><a href="/a">a</a><a href="/b">b</a>', 'text/html'),
+        '/a': (b'<p>A</p>', 'text/html'),
+        '/b': (b'<p>B</p>', 'text/html'),
+        '/feed1': (bytes(range(256)), 'application/octet-stream'),
+        '/feed2': (bytes(range(256)), 'application/octet-stream'),
+    }
+
+    def do_GET(self):
+        self.server.fetched.append(self.path)
+        body, content_type = self.bodies.get(self.path, (b'Not found', 'text/plain'))
+        self.send_response(200 if self.path in self.bodies else 404)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_binary_responses_dont_stall_the_crawl(crawl_env, tmp_path):
+    # With one request at a time the downloads are the only requests in flight, and the
+    # pages behind them must still be crawled once they are answered
+    server = ThreadingHTTPServer(('localhost', 0), DownloadsHandler)
+    server.fetched = []
+    server.base_url = f"http://localhost:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        request_data = url_crawl(server, 100, concurrent_requests=1)
+        result = run_crawler(request_data, crawl_env, str(tmp_path / 'crawl.log'))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    db = database.SessionLocal()
+    urls = db.scalars(select(WebsiteData.website_url).where(WebsiteData.crawl_id == request_data['crawl_id'])).all()
+    db.close()
+    assert result['stats']['finish_reason'] == 'finished'
+    assert {urlsplit(url).path for url in urls} == {'/', '/a', '/b'}
+    assert sorted(path for path in server.fetched if path != '/robots.txt') == ['/', '/a', '/b', '/feed1', '/feed2']
+    assert result['stats']['url_spider/non_text_responses'] == 2